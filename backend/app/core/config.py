@@ -76,6 +76,342 @@ class EnvConfig:
         except ValueError:
             raise ValueError("REFRESH_TOKEN_EXPIRE_DAYS must be an integer")
 
+    @property
+    def OPENAI_BASE_URL(self) -> str:
+        self._ensure_loaded()
+        return os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+    @property
+    def OPENAI_MAX_CONNECTIONS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("OPENAI_MAX_CONNECTIONS", 100)
+
+    @property
+    def OPENAI_MAX_KEEPALIVE_CONNECTIONS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("OPENAI_MAX_KEEPALIVE_CONNECTIONS", 20)
+
+    @property
+    def OPENAI_KEEPALIVE_EXPIRY(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("OPENAI_KEEPALIVE_EXPIRY", 30.0)
+
+    @property
+    def OPENAI_TIMEOUT(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("OPENAI_TIMEOUT", 120.0)
+
+    @property
+    def OPENAI_STREAM(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("OPENAI_STREAM", True)
+
+    @property
+    def RESPONSE_CACHE_ENABLED(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("RESPONSE_CACHE_ENABLED", True)
+
+    @property
+    def RESPONSE_CACHE_DIR(self) -> Optional[str]:
+        self._ensure_loaded()
+        return os.getenv("RESPONSE_CACHE_DIR") or None
+
+    @property
+    def RESPONSE_CACHE_MEMORY_ENTRIES(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("RESPONSE_CACHE_MEMORY_ENTRIES", 256)
+
+    @property
+    def RESPONSE_CACHE_MAX_BYTES(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("RESPONSE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+
+    @property
+    def OPENAI_RPM(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("OPENAI_RPM", 500)
+
+    @property
+    def OPENAI_TPM(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("OPENAI_TPM", 30000)
+
+    @property
+    def OPENAI_MAX_RETRIES(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("OPENAI_MAX_RETRIES", 5)
+
+    @property
+    def OPENAI_BACKOFF_BASE(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("OPENAI_BACKOFF_BASE", 1.0)
+
+    @property
+    def OPENAI_BACKOFF_MAX(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("OPENAI_BACKOFF_MAX", 60.0)
+
+    @property
+    def OPENAI_IMAGE_DETAIL(self) -> str:
+        self._ensure_loaded()
+        detail = os.getenv("OPENAI_IMAGE_DETAIL") or "auto"
+        if detail not in ("auto", "low", "high"):
+            raise ValueError("OPENAI_IMAGE_DETAIL must be one of auto, low, high")
+        return detail
+
+    @property
+    def ENGINE_OUTPUT_MODE(self) -> str:
+        self._ensure_loaded()
+        mode = os.getenv("ENGINE_OUTPUT_MODE") or "code"
+        if mode not in ("code", "json"):
+            raise ValueError("ENGINE_OUTPUT_MODE must be one of code, json")
+        return mode
+
+    @property
+    def ENGINE_CANDIDATES(self) -> int:
+        self._ensure_loaded()
+        return max(1, EnvConfig._get_int("ENGINE_CANDIDATES", 1))
+
+    @property
+    def ENGINE_CANDIDATE_STRATEGY(self) -> str:
+        self._ensure_loaded()
+        strategy = os.getenv("ENGINE_CANDIDATE_STRATEGY") or "n"
+        if strategy not in ("n", "parallel"):
+            raise ValueError("ENGINE_CANDIDATE_STRATEGY must be one of n, parallel")
+        return strategy
+
+    @property
+    def OPENAI_MODEL_CASCADE(self) -> List[str]:
+        self._ensure_loaded()
+        models = os.getenv("OPENAI_MODEL_CASCADE") or "gpt-4o"
+        return [m.strip() for m in models.split(",") if m.strip()]
+
+    @property
+    def ENGINE_HEDGE_ENABLED(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("ENGINE_HEDGE_ENABLED", False)
+
+    @property
+    def ENGINE_HEDGE_PERCENTILE(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("ENGINE_HEDGE_PERCENTILE", 95.0)
+
+    @property
+    def ENGINE_HEDGE_MIN_SAMPLES(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_HEDGE_MIN_SAMPLES", 20)
+
+    @property
+    def ENGINE_HEDGE_MIN_DELAY(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("ENGINE_HEDGE_MIN_DELAY", 2.0)
+
+    @property
+    def OPENAI_HEDGE_MODEL(self) -> Optional[str]:
+        self._ensure_loaded()
+        return os.getenv("OPENAI_HEDGE_MODEL") or None
+
+    @property
+    def OPENAI_ENDPOINTS(self) -> Optional[str]:
+        self._ensure_loaded()
+        return os.getenv("OPENAI_ENDPOINTS") or None
+
+    @property
+    def ENDPOINT_FAILURE_THRESHOLD(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENDPOINT_FAILURE_THRESHOLD", 5)
+
+    @property
+    def ENDPOINT_RESET_TIMEOUT(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("ENDPOINT_RESET_TIMEOUT", 30.0)
+
+    @property
+    def ENGINE_HISTORY_TOKEN_BUDGET(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_HISTORY_TOKEN_BUDGET", 8000)
+
+    @property
+    def ENGINE_ERROR_MAX_CHARS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_ERROR_MAX_CHARS", 2000)
+
+    @property
+    def ENGINE_PATCH_CORRECTIONS(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("ENGINE_PATCH_CORRECTIONS", True)
+
+    @property
+    def ENGINE_PATCH_MIN_ROWS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_PATCH_MIN_ROWS", 20)
+
+    @property
+    def BATCH_BASE_URL(self) -> str:
+        self._ensure_loaded()
+        return os.getenv("BATCH_BASE_URL") or self.OPENAI_BASE_URL
+
+    @property
+    def BATCH_MAX_REQUESTS(self) -> int:
+        self._ensure_loaded()
+        return max(1, EnvConfig._get_int("BATCH_MAX_REQUESTS", 1000))
+
+    @property
+    def BATCH_FLUSH_INTERVAL(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("BATCH_FLUSH_INTERVAL", 60.0)
+
+    @property
+    def BATCH_POLL_INTERVAL(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("BATCH_POLL_INTERVAL", 30.0)
+
+    @property
+    def BATCH_COMPLETION_WINDOW(self) -> str:
+        self._ensure_loaded()
+        return os.getenv("BATCH_COMPLETION_WINDOW") or "24h"
+
+    @property
+    def ENGINE_PACK_IMAGES(self) -> int:
+        self._ensure_loaded()
+        return max(1, EnvConfig._get_int("ENGINE_PACK_IMAGES", 1))
+
+    @property
+    def ENGINE_PACK_MAX_WAIT(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("ENGINE_PACK_MAX_WAIT", 0.5)
+
+    @property
+    def ENGINE_PACK_MAX_PIXELS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_PACK_MAX_PIXELS", 400_000)
+
+    @property
+    def ENGINE_MAX_OUTPUT_TOKENS(self) -> int:
+        self._ensure_loaded()
+        return EnvConfig._get_int("ENGINE_MAX_OUTPUT_TOKENS", 16384)
+
+    @property
+    def ENGINE_MAX_CONTINUATIONS(self) -> int:
+        self._ensure_loaded()
+        return max(0, EnvConfig._get_int("ENGINE_MAX_CONTINUATIONS", 3))
+
+    @property
+    def ENGINE_CASSETTE_MODE(self) -> str:
+        self._ensure_loaded()
+        mode = os.getenv("ENGINE_CASSETTE_MODE") or "off"
+        if mode not in ("off", "record", "replay"):
+            raise ValueError("ENGINE_CASSETTE_MODE must be one of off, record, replay")
+        return mode
+
+    @property
+    def ENGINE_CASSETTE_DIR(self) -> Optional[str]:
+        self._ensure_loaded()
+        return os.getenv("ENGINE_CASSETTE_DIR") or None
+
+    @property
+    def ENGINE_CASSETTE_REPLAY_LATENCY(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("ENGINE_CASSETTE_REPLAY_LATENCY", False)
+
+    @property
+    def MODEL_PRICES(self) -> Optional[str]:
+        self._ensure_loaded()
+        return os.getenv("MODEL_PRICES") or None
+
+    @property
+    def ENGINE_IMAGE_PREPROCESS(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("ENGINE_IMAGE_PREPROCESS", True)
+
+    @property
+    def ENGINE_IMAGE_MAX_EDGE(self) -> int:
+        self._ensure_loaded()
+        return max(0, EnvConfig._get_int("ENGINE_IMAGE_MAX_EDGE", 2048))
+
+    @property
+    def ENGINE_IMAGE_FORMAT(self) -> str:
+        self._ensure_loaded()
+        image_format = os.getenv("ENGINE_IMAGE_FORMAT") or "auto"
+        if image_format not in ("auto", "png", "jpeg", "webp"):
+            raise ValueError("ENGINE_IMAGE_FORMAT must be one of auto, png, jpeg, webp")
+        return image_format
+
+    @property
+    def ENGINE_IMAGE_QUALITY(self) -> int:
+        self._ensure_loaded()
+        return min(100, max(1, EnvConfig._get_int("ENGINE_IMAGE_QUALITY", 85)))
+
+    @property
+    def ENGINE_TABLE_CROP(self) -> bool:
+        self._ensure_loaded()
+        return EnvConfig._get_bool("ENGINE_TABLE_CROP", True)
+
+    @property
+    def ENGINE_TABLE_CROP_MIN_CONFIDENCE(self) -> float:
+        self._ensure_loaded()
+        return EnvConfig._get_float("ENGINE_TABLE_CROP_MIN_CONFIDENCE", 0.5)
+
+    @property
+    def ENGINE_TILE_HEIGHT(self) -> int:
+        self._ensure_loaded()
+        return max(0, EnvConfig._get_int("ENGINE_TILE_HEIGHT", 1600))
+
+    @property
+    def ENGINE_TILE_OVERLAP(self) -> int:
+        self._ensure_loaded()
+        return max(0, EnvConfig._get_int("ENGINE_TILE_OVERLAP", 120))
+
+    @property
+    def ENGINE_TILE_MAX_BANDS(self) -> int:
+        self._ensure_loaded()
+        return max(1, EnvConfig._get_int("ENGINE_TILE_MAX_BANDS", 8))
+
+    @property
+    def ENGINE_NEAR_DUPLICATE(self) -> str:
+        self._ensure_loaded()
+        mode = os.getenv("ENGINE_NEAR_DUPLICATE") or "offer"
+        if mode not in ("off", "offer", "reuse"):
+            raise ValueError("ENGINE_NEAR_DUPLICATE must be one of off, offer, reuse")
+        return mode
+
+    @property
+    def ENGINE_NEAR_DUPLICATE_DISTANCE(self) -> int:
+        self._ensure_loaded()
+        return min(64, max(0, EnvConfig._get_int("ENGINE_NEAR_DUPLICATE_DISTANCE", 4)))
+
+    @property
+    def ENGINE_NEAR_DUPLICATE_MAX_ENTRIES(self) -> int:
+        self._ensure_loaded()
+        return max(1, EnvConfig._get_int("ENGINE_NEAR_DUPLICATE_MAX_ENTRIES", 500))
+
+    @staticmethod
+    def _get_int(name: str, default: int) -> int:
+        value = os.getenv(name)
+        if value is None or value == "":
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            raise ValueError(f"{name} must be an integer")
+
+    @staticmethod
+    def _get_float(name: str, default: float) -> float:
+        value = os.getenv(name)
+        if value is None or value == "":
+            return default
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"{name} must be a number")
+
+    @staticmethod
+    def _get_bool(name: str, default: bool) -> bool:
+        value = os.getenv(name)
+        if value is None or value == "":
+            return default
+        return value.strip().lower() in ("1", "true", "yes", "on")
+
     @staticmethod
     def _parse_cors(v: Any) -> list[str] | str:
         if isinstance(v, str) and not v.startswith("["):
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Any, Dict, List
 from pydantic import BaseModel
 
 class CreateTaskRequestDTO(BaseModel):
@@ -17,6 +17,25 @@ class GetTaskStatusResponseDTO(BaseModel):
     status: str
     message: str
     
+class GetTaskUsageResponseDTO(BaseModel):
+    task_id: str
+    usage: Dict[str, Any]
+    message: str
+    
+class GetUserUsageResponseDTO(BaseModel):
+    total: Dict[str, Any]
+    tasks: Dict[str, Dict[str, Any]]
+    message: str
+    
+class SubmitBatchRequestDTO(BaseModel):
+    task_ids: List[str]
+    
+class SubmitBatchResponseDTO(BaseModel):
+    message: str
+    task_ids: List[str]
+    rejected_task_ids: List[str] = []
+    success: bool
+    
 class CancelTaskRequestDTO(BaseModel):
     task_id: str
     
@@ -0,0 +1,105 @@
+"""
+Module for converting queued tasks through batch jobs.
+
+Bulk conversions (e.g. overnight backfills) do not need interactive
+latency. Queued tasks are run in rounds: each round turns the next
+iteration of every waiting task into one batch job, and the results are fed
+back through the tasks' normal execute / export path. Tasks whose code
+still fails are queued again, so a correction costs one more batch round
+instead of an interactive call.
+"""
+
+import asyncio
+from typing import Any, Dict, List, Optional, Set
+
+from .Task import Image2ExcelTask
+from backend.app.image2excel.engine.batch import BatchClient
+
+
+class BatchRunner:
+    """
+    Queue of tasks waiting for a batch round, and the rounds in flight.
+    Must be used from the task manager's event loop.
+    """
+
+    def __init__(self, client: BatchClient, max_requests: int, flush_interval: float) -> None:
+        self.client = client
+        self.max_requests = max_requests
+        self.flush_interval = flush_interval
+        self._queue: List[Image2ExcelTask] = []
+        self._full: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._rounds: Set[asyncio.Task] = set()
+        self.jobs: Dict[str, Dict[str, Any]] = {}  # batch_id -> summary
+
+    async def submit(self, tasks: List[Image2ExcelTask]) -> None:
+        """Queue tasks for their next batch round"""
+        if self._full is None:
+            self._full = asyncio.Event()
+        self._queue.extend(tasks)
+        if len(self._queue) >= self.max_requests:
+            self._full.set()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._flush_loop())
+
+    async def _flush_loop(self) -> None:
+        """Submit the queue whenever it is full or has waited flush_interval"""
+        while self._queue:
+            if len(self._queue) < self.max_requests:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._full.clear()
+            tasks = self._queue[: self.max_requests]
+            self._queue = self._queue[self.max_requests :]
+            # Batch jobs take long; rounds run side by side
+            round_task = asyncio.ensure_future(self._run_round(tasks))
+            self._rounds.add(round_task)
+            round_task.add_done_callback(self._rounds.discard)
+
+    async def _run_round(self, tasks: List[Image2ExcelTask]) -> None:
+        requests: Dict[str, Dict[str, Any]] = {}
+        by_id: Dict[str, Image2ExcelTask] = {}
+        for task in tasks:
+            body = await task.prepare_batch_request()
+            if body is not None:
+                requests[task.task_id] = body
+                by_id[task.task_id] = task
+        if not requests:
+            return
+
+        batch_id = None
+        try:
+            batch_id = await self.client.submit(requests)
+            self.jobs[batch_id] = {"requests": len(requests), "status": "running"}
+            for task in by_id.values():
+                task.update_hook(task.username, f"批处理任务已提交: {batch_id}")
+            results = await self.client.wait(batch_id)
+            self.jobs[batch_id]["status"] = "completed"
+        except Exception as e:
+            if batch_id is not None:
+                self.jobs[batch_id]["status"] = "failed"
+            results = {task_id: (None, f"批处理任务失败: {str(e)}") for task_id in requests}
+
+        retry: List[Image2ExcelTask] = []
+        for task_id, task in by_id.items():
+            completion, error = results.get(task_id, (None, "批处理结果缺失"))
+            if await task.apply_batch_result(completion, error):
+                retry.append(task)
+        if retry:
+            await self.submit(retry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._queue),
+            "rounds_in_flight": len(self._rounds),
+            "jobs": dict(self.jobs),
+        }
+
+    async def aclose(self) -> None:
+        """Stop waiting on batch jobs; jobs already submitted keep running remotely"""
+        for task in [self._worker, *self._rounds]:
+            if task is not None and not task.done():
+                task.cancel()
+        await self.client.aclose()
@@ -1,16 +1,414 @@
+import asyncio
 import base64
+import hashlib
+import io
+import mimetypes
+import os
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from .TableDetector import ANALYSIS_EDGE, detect_table_region, find_bands
+from backend.app.image2excel.engine.duplicates import (
+    DCT_SIZE,
+    HASH_SIZE,
+    ImageHashes,
+    dhash,
+    phash,
+)
+
+# Formats the model accepts as-is, by Pillow format name
+_SENDABLE_FORMATS = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+# Screenshots use few distinct colors (flat backgrounds, anti-aliased text);
+# they are sent as 256-color PNG, photos never are
+FLAT_IMAGE_MAX_COLORS = 1024
+FLAT_SAMPLE_EDGE = 512
+
+# A detected table covering more of the image than this is not worth cropping to
+CROP_MAX_AREA_SHARE = 0.9
+
+# Files are base64 encoded this many bytes at a time; a multiple of 3, so
+# the encoded chunks join without padding in between
+BASE64_CHUNK_BYTES = 3 * 256 * 1024
+
+
+@dataclass
+class ImageBand:
+    """One horizontal band of a tall image, sent as an image of its own"""
+
+    data: str  # base64
+    mime_type: str
+    width: int
+    height: int
+    top: int  # band rows in original pixels
+    bottom: int
+    encoded_bytes: int
+
+
+@dataclass
+class PreparedImage:
+    """An image ready to send, with what preprocessing did to it"""
+
+    data: str  # base64
+    mime_type: str
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+    original_bytes: int
+    encoded_bytes: int
+    steps: List[str] = field(default_factory=list)
+    crop: Optional[Tuple[int, int, int, int]] = None  # table box in original pixels
+    crop_confidence: Optional[float] = None
+    # Set instead of data when the image was split into bands
+    bands: List[ImageBand] = field(default_factory=list)
+
+    def report(self) -> Dict[str, Any]:
+        report = asdict(self)
+        del report["data"]
+        for band in report["bands"]:
+            del band["data"]
+        return report
 
 
 class ImageUtils:
 
     @staticmethod
-    async def from_file(image_path):
+    async def from_file(image_path, prefix: str = "") -> str:
         """
-        Read an image file and return its base64 representation.
+        Read an image file and return its base64 representation, preceded
+        by `prefix`. Runs in a worker thread and appends the encoding chunk
+        by chunk to a str that nothing else references, which CPython
+        resizes in place; peak memory is about 1.4x the file size (the
+        encoding plus one chunk), not the raw bytes, the encoded bytes and
+        their decoded copy at once.
         """
         try:
-            with open(image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode()
-                return encoded_string
+            return await asyncio.to_thread(ImageUtils._from_file_sync, image_path, prefix)
         except Exception as e:
             raise ValueError(f"Failed to encode image: {str(e)}")
+
+    @staticmethod
+    async def data_url(image_path) -> str:
+        """
+        Read an image file into a base64 data URL, built without a further
+        copy of the encoding.
+        """
+        return await ImageUtils.from_file(
+            image_path, prefix=f"data:{ImageUtils.mime_type(image_path)};base64,"
+        )
+
+    @staticmethod
+    def _from_file_sync(image_path, prefix: str = "") -> str:
+        encoded = prefix
+        with open(image_path, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(BASE64_CHUNK_BYTES), b""):
+                encoded += base64.b64encode(chunk).decode("ascii")
+        return encoded
+
+    @staticmethod
+    async def prepare(
+        image_path,
+        max_edge: int = 2048,
+        image_format: str = "auto",
+        quality: int = 85,
+        crop: bool = False,
+        min_crop_confidence: float = 0.5,
+        tile_height: int = 0,
+        tile_overlap: int = 0,
+        max_tiles: int = 1,
+    ) -> PreparedImage:
+        """
+        Read an image, shrink it for the model and return it base64 encoded.
+        Big JPEGs are decoded at reduced size, transparency is flattened onto
+        white, with `crop` the image is cut down to the detected table when
+        detection is at least `min_crop_confidence` sure, the long edge is limited to `max_edge` (0 for no limit) and
+        metadata is dropped; the result is re-encoded as `image_format`
+        ("auto" picks the smallest of PNG, JPEG and, for screenshot-like
+        images, 256-color PNG). The original bytes are sent when none of
+        that makes the file smaller. With `tile_height` an image (or table)
+        taller than that is split into up to `max_tiles` bands overlapping
+        by `tile_overlap` pixels, each shrunk and encoded on its own and
+        returned in `bands`, so a long capture is not shrunk to illegibility.
+        """
+        try:
+            return await asyncio.to_thread(
+                ImageUtils._prepare_sync,
+                image_path,
+                max_edge,
+                image_format,
+                quality,
+                crop,
+                min_crop_confidence,
+                tile_height,
+                tile_overlap,
+                max_tiles,
+            )
+        except Exception as e:
+            raise ValueError(f"Failed to preprocess image: {str(e)}")
+
+    @staticmethod
+    def _prepare_sync(
+        image_path,
+        max_edge: int,
+        image_format: str,
+        quality: int,
+        crop: bool,
+        min_crop_confidence: float,
+        tile_height: int = 0,
+        tile_overlap: int = 0,
+        max_tiles: int = 1,
+    ) -> PreparedImage:
+        original_bytes = os.path.getsize(image_path)
+        steps: List[str] = []
+        with Image.open(image_path) as source:
+            source_format = source.format
+            original_width, original_height = source.size
+            # A band is shrunk to max_edge on its own, so a tall image only
+            # needs decoding at the size of one band
+            long_edge = max(original_width, min(original_height, tile_height or original_height))
+            scale = min(1.0, max_edge / long_edge) if max_edge else 1.0
+            if source_format == "JPEG" and scale < 1.0:
+                # Let libjpeg decode at 1/2, 1/4 or 1/8 scale (never below the target) instead of full size
+                source.draft("RGB", (int(original_width * scale), int(original_height * scale)))
+                if source.size != (original_width, original_height):
+                    steps.append("draft")
+            image = ImageOps.exif_transpose(source)
+            image.load()
+        if (image.width > image.height) != (original_width > original_height):
+            original_width, original_height = original_height, original_width
+        # Original pixels per decoded pixel, above 1 after a draft decode
+        decode_factor = original_width / image.width
+
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+            steps.append("flatten_alpha")
+        elif image.mode not in ("RGB", "L"):
+            steps.append(f"convert_{image.mode.lower()}")
+            image = image.convert("RGB")
+
+        crop_box = None
+        crop_top = 0
+        region = detect_table_region(image) if crop else None
+        if region is not None and region.confidence >= min_crop_confidence:
+            left, top, right, bottom = region.box
+            if (right - left) * (bottom - top) <= CROP_MAX_AREA_SHARE * image.width * image.height:
+                image = image.crop(region.box)
+                crop_top = region.box[1]
+                crop_box = tuple(round(v * decode_factor) for v in region.box)
+                steps.append("crop")
+
+        flat = ImageUtils._is_flat(image)
+        tiles = [(0, image.height)]
+        if tile_height and max_tiles > 1:
+            tiles = find_bands(
+                image,
+                round(tile_height / decode_factor),
+                round(tile_overlap / decode_factor),
+                max_tiles,
+            )
+        if len(tiles) > 1:
+            bands = []
+            for top, bottom in tiles:
+                band = image.crop((0, top, image.width, bottom))
+                encoded, encoding, resized = ImageUtils._shrink_and_encode(
+                    band, max_edge, image_format, quality, flat
+                )
+                width, height = resized or band.size
+                bands.append(
+                    ImageBand(
+                        data=base64.b64encode(encoded).decode(),
+                        mime_type=f"image/{encoding.rstrip('8')}",
+                        width=width,
+                        height=height,
+                        top=round((crop_top + top) * decode_factor),
+                        bottom=round((crop_top + bottom) * decode_factor),
+                        encoded_bytes=len(encoded),
+                    )
+                )
+                if resized and "resize" not in steps:
+                    steps.append("resize")
+            steps.append(f"tile_{len(bands)}")
+            steps.append(f"encode_{encoding}")
+            return PreparedImage(
+                data="",
+                mime_type=bands[0].mime_type,
+                width=max(band.width for band in bands),
+                height=sum(band.height for band in bands),
+                original_width=original_width,
+                original_height=original_height,
+                original_bytes=original_bytes,
+                encoded_bytes=sum(band.encoded_bytes for band in bands),
+                steps=steps,
+                crop=crop_box,
+                crop_confidence=region.confidence if region is not None else None,
+                bands=bands,
+            )
+
+        encoded, encoding, resized = ImageUtils._shrink_and_encode(
+            image, max_edge, image_format, quality, flat
+        )
+        if resized:
+            steps.append("resize")
+        width, height = resized or image.size
+        mime_type = f"image/{encoding.rstrip('8')}"
+
+        if not steps and source_format in _SENDABLE_FORMATS and len(encoded) >= original_bytes:
+            data = ImageUtils._from_file_sync(image_path)
+            encoded_bytes = original_bytes
+            mime_type = _SENDABLE_FORMATS[source_format]
+            steps.append("original")
+        else:
+            data = base64.b64encode(encoded).decode()
+            encoded_bytes = len(encoded)
+            steps.append(f"encode_{encoding}")
+
+        return PreparedImage(
+            data=data,
+            mime_type=mime_type,
+            width=width,
+            height=height,
+            original_width=original_width,
+            original_height=original_height,
+            original_bytes=original_bytes,
+            encoded_bytes=encoded_bytes,
+            steps=steps,
+            crop=crop_box,
+            crop_confidence=region.confidence if region is not None else None,
+        )
+
+    @staticmethod
+    def _shrink_and_encode(
+        image: Image.Image, max_edge: int, image_format: str, quality: int, flat: bool
+    ) -> Tuple[bytes, str, Optional[Tuple[int, int]]]:
+        """Returns (bytes, encoding, new size if the image had to be shrunk to max_edge)"""
+        resized = None
+        if max_edge and max(image.size) > max_edge:
+            image = image.copy()
+            image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            resized = image.size
+        # No EXIF, ICC profile or text chunks in the output
+        image.info = {}
+        encoded, encoding = ImageUtils._encode_smallest(image, image_format, quality, flat)
+        return encoded, encoding, resized
+
+    @staticmethod
+    def _is_flat(image: Image.Image) -> bool:
+        """Whether an image has few distinct colors, judged on a nearest-neighbour sample"""
+        sample = image.copy()
+        sample.thumbnail((FLAT_SAMPLE_EDGE, FLAT_SAMPLE_EDGE), Image.NEAREST)
+        return sample.getcolors(FLAT_IMAGE_MAX_COLORS) is not None
+
+    @staticmethod
+    def _encode_smallest(
+        image: Image.Image, image_format: str, quality: int, flat: bool
+    ) -> Tuple[bytes, str]:
+        """Returns (bytes, encoding) for the smallest candidate encoding; "png8" is a 256-color PNG"""
+        if image_format == "auto":
+            formats = ["png8", "png"] if flat else ["png", "jpeg"]
+        else:
+            formats = [image_format]
+        best: Optional[Tuple[bytes, str]] = None
+        for name in formats:
+            buffer = io.BytesIO()
+            if name == "png8":
+                quantized = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+                quantized.save(buffer, "PNG", optimize=False, compress_level=6)
+            elif name == "png":
+                image.save(buffer, "PNG", optimize=False, compress_level=6)
+            elif name == "jpeg":
+                image.save(buffer, "JPEG", quality=quality, optimize=True)
+            else:
+                image.save(buffer, "WEBP", quality=quality, method=4)
+            encoded = buffer.getvalue()
+            if best is None or len(encoded) < len(best[0]):
+                best = (encoded, name)
+        return best
+
+    @staticmethod
+    async def sha256(image_path) -> str:
+        """
+        Return the hex SHA-256 digest of an image file's bytes.
+        """
+        try:
+            return await asyncio.to_thread(ImageUtils._sha256_sync, image_path)
+        except Exception as e:
+            raise ValueError(f"Failed to hash image: {str(e)}")
+
+    @staticmethod
+    def _sha256_sync(image_path) -> str:
+        digest = hashlib.sha256()
+        with open(image_path, "rb") as image_file:
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    async def perceptual_hashes(image_path, min_crop_confidence: Optional[float] = None) -> ImageHashes:
+        """
+        Return an image's pHash and dHash, taken over the detected table
+        when detection is at least `min_crop_confidence` sure so that a
+        different crop around the same table hashes alike.
+        """
+        try:
+            return await asyncio.to_thread(
+                ImageUtils._perceptual_hashes_sync, image_path, min_crop_confidence
+            )
+        except Exception as e:
+            raise ValueError(f"Failed to hash image: {str(e)}")
+
+    @staticmethod
+    def _perceptual_hashes_sync(image_path, min_crop_confidence: Optional[float]) -> ImageHashes:
+        with Image.open(image_path) as source:
+            # Detection works at ANALYSIS_EDGE at most, the hashes on thumbnails
+            scale = min(1.0, ANALYSIS_EDGE / max(source.size))
+            source.draft("RGB", (int(source.width * scale), int(source.height * scale)))
+            image = ImageOps.exif_transpose(source)
+            image.load()
+        if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        image = image.convert("L")
+        if min_crop_confidence is not None:
+            region = detect_table_region(image)
+            if region is not None and region.confidence >= min_crop_confidence:
+                image = image.crop(region.box)
+        return ImageHashes(
+            phash=phash(np.asarray(image.resize((DCT_SIZE, DCT_SIZE), Image.LANCZOS))),
+            dhash=dhash(
+                np.asarray(image.resize((HASH_SIZE + 1, HASH_SIZE), Image.LANCZOS), dtype=np.int16)
+            ),
+        )
+
+    @staticmethod
+    async def dimensions(image_path) -> Tuple[int, int]:
+        """
+        Return an image's (width, height); only the file header is read.
+        """
+        try:
+            return await asyncio.to_thread(ImageUtils._dimensions_sync, image_path)
+        except Exception as e:
+            raise ValueError(f"Failed to read image size: {str(e)}")
+
+    @staticmethod
+    def _dimensions_sync(image_path) -> Tuple[int, int]:
+        with Image.open(image_path) as image:
+            return image.size
+
+    @staticmethod
+    def mime_type(image_path) -> str:
+        """
+        Guess an image's MIME type from its file name, defaulting to PNG.
+        """
+        mime, _ = mimetypes.guess_type(str(image_path))
+        if mime and mime.startswith("image/"):
+            return mime
+        return "image/png"
@@ -0,0 +1,71 @@
+"""
+Module for coalescing identical in-flight work.
+Concurrent callers that ask for the same key share the result of a single
+execution instead of each running it.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+class _LeaderCancelled(Exception):
+    """Set on a flight whose leader was cancelled; followers run the work again"""
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls by key.
+    The first caller for a key runs the work; callers arriving while it is
+    still running await the same result, or the same exception. Nothing is
+    retained once the work finishes, so later calls run again. A cancelled
+    leader does not cancel its followers: the flight is dropped and a
+    follower runs the work as the new leader.
+    """
+
+    def __init__(self) -> None:
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def in_flight(self, key: str) -> bool:
+        """Check whether work for a key is currently running"""
+        return key in self._inflight
+
+    async def do(
+        self, key: str, fn: Callable[[], Awaitable[Any]]
+    ) -> Tuple[Any, bool]:
+        """
+        Run `fn` once per concurrent set of callers sharing `key`.
+
+        Args:
+            key: Deduplication key
+            fn: Coroutine factory producing the result
+        Returns:
+            (result, shared): shared is True for callers that joined an
+            existing flight instead of running `fn` themselves
+        """
+        while key in self._inflight:
+            try:
+                # Shield so a cancelled follower does not cancel the leader's work
+                return await asyncio.shield(self._inflight[key]), True
+            except _LeaderCancelled:
+                # Run it again, as the new leader unless another follower
+                # already took over
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await fn()
+            future.set_result(result)
+            return result, False
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            if not future.done():
+                future.set_exception(e)
+                # Mark retrieved so a flight without followers does not warn
+                future.exception()
+            raise
+        finally:
+            del self._inflight[key]
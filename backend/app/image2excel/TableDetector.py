@@ -0,0 +1,218 @@
+"""
+Module for locating the table inside a screenshot.
+Screenshots often show a whole browser window or desktop with the table in
+one part of it. The detector finds the table's ruling lines from
+vectorized edge maps, groups the horizontal lines that share the same
+horizontal extent, and widens the box by one row where the edge projection
+profile shows header or footer text just outside the outer lines. Images
+without enough aligned lines (borderless tables, photos) get no region and
+are sent whole.
+
+Very tall captures are also split here into horizontal bands, cut where
+the row profile shows a gap between rows so no row is sliced in half.
+"""
+
+import math
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Detection runs on a copy downscaled to this long edge; much smaller and
+# 1px rules fade below EDGE_THRESHOLD
+ANALYSIS_EDGE = 2048
+# Minimum brightness step between neighbouring pixels counted as an edge
+EDGE_THRESHOLD = 40
+# Gaps where vertical rules cross a horizontal one, bridged before measuring lines
+MAX_GAP = 3
+# Shortest ruling line, as a share of the image width
+MIN_LINE_SHARE = 0.15
+# Lines this close to the full width are window separators, not table rules
+FULL_WIDTH_SHARE = 0.97
+# Horizontal lines whose ends agree within this share of the width belong together
+ALIGN_TOLERANCE = 0.03
+# Share of edge pixels in a row band that counts as text
+TEXT_DENSITY = 0.02
+MIN_LINES = 3
+PADDING = 4
+# Edge rows below a rule's first row that still belong to the rule itself
+RULE_EDGE_ROWS = 3
+# Columns with an edge in more rows than this share are vertical rules
+VERTICAL_RULE_SHARE = 0.5
+# A cut may move this share of the band height away from its even position
+CUT_SEARCH_SHARE = 0.25
+
+
+@dataclass
+class TableRegion:
+    """Bounding box of a detected table in original image pixels"""
+
+    box: Tuple[int, int, int, int]  # left, top, right, bottom
+    confidence: float
+    lines: int
+
+
+def _runs(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Horizontal runs of True in a 2D mask.
+
+    Returns:
+        (row, start, end) arrays, end exclusive
+    """
+    height, width = mask.shape
+    padded = np.zeros((height, width + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    changes = np.diff(padded.ravel())
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1)
+    rows = starts // (width + 2)
+    return rows, starts % (width + 2), ends % (width + 2)
+
+
+def _horizontal_lines(gray: np.ndarray) -> List[Tuple[int, int, int]]:
+    """(row, start, end) of long horizontal edges, one per ruling line"""
+    height, width = gray.shape
+    steps = np.abs(np.diff(gray, axis=0)) > EDGE_THRESHOLD
+    # A pixel with edges on both sides within MAX_GAP is part of the line
+    bridged = steps.copy()
+    for left in range(1, MAX_GAP + 1):
+        for right in range(1, MAX_GAP + 2 - left):
+            bridged[:, left:-right] |= steps[:, :-left - right] & steps[:, left + right:]
+    rows, starts, ends = _runs(bridged)
+    long = (ends - starts) >= max(20, int(MIN_LINE_SHARE * width))
+    lines: List[Tuple[int, int, int]] = []
+    for row, start, end in zip(rows[long], starts[long], ends[long]):
+        # Both edges of a thick line show up; keep one entry per line
+        if any(row - r <= 2 and abs(start - s) <= 2 for r, s, _ in lines[-8:]):
+            continue
+        lines.append((int(row), int(start), int(end)))
+    return lines
+
+
+def _has_text(edges: np.ndarray, top: int, bottom: int, left: int, right: int) -> bool:
+    band = edges[max(0, top):max(0, bottom), left:right]
+    return band.size > 0 and band.mean() > TEXT_DENSITY
+
+
+def detect_table_region(image: Image.Image) -> Optional[TableRegion]:
+    """
+    Find the bounding box of the ruled table in an image.
+
+    Returns:
+        TableRegion, or None if no table structure was found
+    """
+    scale = min(1.0, ANALYSIS_EDGE / max(image.size))
+    sample = image.convert("L")
+    if scale < 1.0:
+        sample = sample.resize(
+            (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+            Image.BILINEAR,
+        )
+    gray = np.asarray(sample, dtype=np.int16)
+    height, width = gray.shape
+
+    lines = [
+        line for line in _horizontal_lines(gray)
+        if line[2] - line[1] < FULL_WIDTH_SHARE * width
+    ]
+    if len(lines) < MIN_LINES:
+        return None
+
+    # The largest set of lines sharing the same left and right ends is the table
+    tolerance = max(2, int(ALIGN_TOLERANCE * width))
+    spans = np.array([(start, end) for _, start, end in lines])
+    aligned = (np.abs(spans[:, None, :] - spans[None, :, :]) <= tolerance).all(axis=2)
+    best = int(aligned.sum(axis=1).argmax())
+    group = [line for line, member in zip(lines, aligned[best]) if member]
+    if len(group) < MIN_LINES:
+        return None
+
+    rows = np.array([row for row, _, _ in group])
+    left = int(min(start for _, start, _ in group))
+    right = int(max(end for _, _, end in group))
+    top, bottom = int(rows.min()), int(rows.max()) + 1
+
+    # A header above the first rule or a footer below the last one is text
+    # in the projection profile within one row height of the box
+    row_height = int(np.median(np.diff(rows))) if len(rows) > 1 else 0
+    if row_height > 0:
+        edges = np.zeros(gray.shape, dtype=bool)
+        edges[:, 1:] |= np.abs(np.diff(gray, axis=1)) > EDGE_THRESHOLD
+        edges[1:, :] |= np.abs(np.diff(gray, axis=0)) > EDGE_THRESHOLD
+        if _has_text(edges, top - row_height, top - 1, left, right):
+            top -= row_height
+        if _has_text(edges, bottom + RULE_EDGE_ROWS, bottom + row_height, left, right):
+            bottom += row_height
+
+    confidence = (len(group) / len(lines)) * min(1.0, len(group) / (2 * MIN_LINES))
+    box = (
+        max(0, int(left / scale) - PADDING),
+        max(0, int(top / scale) - PADDING),
+        min(image.width, int(right / scale) + PADDING),
+        min(image.height, int(bottom / scale) + PADDING),
+    )
+    return TableRegion(box=box, confidence=round(confidence, 3), lines=len(group))
+
+
+def _gap_rows(gray: np.ndarray) -> np.ndarray:
+    """
+    Centers of the runs of rows without text: blank space or ruling lines
+    between table rows, where an image can be cut without slicing a row.
+    """
+    width = gray.shape[1]
+    edges = np.abs(np.diff(gray, axis=1)) > EDGE_THRESHOLD
+    # Vertical rules cross every row; they must not make gaps look like text
+    text_columns = edges.mean(axis=0) <= VERTICAL_RULE_SHARE
+    counts = edges[:, text_columns].sum(axis=1)
+    quiet = counts <= max(2, int(0.002 * width))
+    _, starts, ends = _runs(quiet[None, :])
+    return (starts + ends - 1) // 2
+
+
+def _nearest(candidates: np.ndarray, target: int, low: int, high: int) -> int:
+    """The candidate in [low, high] closest to target, or target when there is none"""
+    inside = candidates[(candidates >= low) & (candidates <= high)]
+    if inside.size == 0:
+        return target
+    return int(inside[np.abs(inside - target).argmin()])
+
+
+def find_bands(
+    image: Image.Image, band_height: int, overlap: int, max_bands: int
+) -> List[Tuple[int, int]]:
+    """
+    Split a tall image into horizontal bands of at most about band_height
+    pixels (taller when max_bands would be exceeded, and none for an image
+    no taller than one band). Cuts are moved to the nearest
+    gap between rows, and every band reaches about `overlap` pixels past
+    each cut, again ending in a gap, so a row near a cut is whole in at
+    least one band.
+
+    Returns:
+        (top, bottom) of each band in image pixels; a single band covering
+        the image when it is not tall enough to split
+    """
+    height = image.height
+    count = min(max_bands, math.ceil(height / band_height)) if band_height > 0 else 1
+    if count <= 1:
+        return [(0, height)]
+    band_height = height / count
+
+    gaps = _gap_rows(np.asarray(image.convert("L"), dtype=np.int16))
+    search = int(CUT_SEARCH_SHARE * band_height)
+    cuts = []
+    for i in range(1, count):
+        target = int(i * band_height)
+        cuts.append(_nearest(gaps, target, target - search, target + search))
+
+    bounds = [0, *cuts, height]
+    bands = []
+    for i in range(count):
+        top, bottom = bounds[i], bounds[i + 1]
+        if i > 0:
+            top = _nearest(gaps, top - overlap, top - 2 * overlap, top - 1)
+        if i < count - 1:
+            bottom = _nearest(gaps, bottom + overlap, bottom + 1, bottom + 2 * overlap)
+        bands.append((max(0, top), min(height, bottom)))
+    return bands
@@ -5,24 +5,36 @@ Implements the task lifecycle and coordinates with TaskExecutor for actual execu
 
 import asyncio
 import base64
-from typing import Callable, Optional, Dict, Any
+from typing import Callable, Optional, Dict, Any, List, Tuple
 from dataclasses import dataclass
 from enum import Enum
 import uuid
 
+import pandas as pd
+
+from app.core.config import ENV_CONFIG
 from app.image2excel.ImageUtils import ImageUtils
 from app.image2excel.TaskExecutor import TaskExecutor, TaskState, ExecutionState
+from backend.app.image2excel.engine.accounting import usage_ledger
+from backend.app.image2excel.engine.duplicates import ImageHashes, duplicate_index
+from backend.app.image2excel.engine.sizing import image_category, max_tokens_for_image
+from backend.app.image2excel.engine.tiling import merge_band_frames
 from backend.app.image2excel.engine.prompt import (
+    OUTPUT_MODE_JSON,
     get_initial_prompt,
     get_initial_user_prompt,
+    get_json_table_prompt,
 )
 
+OUTPUT_DIR = "backend/app/image2excel/files/generated"
+
 
 class TaskStatus(Enum):
     """Task lifecycle states"""
 
     CREATED = "CREATED"
     INITIALIZING = "INITIALIZING"
+    QUEUED = "QUEUED"
     RUNNING = "RUNNING"
     PAUSED = "PAUSED"
     COMPLETED = "COMPLETED"
@@ -79,10 +91,21 @@ class Image2ExcelTask:
         self._cancellation_event = asyncio.Event()
 
         # Task execution configuration
+        self.output_mode = ENV_CONFIG.ENGINE_OUTPUT_MODE
         self._executor: Optional[TaskExecutor] = None
         self._last_execution_state: Optional[ExecutionState] = None
         self._system_prompt: Optional[str] = None
-        self._initial_user_prompt: Optional[str] = None
+        self._initial_user_prompt: Optional[List[Dict[str, Any]]] = None
+        self._image_hash: Optional[str] = None
+        self._image_category: Optional[str] = None
+        self._image_info: Optional[Dict[str, Any]] = None
+        # A tall image split into bands gets one executor per band
+        self._band_prompts: List[List[Dict[str, Any]]] = []
+        self._band_executors: List[TaskExecutor] = []
+        self._direct_run: Optional[asyncio.Future] = None
+        self._image_hashes: Optional[ImageHashes] = None
+        self._duplicate: Optional[Dict[str, Any]] = None
+        self._batch_queued = False
 
     @property
     def status(self) -> TaskStatus:
@@ -94,6 +117,16 @@ class Image2ExcelTask:
         """Get task metadata"""
         return self._metadata
 
+    @property
+    def image_info(self) -> Optional[Dict[str, Any]]:
+        """What preprocessing did to the image, None until initialized"""
+        return self._image_info
+
+    @property
+    def duplicate(self) -> Optional[Dict[str, Any]]:
+        """Earlier task of the user whose image this one nearly duplicates, if any"""
+        return self._duplicate
+
     @property
     def error(self) -> Optional[str]:
         """Get last error message if any"""
@@ -110,12 +143,65 @@ class Image2ExcelTask:
         Prepare the global system prompt with task description and image.
         This prompt remains constant throughout the task lifecycle.
         """
-
+        if self.output_mode == OUTPUT_MODE_JSON:
+            return get_json_table_prompt()
         return get_initial_prompt()
 
-    async def _prepare_initial_user_prompt(self) -> str:
-        image_b64 = await ImageUtils.from_file(self.image_path)
-        return get_initial_user_prompt(image_b64)
+    async def _prepare_initial_user_prompt(self) -> List[Dict[str, Any]]:
+        if not ENV_CONFIG.ENGINE_IMAGE_PREPROCESS:
+            image_url = await ImageUtils.data_url(self.image_path)
+            width, height = await ImageUtils.dimensions(self.image_path)
+            self._image_info = {
+                "width": width,
+                "height": height,
+                "original_width": width,
+                "original_height": height,
+                "steps": [],
+            }
+            return get_initial_user_prompt(
+                image_url=image_url,
+                detail=ENV_CONFIG.OPENAI_IMAGE_DETAIL,
+                output_mode=self.output_mode,
+            )
+
+        prepared = await ImageUtils.prepare(
+            self.image_path,
+            max_edge=ENV_CONFIG.ENGINE_IMAGE_MAX_EDGE,
+            image_format=ENV_CONFIG.ENGINE_IMAGE_FORMAT,
+            quality=ENV_CONFIG.ENGINE_IMAGE_QUALITY,
+            crop=ENV_CONFIG.ENGINE_TABLE_CROP,
+            min_crop_confidence=ENV_CONFIG.ENGINE_TABLE_CROP_MIN_CONFIDENCE,
+            tile_height=ENV_CONFIG.ENGINE_TILE_HEIGHT,
+            tile_overlap=ENV_CONFIG.ENGINE_TILE_OVERLAP,
+            max_tiles=ENV_CONFIG.ENGINE_TILE_MAX_BANDS,
+        )
+        self._image_info = prepared.report()
+        self.update_hook(
+            self.username,
+            f"图片预处理: {prepared.original_width}x{prepared.original_height} → "
+            f"{prepared.width}x{prepared.height}, "
+            f"{prepared.original_bytes / 1024:.0f}KB → {prepared.encoded_bytes / 1024:.0f}KB"
+            + ("，已裁剪至表格区域" if prepared.crop else "")
+            + (f"，分为 {len(prepared.bands)} 段并行识别" if prepared.bands else ""),
+        )
+        if prepared.bands:
+            self._band_prompts = [
+                get_initial_user_prompt(
+                    band.data,
+                    mime_type=band.mime_type,
+                    detail=ENV_CONFIG.OPENAI_IMAGE_DETAIL,
+                    output_mode=self.output_mode,
+                    band=(index, len(prepared.bands)),
+                )
+                for index, band in enumerate(prepared.bands, start=1)
+            ]
+            return self._band_prompts[0]
+        return get_initial_user_prompt(
+            prepared.data,
+            mime_type=prepared.mime_type,
+            detail=ENV_CONFIG.OPENAI_IMAGE_DETAIL,
+            output_mode=self.output_mode,
+        )
 
     async def initialize(self) -> bool:
         """Initialize task and prepare executor"""
@@ -125,13 +211,42 @@ class Image2ExcelTask:
             # Prepare system prompt
             self._system_prompt = self._prepare_system_prompt()
             self._initial_user_prompt = await self._prepare_initial_user_prompt()
+            self._image_hash = await ImageUtils.sha256(self.image_path)
+            if ENV_CONFIG.ENGINE_NEAR_DUPLICATE != "off":
+                # Usually computed already when the file was uploaded
+                self._image_hashes = duplicate_index.hashes_for(
+                    self._image_hash
+                ) or await ImageUtils.perceptual_hashes(
+                    self.image_path,
+                    ENV_CONFIG.ENGINE_TABLE_CROP_MIN_CONFIDENCE if ENV_CONFIG.ENGINE_TABLE_CROP else None,
+                )
+            # Rows are measured in source pixels, so sizing uses the original
+            # size, or that of the table when the image was cropped to it
+            width = self._image_info["original_width"]
+            height = self._image_info["original_height"]
+            image_format = ImageUtils.mime_type(self.image_path).split("/")[-1]
+            self._image_category = f"{image_category(width, height)}/{image_format}"
+            if self._image_info.get("crop"):
+                left, top, right, bottom = self._image_info["crop"]
+                width, height = right - left, bottom - top
 
             # Initialize executor
-            self._executor = TaskExecutor(
-                task_id=self.task_id,
-                username=self.username,
-                update_hook=self.update_hook,
-            )
+            if self._band_prompts:
+                self._band_executors = [
+                    self._create_executor(prompt, width, band["bottom"] - band["top"], packable=False)
+                    for prompt, band in zip(self._band_prompts, self._image_info["bands"])
+                ]
+                self._executor = self._band_executors[0]
+            else:
+                self._executor = self._create_executor(
+                    self._initial_user_prompt,
+                    width,
+                    height,
+                    packable=(
+                        ENV_CONFIG.ENGINE_PACK_IMAGES > 1
+                        and width * height <= ENV_CONFIG.ENGINE_PACK_MAX_PIXELS
+                    ),
+                )
 
             self._update_status(TaskStatus.CREATED, "任务初始化完成")
             return True
@@ -141,6 +256,25 @@ class Image2ExcelTask:
             self._update_status(TaskStatus.FAILED, self._error)
             return False
 
+    def _create_executor(
+        self, image_prompt: List[Dict[str, Any]], width: int, height: int, packable: bool
+    ) -> TaskExecutor:
+        """Executor for an image (or band of one) of width x height source pixels"""
+        return TaskExecutor(
+            task_id=self.task_id,
+            username=self.username,
+            update_hook=self.update_hook,
+            image_hash=self._image_hash,
+            output_mode=self.output_mode,
+            candidates=ENV_CONFIG.ENGINE_CANDIDATES,
+            candidate_strategy=ENV_CONFIG.ENGINE_CANDIDATE_STRATEGY,
+            image_prompt=image_prompt,
+            packable=packable,
+            max_tokens=max_tokens_for_image(
+                width, height, self.output_mode, ENV_CONFIG.ENGINE_MAX_OUTPUT_TOKENS
+            ),
+        )
+
     async def run(self) -> None:
         """
         Execute the task through its lifecycle.
@@ -154,76 +288,315 @@ class Image2ExcelTask:
         self._update_status(TaskStatus.RUNNING, "开始执行任务...")
 
         try:
+            if await self._check_near_duplicate():
+                return
+            if self._band_executors:
+                await self._run_bands()
+                return
+
             while (
                 self._metadata.current_iteration < self._executor.max_iterations
                 and not self._cancellation_event.is_set()
             ):
-                # Get user prompt for current iteration
-                if self._metadata.current_iteration == 0:
-                    user_prompt = self._initial_user_prompt
-                else:
-                    # Get last iteration result
-                    iteration_results = self._executor.get_iteration_results()
-                    last_result = iteration_results.get(
-                        self._metadata.current_iteration
-                    )
-                    if last_result:
-                        user_prompt = self._executor._generate_correction_prompt(
-                            last_result
-                        )
-                    else:
-                        user_prompt = self._initial_user_prompt
+                user_prompt = self._next_user_prompt()
 
                 # Generate code using API
-                self.current_iteration += 1
-                exec_state = await self._executor.call_api(
+                self._metadata.current_iteration += 1
+                self._executor.current_iteration = self._metadata.current_iteration
+                exec_state = await self._executor.run_iteration(
                     system_prompt=self._system_prompt, user_prompt=user_prompt
                 )
-                self._last_execution_state = exec_state
-
-                if exec_state.state == TaskState.CODE_GENERATED:
-                    self._metadata.total_iterations += 1
-
-                    # Execute generated code
-                    exec_state = await self._executor.execute_code(
-                        self._metadata.current_iteration
-                    )
-                    self._last_execution_state = exec_state
-
-                    if exec_state.state == TaskState.CODE_EXECUTION_SUCCESS:
-                        # Success! Export to Excel
-                        export_state = await self._executor.export_excel(
-                            self._metadata.current_iteration,
-                            "backend/app/image2excel/files/generated",
-                        )
-                        if export_state.state == TaskState.EXCEL_EXPORT_SUCCESS:
-                            self._update_status(
-                                TaskStatus.COMPLETED,
-                                f"任务完成。Excel文件已保存: {export_state.data.get('file_path')}",
-                            )
-                            return
-                    else:
-                        self._metadata.error_count += 1
-
-                elif exec_state.state == TaskState.TASK_FAILED:
-                    self._error = exec_state.message
-                    self._update_status(TaskStatus.FAILED, f"任务失败: {self._error}")
+                if await self._finish_iteration(exec_state):
                     return
 
-                # Wait briefly before next iteration
-                await asyncio.sleep(1)
+            self._finish_run()
+
+        except asyncio.CancelledError:
+            self._interrupted()
+            raise
+        except Exception as e:
+            self._error = f"执行错误: {str(e)}"
+            self._update_status(TaskStatus.FAILED, self._error)
 
+    def _interrupted(self) -> None:
+        """Final status when the coroutine running the task is cancelled"""
+        if self._cancellation_event.is_set():
+            self._update_status(TaskStatus.CANCELLED, "任务已取消")
+        else:
+            self._error = "执行被中断"
+            self._update_status(TaskStatus.FAILED, self._error)
+
+    async def _check_near_duplicate(self) -> bool:
+        """
+        Look for an earlier conversion of a near-identical image by the same
+        user. It is reported, or with ENGINE_NEAR_DUPLICATE=reuse its table
+        is exported as this task's result without calling the model.
+
+        Returns:
+            bool: True if the task has ended
+        """
+        if self._image_hashes is None or self._metadata.current_iteration > 0:
+            return False
+        match = duplicate_index.find(self.username, self._image_hashes)
+        if match is None:
+            return False
+        reuse = ENV_CONFIG.ENGINE_NEAR_DUPLICATE == "reuse"
+        self._duplicate = {"task_id": match.task_id, "distance": match.distance, "reused": reuse}
+        if not reuse:
+            self.update_hook(
+                self.username,
+                f"图片与任务 {match.task_id} 的图片近似 (相差 {match.distance} 位)，可参考其结果",
+            )
+            return False
+
+        export_state = await self._executor.export_dataframe(
+            match.dataframe, OUTPUT_DIR, f"{self.task_id}_reused"
+        )
+        if export_state.state != TaskState.EXCEL_EXPORT_SUCCESS:
+            # Convert the image after all
+            self._duplicate["reused"] = False
+            return False
+        self._update_status(
+            TaskStatus.COMPLETED,
+            f"任务完成 (复用任务 {match.task_id} 的结果，未调用模型)。"
+            f"Excel文件已保存: {export_state.data.get('file_path')}",
+        )
+        return True
+
+    def _remember_result(self, dataframe: pd.DataFrame) -> None:
+        """Keep the extracted table for near-duplicates of this image"""
+        if self._image_hashes is not None:
+            duplicate_index.record_result(self.username, self.task_id, self._image_hashes, dataframe)
+
+    async def _run_bands(self) -> None:
+        """
+        Extract every band of a tall image concurrently, then merge the
+        tables and export them. The first band to fail stops the others.
+        """
+        count = len(self._band_executors)
+        self._update_status(TaskStatus.RUNNING, f"开始分段识别 (共 {count} 段)...")
+        runs = [
+            asyncio.ensure_future(self._run_band(index, executor))
+            for index, executor in enumerate(self._band_executors, start=1)
+        ]
+        frames: Dict[int, pd.DataFrame] = {}
+        try:
+            for run in asyncio.as_completed(runs):
+                index, frame = await run
+                if frame is None:
+                    break
+                frames[index] = frame
+                self.update_hook(self.username, f"第 {index} 段识别完成 ({len(frames)}/{count})")
+        finally:
+            for run in runs:
+                run.cancel()
+
+        if len(frames) < count:
             if self._cancellation_event.is_set():
                 self._update_status(TaskStatus.CANCELLED, "任务已取消")
-            elif self._metadata.current_iteration >= self._executor.max_iterations:
+            else:
+                self._update_status(TaskStatus.FAILED, f"任务失败: {self._error}")
+            return
+
+        merged = merge_band_frames([frames[index] for index in range(1, count + 1)])
+        export_state = await self._executor.export_dataframe(
+            merged, OUTPUT_DIR, f"{self.task_id}_merged"
+        )
+        if export_state.state != TaskState.EXCEL_EXPORT_SUCCESS:
+            self._error = export_state.message
+            self._update_status(TaskStatus.FAILED, f"任务失败: {self._error}")
+            return
+        self._remember_result(merged)
+        self._update_status(
+            TaskStatus.COMPLETED,
+            f"任务完成，{count} 段共 {len(merged)} 行。Excel文件已保存: {export_state.data.get('file_path')}",
+        )
+
+    async def _run_band(
+        self, index: int, executor: TaskExecutor
+    ) -> Tuple[int, Optional[pd.DataFrame]]:
+        """Iteration loop of one band; returns its DataFrame, None if it failed"""
+        while (
+            executor.current_iteration < executor.max_iterations
+            and not self._cancellation_event.is_set()
+        ):
+            user_prompt = self._next_user_prompt(executor)
+            executor.current_iteration += 1
+            self._metadata.current_iteration = max(
+                self._metadata.current_iteration, executor.current_iteration
+            )
+            exec_state = await executor.run_iteration(
+                system_prompt=self._system_prompt, user_prompt=user_prompt
+            )
+            self._last_execution_state = exec_state
+            self._record_usage(executor)
+
+            if exec_state.state == TaskState.TASK_FAILED:
+                self._error = f"第 {index} 段: {exec_state.message}"
+                return index, None
+            self._metadata.total_iterations += 1
+            if exec_state.state == TaskState.CODE_EXECUTION_SUCCESS:
+                return index, executor.iteration_history[executor.current_iteration].dataframe
+            self._metadata.error_count += 1
+
+        if not self._cancellation_event.is_set():
+            self._error = f"第 {index} 段达到最大迭代次数 ({executor.max_iterations})"
+        return index, None
+
+    def _next_user_prompt(self, executor: Optional[TaskExecutor] = None) -> Optional[str]:
+        """
+        Get user prompt for current iteration; the image itself is sent by
+        the executor ahead of it on every iteration
+        """
+        executor = executor or self._executor
+        if executor.current_iteration == 0:
+            return None
+        # Get last iteration result
+        iteration_results = executor.get_iteration_results()
+        last_result = iteration_results.get(executor.current_iteration)
+        if last_result:
+            return executor._generate_correction_prompt(last_result)
+        return None
+
+    async def _finish_iteration(self, exec_state: ExecutionState) -> bool:
+        """
+        Record an iteration's outcome; exports on success.
+
+        Returns:
+            bool: True if the task has ended
+        """
+        self._last_execution_state = exec_state
+        self._record_usage()
+
+        if exec_state.state == TaskState.TASK_FAILED:
+            self._error = exec_state.message
+            self._update_status(TaskStatus.FAILED, f"任务失败: {self._error}")
+            return True
+
+        self._metadata.total_iterations += 1
+        if exec_state.state == TaskState.CODE_EXECUTION_SUCCESS:
+            # Success! Export to Excel
+            export_state = await self._executor.export_excel(
+                self._metadata.current_iteration,
+                OUTPUT_DIR,
+            )
+            if export_state.state == TaskState.EXCEL_EXPORT_SUCCESS:
+                self._remember_result(
+                    self._executor.iteration_history[self._metadata.current_iteration].dataframe
+                )
                 self._update_status(
-                    TaskStatus.FAILED,
-                    f"达到最大迭代次数 ({self._executor.max_iterations})",
+                    TaskStatus.COMPLETED,
+                    f"任务完成。Excel文件已保存: {export_state.data.get('file_path')}",
                 )
+                return True
+        else:
+            self._metadata.error_count += 1
+        return False
+
+    def _record_usage(self, executor: Optional[TaskExecutor] = None) -> None:
+        """Add the current iteration's tokens and timings to the usage totals"""
+        executor = executor or self._executor
+        result = executor.iteration_history.get(executor.current_iteration)
+        if result is None:
+            return
+        usage_ledger.record(
+            self.username,
+            self.task_id,
+            self._image_category,
+            result.model,
+            result.usage,
+            api_seconds=result.api_seconds,
+            exec_seconds=result.exec_seconds,
+            cached=result.cached,
+        )
+
+    def _finish_run(self) -> None:
+        """Final status when the iteration loop stops without success"""
+        if self._cancellation_event.is_set():
+            self._update_status(TaskStatus.CANCELLED, "任务已取消")
+        elif self._metadata.current_iteration >= self._executor.max_iterations:
+            self._update_status(
+                TaskStatus.FAILED,
+                f"达到最大迭代次数 ({self._executor.max_iterations})",
+            )
 
+    def queue_for_batch(self) -> bool:
+        """
+        Claim the task for batch conversion. Only a task that has not been
+        started can be queued; one that is already queued, running or
+        finished is left alone so it is neither raced nor billed twice.
+
+        Returns:
+            bool: True if the task was queued
+        """
+        # initialize() resets the status to CREATED, so the claim is kept apart
+        if self._status != TaskStatus.CREATED or self._batch_queued:
+            return False
+        self._batch_queued = True
+        self._update_status(TaskStatus.QUEUED, "已加入批处理队列")
+        return True
+
+    async def prepare_batch_request(self) -> Optional[Dict[str, Any]]:
+        """
+        Advance to the next iteration and return its chat completion body
+        for a batch job, instead of calling the model directly.
+
+        Returns:
+            dict: Request body, or None if the task cannot run
+        """
+        if not self._executor or not self._system_prompt:
+            await self.initialize()
+            if self.status == TaskStatus.FAILED:
+                return None
+        if self._band_executors:
+            # Bands are extracted side by side and merged, which one batch
+            # request per task cannot express; run the task directly instead
+            if self._direct_run is None:
+                self.update_hook(self.username, "分段识别的任务不使用批处理，改为直接执行")
+                self._direct_run = asyncio.ensure_future(self.run())
+            return None
+        if self._cancellation_event.is_set():
+            self._finish_run()
+            return None
+
+        user_prompt = self._next_user_prompt()
+        self._metadata.current_iteration += 1
+        self._executor.current_iteration = self._metadata.current_iteration
+        self._update_status(
+            TaskStatus.QUEUED,
+            f"已加入批处理队列 (迭代 {self._metadata.current_iteration})",
+        )
+        return self._executor.prepare_batch_request(self._system_prompt, user_prompt)
+
+    async def apply_batch_result(
+        self, completion: Optional[Any], error: Optional[str]
+    ) -> bool:
+        """
+        Run a batch job's result for the current iteration through the
+        normal execute / export path.
+
+        Returns:
+            bool: True if the task needs another iteration
+        """
+        try:
+            self._update_status(TaskStatus.RUNNING, "批处理结果已返回，开始执行...")
+            exec_state = await self._executor.apply_batch_response(completion, error)
+            if await self._finish_iteration(exec_state):
+                return False
+            if (
+                self._cancellation_event.is_set()
+                or self._metadata.current_iteration >= self._executor.max_iterations
+            ):
+                self._finish_run()
+                return False
+            return True
+        except asyncio.CancelledError:
+            self._interrupted()
+            raise
         except Exception as e:
             self._error = f"执行错误: {str(e)}"
             self._update_status(TaskStatus.FAILED, self._error)
+            return False
 
     async def cancel(self) -> None:
         """Cancel the task"""
@@ -255,10 +628,12 @@ class Image2ExcelTask:
 
     def get_last_state(self) -> Dict[str, Any]:
         """Get the last execution state details"""
+        progress = self._executor.progress if self._executor else {}
         if not self._last_execution_state:
             return {
                 "status": self.status.value,
                 "message": "No execution state available",
+                "progress": progress,
             }
 
         return {
@@ -266,6 +641,7 @@ class Image2ExcelTask:
             "state": self._last_execution_state.state.value,
             "message": self._last_execution_state.message,
             "data": self._last_execution_state.data or {},
+            "progress": progress,
         }
 
     @staticmethod
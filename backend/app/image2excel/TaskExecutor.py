@@ -3,13 +3,31 @@ Module for executing image-to-Excel conversion tasks.
 This module handles the interaction with OpenAI API, code generation, execution and iteration management.
 """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
+import asyncio
+import time
 import traceback
 import os
-from typing import Any, Dict, Optional, Callable
+from typing import Any, Dict, List, Optional, Callable, Tuple
 import pandas as pd
-from backend.app.image2excel.engine.request import send_request
+from backend.app.core.config import ENV_CONFIG
+from backend.app.image2excel.engine.request import (
+    UserPrompt,
+    build_request_options,
+    completion_result,
+    prompt_version,
+    send_request,
+)
+from backend.app.image2excel.engine.cache import make_cache_key, response_cache
+from backend.app.image2excel.engine.messages import request_prompt
+from backend.app.image2excel.engine.conversation import Conversation, trim_error
+from backend.app.image2excel.engine.usage import merge_usage
+from backend.app.image2excel.engine.prompt import OUTPUT_MODE_CODE, OUTPUT_MODE_JSON
+from backend.app.image2excel.engine.table import dataframe_from_payload
+from backend.app.image2excel.engine.cascade import ModelCascade, model_cascade
+from backend.app.image2excel.engine.packing import send_packed_request
+from app.image2excel.SingleFlight import SingleFlight
 
 class TaskState(Enum):
     """Enumeration of possible task states"""
@@ -28,6 +46,14 @@ class IterationResult:
     error_message: Optional[str] = None
     user_feedback: Optional[str] = None
     dataframe: Optional[pd.DataFrame] = None
+    cache_key: Optional[str] = None
+    cached: bool = False
+    output_mode: str = OUTPUT_MODE_CODE
+    model: Optional[str] = None
+    usage: Optional[Dict[str, int]] = None
+    patch: bool = False  # code modifies the previously produced df
+    api_seconds: Optional[float] = None  # wall time spent getting the code from the model
+    exec_seconds: Optional[float] = None  # wall time spent executing it
 
 @dataclass
 class ExecutionState:
@@ -36,6 +62,10 @@ class ExecutionState:
     message: str
     data: Optional[Dict[str, Any]] = None
 
+# Shared by every executor so identical conversions running at the same
+# time make one model call and execute the resulting code once.
+conversion_flights = SingleFlight()
+
 class TaskExecutor:
     """
     Executor for image-to-Excel conversion tasks.
@@ -47,31 +77,74 @@ class TaskExecutor:
         task_id: str,
         username: str,
         update_hook: Callable[[str, str], None],
-        max_iterations: int = 3
+        max_iterations: int = 3,
+        image_hash: Optional[str] = None,
+        output_mode: str = OUTPUT_MODE_CODE,
+        candidates: int = 1,
+        candidate_strategy: str = "n",
+        image_prompt: Optional[UserPrompt] = None,
+        packable: bool = False,
+        max_tokens: Optional[int] = None
     ) -> None:
         self.task_id = task_id
         self.username = username
         self.update_hook = update_hook
         self.max_iterations = max_iterations
+        self.image_hash = image_hash
+        self.output_mode = output_mode
+        self.candidates = candidates
+        self.candidate_strategy = candidate_strategy
+        # Sent with every iteration, ahead of the correction text, so the
+        # provider can serve it from its prompt cache
+        self.image_prompt = image_prompt
+        # Small image: the first request may share a model call with others
+        self.packable = packable and output_mode == OUTPUT_MODE_CODE
+        # Completion limit sized from the image; longer output is continued
+        self.max_tokens = max_tokens
+        
+        # Earlier outputs and corrections, resent as message history
+        self.conversation = Conversation(ENV_CONFIG.ENGINE_HISTORY_TOKEN_BUDGET, output_mode)
+        self.history: List[Dict[str, Any]] = []
+        
+        # Exec namespace of the latest code that produced a `df`; patch
+        # corrections run against a copy of it
+        self.namespace: Optional[Dict[str, Any]] = None
+        self.patching = False
+        
+        # Models escalate along the cascade as iterations fail
+        self.model_plan = model_cascade.plan()
+        self.model = self.model_plan[0]
         
         # State management
         self.current_iteration = 0
         self.iteration_history: Dict[int, IterationResult] = {}
         self.last_state: Optional[ExecutionState] = None
+        self.progress: Dict[str, int] = {}
 
     def _update_status(self, message: str) -> None:
         """Update task status via hook"""
         self.update_hook(self.username, message)
 
+    def _on_stream_progress(self, progress: Dict[str, int]) -> None:
+        """Record partial generation progress reported while streaming"""
+        self.progress = {"iteration": self.current_iteration, **progress}
+        self._update_status(
+            f"正在生成代码 (迭代 {self.current_iteration})... 已识别 {progress['rows']} 行"
+        )
+
     def _generate_correction_prompt(self, iteration_result: IterationResult) -> str:
         """
         Generate a correction prompt based on iteration results.
         This prompt guides the model to fix issues from the previous iteration.
         """
+        if self._can_patch():
+            return self._generate_patch_prompt(iteration_result)
+            
         prompt = "根据上次执行的结果，请对代码进行如下改进：\n"
+        max_chars = ENV_CONFIG.ENGINE_ERROR_MAX_CHARS
         
         if iteration_result.error_message:
-            prompt += f"\n错误信息：\n{iteration_result.error_message}\n"
+            prompt += f"\n错误信息：\n{trim_error(iteration_result.error_message, max_chars)}\n"
             prompt += "\n请修复上述错误，确保代码可以正确执行。\n"
             
         if iteration_result.user_feedback:
@@ -79,7 +152,16 @@ class TaskExecutor:
             prompt += "\n请根据用户反馈调整代码实现。\n"
             
         if iteration_result.execution_output:
-            prompt += f"\n执行输出：\n{iteration_result.execution_output}\n"
+            prompt += f"\n执行输出：\n{trim_error(str(iteration_result.execution_output), max_chars)}\n"
+            
+        if self.output_mode == OUTPUT_MODE_JSON:
+            prompt += """
+请确保：
+1. 输出符合给定结构的完整JSON
+2. 每一列的dtype与数据一致
+3. 每一行的长度与columns一致，缺失值使用null
+"""
+            return prompt
             
         prompt += """
 请确保：
@@ -90,34 +172,96 @@ class TaskExecutor:
 """
         return prompt
 
-    async def call_api(self, system_prompt: str, user_prompt: str) -> ExecutionState:
+    def _can_patch(self) -> bool:
+        """Whether the next correction can patch the existing df instead of regenerating it"""
+        if not ENV_CONFIG.ENGINE_PATCH_CORRECTIONS or self.output_mode != OUTPUT_MODE_CODE:
+            return False
+        if self.namespace is None:
+            return False
+        return len(self.namespace["df"]) >= ENV_CONFIG.ENGINE_PATCH_MIN_ROWS
+
+    def _generate_patch_prompt(self, iteration_result: IterationResult) -> str:
+        """
+        Ask for a short pandas patch on the current df rather than a full
+        regeneration, so the output scales with the fix, not the table.
+        """
+        df = self.namespace["df"]
+        max_chars = ENV_CONFIG.ENGINE_ERROR_MAX_CHARS
+        prompt = f"当前的`df`已经生成（{len(df)} 行 × {len(df.columns)} 列），无需重新创建数据。\n"
+        prompt += f"\n列类型：\n{df.dtypes.to_string()}\n"
+        prompt += f"\n前5行：\n{df.head().to_string()}\n"
+        
+        if iteration_result.error_message:
+            prompt += f"\n错误信息：\n{trim_error(iteration_result.error_message, max_chars)}\n"
+            
+        if iteration_result.user_feedback:
+            prompt += f"\n用户反馈：\n{iteration_result.user_feedback}\n"
+            
+        prompt += """
+请只输出修改现有`df`的简短pandas代码（如重命名列、转换类型、修正单元格），要求：
+1. 不要重新定义数据，也不要重新创建`df`
+2. 可以直接使用变量`df`和`pd`
+3. 修改后的结果仍保存在'df'变量中
+"""
+        return prompt
+
+    async def call_api(self, system_prompt: str, user_prompt: Optional[UserPrompt]) -> ExecutionState:
         """
         Make an API call to OpenAI with system and user prompts.
         
         Args:
             system_prompt: Global system prompt including task description
-            user_prompt: Current iteration's specific prompt
+            user_prompt: Current iteration's specific prompt, None for the first iteration
         """
         try:
-            self._update_status(f"正在生成代码 (迭代 {self.current_iteration})...")
+            self._update_status(f"正在生成代码 (迭代 {self.current_iteration}, 模型 {self.model})...")
+            self.progress = {"iteration": self.current_iteration, "rows": 0, "chars": 0}
+            started = time.monotonic()
             
-            response = await send_request(
-                user_prompt=user_prompt,
-                system_prompt=system_prompt
-            )
+            if self.packable and user_prompt is None and not self.history:
+                response = await send_packed_request(
+                    image_prompt=self.image_prompt,
+                    system_prompt=system_prompt,
+                    username=self.username,
+                    image_hash=self.image_hash,
+                    model=self.model
+                )
+            else:
+                response = await send_request(
+                    user_prompt=user_prompt,
+                    system_prompt=system_prompt,
+                    on_progress=self._on_stream_progress,
+                    image_hash=self.image_hash,
+                    output_mode=self.output_mode,
+                    model=self.model,
+                    image_prompt=self.image_prompt,
+                    history=self.history,
+                    max_tokens=self.max_tokens
+                )
             
             generated_code = response.get("generated_code", "")
             if not generated_code:
                 raise ValueError("No code generated from API")
                 
             self.iteration_history[self.current_iteration] = IterationResult(
-                generated_code=generated_code
+                generated_code=generated_code,
+                cache_key=response.get("cache_key"),
+                cached=response.get("cached", False),
+                output_mode=self.output_mode,
+                model=self.model,
+                usage=response.get("usage"),
+                patch=self.patching,
+                api_seconds=time.monotonic() - started
             )
             
             return ExecutionState(
                 state=TaskState.CODE_GENERATED,
                 message="代码生成成功",
-                data={"code": generated_code, "iteration": self.current_iteration}
+                data={
+                    "code": generated_code,
+                    "iteration": self.current_iteration,
+                    "usage": response.get("usage")
+                }
             )
         except Exception as e:
             error_msg = f"代码生成失败: {str(e)}\n{traceback.format_exc()}"
@@ -129,6 +273,280 @@ class TaskExecutor:
                 message=error_msg
             )
 
+    async def run_iteration(self, system_prompt: str, user_prompt: Optional[UserPrompt]) -> ExecutionState:
+        """
+        Generate and execute code for the current iteration.
+        
+        When the source image hash is known, identical in-flight iterations
+        from other tasks are coalesced: one of them calls the model and runs
+        the code, the others receive a copy of its result.
+        """
+        self.model = ModelCascade.model_for_attempt(self.model_plan, self.current_iteration - 1)
+        # Must match the decision _generate_correction_prompt made for this prompt
+        self.patching = user_prompt is not None and self._can_patch()
+        user_prompt = self._advance_conversation(user_prompt)
+        key = self._cache_key(user_prompt)
+        if key is None:
+            return await self._generate_and_execute(system_prompt, user_prompt)
+            
+        if conversion_flights.in_flight(key):
+            self._update_status("相同图片正在转换中，等待共享结果...")
+            
+        started = time.monotonic()
+        (iteration_result, exec_state), shared = await conversion_flights.do(
+            key, lambda: self._generate_and_execute_snapshot(system_prompt, user_prompt)
+        )
+        if not shared:
+            return exec_state
+            
+        # Give this task its own copy so later edits never leak across tasks;
+        # the tokens were spent by the task that made the call
+        if iteration_result is not None:
+            dataframe = iteration_result.dataframe
+            self.iteration_history[self.current_iteration] = replace(
+                iteration_result,
+                dataframe=dataframe.copy() if dataframe is not None else None,
+                cached=True,
+                usage=None,
+                api_seconds=time.monotonic() - started,
+                exec_seconds=None
+            )
+            # Enough for later patches to build on the shared result
+            dataframe = self.iteration_history[self.current_iteration].dataframe
+            self.namespace = {"df": dataframe} if dataframe is not None else None
+            if exec_state.state == TaskState.CODE_EXECUTION_SUCCESS:
+                exec_state = replace(
+                    exec_state,
+                    data={"dataframe": self.iteration_history[self.current_iteration].dataframe}
+                )
+        return exec_state
+
+    def _advance_conversation(self, user_prompt: Optional[UserPrompt]) -> Optional[UserPrompt]:
+        """
+        Turn a correction into conversation history: the previous output
+        becomes an assistant turn and the correction the user reply to it.
+        Returns whatever still has to be sent as a standalone prompt.
+        """
+        previous = self.iteration_history.get(self.current_iteration - 1)
+        if user_prompt is None or previous is None or not previous.generated_code:
+            return user_prompt
+        self.conversation.add_turn(previous.generated_code, user_prompt)
+        self.history = self.conversation.messages()
+        return None
+
+    def _cache_key(self, user_prompt: Optional[UserPrompt]) -> Optional[str]:
+        """Content key of an iteration, None when the image hash is unknown"""
+        if not self.image_hash:
+            return None
+        return make_cache_key(
+            self.image_hash,
+            prompt_version(self.output_mode),
+            self.model,
+            request_prompt(self.image_prompt, user_prompt, self.history)
+        )
+
+    def prepare_batch_request(
+        self, system_prompt: str, user_prompt: Optional[UserPrompt]
+    ) -> Dict[str, Any]:
+        """
+        Set up the current iteration like run_iteration does, but return the
+        chat completion body for a batch job instead of calling the model.
+        """
+        self.model = ModelCascade.model_for_attempt(self.model_plan, self.current_iteration - 1)
+        self.patching = user_prompt is not None and self._can_patch()
+        user_prompt = self._advance_conversation(user_prompt)
+        return build_request_options(
+            user_prompt,
+            system_prompt,
+            output_mode=self.output_mode,
+            model=self.model,
+            image_prompt=self.image_prompt,
+            history=self.history,
+            max_tokens=self.max_tokens
+        )
+
+    async def apply_batch_response(
+        self, completion: Optional[Any], error: Optional[str]
+    ) -> ExecutionState:
+        """
+        Execute the batch job's completion for the current iteration.
+        
+        Args:
+            completion: The ChatCompletion returned for this task's request
+            error: Why the request failed, if it did
+        """
+        if error is not None or completion is None:
+            return ExecutionState(
+                state=TaskState.TASK_FAILED,
+                message=f"代码生成失败: {error or '批处理结果缺失'}"
+            )
+            
+        response = completion_result(completion, self.output_mode, self.model)
+        generated_code = response["generated_code"]
+        if not generated_code:
+            return ExecutionState(
+                state=TaskState.TASK_FAILED,
+                message="代码生成失败: No code generated from API"
+            )
+            
+        self.iteration_history[self.current_iteration] = IterationResult(
+            generated_code=generated_code,
+            output_mode=self.output_mode,
+            model=self.model,
+            usage=response["usage"],
+            patch=self.patching
+        )
+        exec_state = await self.execute_code(self.current_iteration)
+        self._record_model_outcome(exec_state)
+        return exec_state
+
+    async def _generate_and_execute(self, system_prompt: str, user_prompt: Optional[UserPrompt]) -> ExecutionState:
+        # Patches are short; sampling several of them is not worth it
+        if self.candidates > 1 and not self.patching:
+            key = self._cache_key(user_prompt)
+            if not (key and await response_cache.get(key)):
+                exec_state = await self._generate_and_execute_candidates(system_prompt, user_prompt)
+                self._record_model_outcome(exec_state)
+                return exec_state
+                
+        exec_state = await self.call_api(system_prompt=system_prompt, user_prompt=user_prompt)
+        if exec_state.state != TaskState.CODE_GENERATED:
+            return exec_state
+        exec_state = await self.execute_code(self.current_iteration)
+        self._record_model_outcome(exec_state)
+        return exec_state
+
+    def _record_model_outcome(self, exec_state: ExecutionState) -> None:
+        """Feed a fresh model result into the cascade statistics"""
+        result = self.iteration_history.get(self.current_iteration)
+        if result is None or result.cached or exec_state.state == TaskState.TASK_FAILED:
+            return
+        model_cascade.record(
+            self.model, exec_state.state == TaskState.CODE_EXECUTION_SUCCESS
+        )
+
+    async def _request_candidates(
+        self, system_prompt: str, user_prompt: Optional[UserPrompt], n: int
+    ) -> Tuple[List[str], Optional[Dict[str, int]]]:
+        response = await send_request(
+            user_prompt=user_prompt,
+            system_prompt=system_prompt,
+            stream=False,
+            output_mode=self.output_mode,
+            n=n,
+            model=self.model,
+            image_prompt=self.image_prompt,
+            history=self.history,
+            max_tokens=self.max_tokens
+        )
+        return [code for code in response.get("candidates", []) if code], response.get("usage")
+
+    async def _execute_candidate(self, code: str) -> Tuple[str, Optional[pd.DataFrame], Optional[str]]:
+        try:
+            # Off the loop thread, so candidates run side by side with other tasks
+            df = await asyncio.to_thread(self._build_dataframe, code, self.output_mode)
+            return code, df, None
+        except Exception as e:
+            return code, None, f"代码执行失败: {str(e)}\n{traceback.format_exc()}"
+
+    async def _generate_and_execute_candidates(
+        self, system_prompt: str, user_prompt: Optional[UserPrompt]
+    ) -> ExecutionState:
+        """
+        Sample several candidates, execute each as soon as it arrives and
+        keep the first one that produces a valid DataFrame.
+        """
+        iteration = self.current_iteration
+        self._update_status(f"正在生成 {self.candidates} 个候选代码 (迭代 {iteration})...")
+        started = time.monotonic()
+        
+        if self.candidate_strategy == "parallel":
+            batches = [1] * self.candidates
+        else:
+            batches = [self.candidates]
+        requests = {
+            asyncio.ensure_future(self._request_candidates(system_prompt, user_prompt, n))
+            for n in batches
+        }
+        pending = set(requests)
+        codes: List[str] = []
+        errors: List[str] = []
+        usage: Optional[Dict[str, int]] = None
+        winner: Optional[Tuple[str, pd.DataFrame]] = None
+        
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for finished in done:
+                    if finished in requests:
+                        try:
+                            batch, batch_usage = finished.result()
+                            usage = merge_usage(usage, batch_usage)
+                            for code in batch:
+                                codes.append(code)
+                                pending.add(asyncio.ensure_future(self._execute_candidate(code)))
+                        except Exception as e:
+                            errors.append(f"代码生成失败: {str(e)}")
+                        continue
+                        
+                    code, df, error = finished.result()
+                    if df is not None and winner is None:
+                        winner = (code, df)
+                    elif error:
+                        errors.append(error)
+        finally:
+            for unfinished in pending:
+                unfinished.cancel()
+                
+        if not codes:
+            return ExecutionState(
+                state=TaskState.TASK_FAILED,
+                message="\n".join(errors) or "No code generated from API"
+            )
+            
+        if winner is None:
+            self.namespace = None
+            self.iteration_history[iteration] = IterationResult(
+                generated_code=codes[0],
+                error_message=errors[0] if len(errors) == 1 else "\n\n".join(
+                    f"候选 {i + 1}:\n{error}" for i, error in enumerate(errors)
+                ),
+                output_mode=self.output_mode,
+                model=self.model,
+                usage=usage,
+                api_seconds=time.monotonic() - started
+            )
+            return ExecutionState(
+                state=TaskState.CODE_EXECUTION_ERROR,
+                message=f"全部 {len(codes)} 个候选代码执行失败"
+            )
+            
+        code, df = winner
+        self.namespace = {"df": df}
+        key = self._cache_key(user_prompt)
+        if key and ENV_CONFIG.RESPONSE_CACHE_ENABLED:
+            await response_cache.set(key, {"completion_id": None, "generated_code": code})
+        self.iteration_history[iteration] = IterationResult(
+            generated_code=code,
+            dataframe=df,
+            execution_output=f"DataFrame successfully created (候选 {codes.index(code) + 1}/{len(codes)})",
+            cache_key=key,
+            output_mode=self.output_mode,
+            model=self.model,
+            usage=usage,
+            # Candidates execute while others are still generating; the time covers both
+            api_seconds=time.monotonic() - started
+        )
+        return ExecutionState(
+            state=TaskState.CODE_EXECUTION_SUCCESS,
+            message="代码执行成功",
+            data={"dataframe": df}
+        )
+
+    async def _generate_and_execute_snapshot(self, system_prompt: str, user_prompt: Optional[UserPrompt]):
+        exec_state = await self._generate_and_execute(system_prompt, user_prompt)
+        return self.iteration_history.get(self.current_iteration), exec_state
+
     async def execute_code(self, iteration: int) -> ExecutionState:
         """Execute generated code and capture results"""
         if iteration not in self.iteration_history:
@@ -139,20 +557,19 @@ class TaskExecutor:
             
         iteration_result = self.iteration_history[iteration]
         code = iteration_result.generated_code
+        namespace = self._exec_namespace(iteration_result)
+        started = time.monotonic()
         
         try:
-            self._update_status(f"正在执行代码 (迭代 {iteration})...")
-            
-            # Execute code in isolated environment
-            local_vars = {}
-            exec(code, {"pd": pd}, local_vars)
-            
-            if "df" not in local_vars:
-                raise ValueError("代码执行未生成'df'变量")
-                
-            df = local_vars["df"]
-            if not isinstance(df, pd.DataFrame):
-                raise ValueError("生成的'df'不是pandas DataFrame类型")
+            if iteration_result.output_mode == OUTPUT_MODE_JSON:
+                self._update_status(f"正在解析表格数据 (迭代 {iteration})...")
+            elif iteration_result.patch:
+                self._update_status(f"正在修补DataFrame (迭代 {iteration})...")
+            else:
+                self._update_status(f"正在执行代码 (迭代 {iteration})...")
+            df = self._build_dataframe(code, iteration_result.output_mode, namespace)
+            iteration_result.exec_seconds = time.monotonic() - started
+            self._retain_namespace(iteration_result, namespace, succeeded=True)
                 
             # Update iteration result
             iteration_result.dataframe = df
@@ -167,12 +584,78 @@ class TaskExecutor:
         except Exception as e:
             error_msg = f"代码执行失败: {str(e)}\n{traceback.format_exc()}"
             iteration_result.error_message = error_msg
+            iteration_result.exec_seconds = time.monotonic() - started
+            self._retain_namespace(iteration_result, namespace, succeeded=False)
+            
+            # Never serve a response whose code is known not to work
+            if iteration_result.cache_key:
+                await response_cache.invalidate(iteration_result.cache_key)
             
             return ExecutionState(
                 state=TaskState.CODE_EXECUTION_ERROR,
                 message=error_msg
             )
 
+    def _exec_namespace(self, iteration_result: IterationResult) -> Optional[Dict[str, Any]]:
+        """Namespace to exec an iteration's code in; patches get a copy of the previous one"""
+        if iteration_result.output_mode == OUTPUT_MODE_JSON:
+            return None
+        if iteration_result.patch and self.namespace is not None:
+            # Copy the df so a failing patch leaves the base intact for the next attempt
+            return {**self.namespace, "df": self.namespace["df"].copy()}
+        return {}
+
+    def _retain_namespace(
+        self,
+        iteration_result: IterationResult,
+        namespace: Optional[Dict[str, Any]],
+        succeeded: bool
+    ) -> None:
+        if namespace is None:
+            return
+        if iteration_result.patch:
+            # A failed patch may have half-modified its copy; keep the base
+            if succeeded:
+                self.namespace = namespace
+        elif isinstance(namespace.get("df"), pd.DataFrame):
+            # Even if later statements failed, the df is worth patching
+            self.namespace = namespace
+        else:
+            # Fresh code that never produced a df; nothing left to patch
+            self.namespace = None
+
+    @staticmethod
+    def _build_dataframe(
+        code: str, output_mode: str, namespace: Optional[Dict[str, Any]] = None
+    ) -> pd.DataFrame:
+        """Turn generated output into a DataFrame, raising on any failure"""
+        if output_mode == OUTPUT_MODE_JSON:
+            # Structured payload: build the DataFrame directly, no exec
+            df = dataframe_from_payload(code)
+            TaskExecutor._validate_dataframe(df)
+            return df
+            
+        # Execute code in isolated environment
+        local_vars = namespace if namespace is not None else {}
+        exec(code, {"pd": pd}, local_vars)
+        
+        if "df" not in local_vars:
+            raise ValueError("代码执行未生成'df'变量")
+            
+        df = local_vars["df"]
+        if not isinstance(df, pd.DataFrame):
+            raise ValueError("生成的'df'不是pandas DataFrame类型")
+        TaskExecutor._validate_dataframe(df)
+        return df
+
+    @staticmethod
+    def _validate_dataframe(df: pd.DataFrame) -> None:
+        """Reject results that executed but cannot be a useful table"""
+        if df.empty or len(df.columns) == 0:
+            raise ValueError("表格校验失败: DataFrame为空")
+        if df.isna().all().all():
+            raise ValueError("表格校验失败: 所有单元格均为空")
+
     async def process_feedback(self, feedback: str, iteration: int) -> ExecutionState:
         """Process user feedback for an iteration"""
         if iteration not in self.iteration_history:
@@ -202,16 +685,21 @@ class TaskExecutor:
                 message="没有可导出的DataFrame"
             )
             
+        return await self.export_dataframe(
+            iteration_result.dataframe,
+            output_dir,
+            f"{self.task_id}_iteration_{iteration}"
+        )
+
+    async def export_dataframe(self, dataframe: pd.DataFrame, output_dir: str, name: str) -> ExecutionState:
+        """Export a DataFrame to output_dir/<name>.xlsx"""
         try:
             self._update_status("正在导出Excel文件...")
             
             os.makedirs(output_dir, exist_ok=True)
-            output_path = os.path.join(
-                output_dir,
-                f"{self.task_id}_iteration_{iteration}.xlsx"
-            )
+            output_path = os.path.join(output_dir, f"{name}.xlsx")
             
-            iteration_result.dataframe.to_excel(output_path, index=False)
+            dataframe.to_excel(output_path, index=False)
             
             return ExecutionState(
                 state=TaskState.EXCEL_EXPORT_SUCCESS,
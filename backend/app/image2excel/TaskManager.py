@@ -6,13 +6,23 @@ while abstracting away the asynchronous implementation details.
 
 import asyncio
 import threading
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import Future
 import uuid
 from typing import Any, Callable, Dict, List, Optional, Union
 from dataclasses import dataclass
 from queue import Queue
 
 from .Task import Image2ExcelTask
+from .BatchRunner import BatchRunner
+from backend.app.core.config import ENV_CONFIG
+from backend.app.image2excel.engine.request import close_client
+from backend.app.image2excel.engine.accounting import usage_ledger
+from backend.app.image2excel.engine.duplicates import duplicate_index
+from backend.app.image2excel.engine.batch import batch_client
+from backend.app.image2excel.engine.cascade import model_cascade
+from backend.app.image2excel.engine.hedge import hedge_policy
+from backend.app.image2excel.engine.endpoints import endpoint_pool
+from backend.app.image2excel.engine.packing import image_packer
 
 @dataclass
 class TaskRecord:
@@ -59,8 +69,21 @@ class AsyncioEventLoopThread(threading.Thread):
         if not self._running.is_set():
             raise RuntimeError("Event loop is not running")
             
-        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
-        return future.result()
+        return self.submit_coroutine(coro).result()
+
+    def submit_coroutine(self, coro) -> Future:
+        """
+        Schedule a coroutine on the event loop without waiting for it.
+        
+        Args:
+            coro: The coroutine to schedule
+        Returns:
+            A concurrent future resolving to the coroutine's result
+        """
+        if not self._running.is_set():
+            raise RuntimeError("Event loop is not running")
+            
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
 class Image2ExcelTaskManager:
     """
@@ -77,12 +100,26 @@ class Image2ExcelTaskManager:
         
         # Task registry
         self._tasks: Dict[str, Dict[str, TaskRecord]] = {}  # username -> {task_id -> record}
-        self._executor = ThreadPoolExecutor(max_workers=4)
+        
+        # Offline conversions through batch jobs
+        self._batch_runner = BatchRunner(
+            batch_client,
+            max_requests=ENV_CONFIG.BATCH_MAX_REQUESTS,
+            flush_interval=ENV_CONFIG.BATCH_FLUSH_INTERVAL
+        )
 
     def _run_async(self, coro) -> Any:
         """Helper method to run coroutines in the event loop thread"""
         return self._async_thread.run_coroutine(coro)
 
+    def _submit_async(self, coro) -> Future:
+        """
+        Helper method to schedule coroutines in the event loop thread.
+        Tasks only yield at await points, so any number of them can be
+        in flight at once without tying up a worker thread each.
+        """
+        return self._async_thread.submit_coroutine(coro)
+
     def create_task(
         self, 
         username: str, 
@@ -124,7 +161,7 @@ class Image2ExcelTaskManager:
         self._tasks[username][task_id] = record
         
         # Initialize task in background
-        self._executor.submit(self._run_async, task.initialize())
+        self._submit_async(task.initialize())
         
         return task_id
 
@@ -143,9 +180,41 @@ class Image2ExcelTaskManager:
             return False
             
         task = self._tasks[username][task_id].task
-        self._executor.submit(self._run_async, task.run())
+        self._submit_async(task.run())
         return True
 
+    def submit_batch(self, username: str, task_ids: List[str]) -> Dict[str, List[str]]:
+        """
+        Queue tasks for conversion through batch jobs instead of
+        interactive calls (synchronous API). Suited to bulk backfills where
+        throughput and cost matter more than latency. Only tasks that have
+        not been started are queued.
+        
+        Args:
+            username: User identifier
+            task_ids: Tasks to convert
+        
+        Returns:
+            dict: "queued" task ids, and "rejected" ids of tasks that are
+            already queued, running or finished (unknown ids are in neither)
+        """
+        tasks = [
+            self._tasks[username][task_id].task
+            for task_id in task_ids
+            if self._validate_task(username, task_id)
+        ]
+        return self._run_async(self._queue_batch(tasks))
+
+    async def _queue_batch(self, tasks: List[Image2ExcelTask]) -> Dict[str, List[str]]:
+        """Claim and queue the idle tasks on the event loop thread"""
+        queued = [task for task in tasks if task.queue_for_batch()]
+        if queued:
+            await self._batch_runner.submit(queued)
+        return {
+            "queued": [task.task_id for task in queued],
+            "rejected": [task.task_id for task in tasks if task not in queued],
+        }
+
     def cancel_task(self, username: str, task_id: str) -> bool:
         """
         Cancel a running task (synchronous API).
@@ -191,6 +260,9 @@ class Image2ExcelTaskManager:
                 "error_count": task.metadata.error_count
             },
             "error": task.error,
+            "usage": usage_ledger.task(task_id),
+            "image": task.image_info,
+            "duplicate": task.duplicate,
             **task.get_last_state()
         }
 
@@ -241,6 +313,8 @@ class Image2ExcelTaskManager:
             self.cancel_task(username, task_id)
             
         del self._tasks[username][task_id]
+        usage_ledger.forget_task(task_id)
+        duplicate_index.forget_task(username, task_id)
         if not self._tasks[username]:
             del self._tasks[username]
             
@@ -265,6 +339,60 @@ class Image2ExcelTaskManager:
         self._run_async(task.provide_feedback(feedback))
         return True
 
+    def get_task_usage(self, username: str, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a task's accumulated token usage, cost and timings (synchronous API).
+        
+        Args:
+            username: User identifier
+            task_id: Task identifier
+            
+        Returns:
+            dict: Usage totals or None if task not found
+        """
+        if not self._validate_task(username, task_id):
+            return None
+        return usage_ledger.task(task_id)
+
+    def get_user_usage(self, username: str) -> Dict[str, Any]:
+        """
+        Get a user's accumulated token usage, cost and timings (synchronous API).
+        Includes tasks that have since been deleted.
+        
+        Args:
+            username: User identifier
+            
+        Returns:
+            dict: The user's totals and those of each current task
+        """
+        return {
+            "total": usage_ledger.user(username),
+            "tasks": {
+                task_id: usage_ledger.task(task_id)
+                for task_id in self._tasks.get(username, {})
+            }
+        }
+
+    def get_engine_stats(self) -> Dict[str, Any]:
+        """
+        Get process-wide engine statistics (synchronous API).
+        
+        Returns:
+            dict: Per-model cascade success rates, latency histograms,
+            per-endpoint health, batch queue state, image packing counters,
+            usage totals per user and image category and near-duplicate
+            index counters
+        """
+        return {
+            "model_cascade": model_cascade.stats(),
+            "latency": hedge_policy.stats(),
+            "endpoints": endpoint_pool.stats(),
+            "batch": self._batch_runner.stats(),
+            "packing": image_packer.stats(),
+            "usage": usage_ledger.stats(),
+            "duplicates": duplicate_index.stats()
+        }
+
     def _validate_task(self, username: str, task_id: str) -> bool:
         """Helper method to validate task existence"""
         return (
@@ -282,11 +410,12 @@ class Image2ExcelTaskManager:
             for task_id in list(self._tasks[username].keys()):
                 self.cancel_task(username, task_id)
         
+        # Release pooled engine connections before the loop goes away
+        self._run_async(self._batch_runner.aclose())
+        self._run_async(close_client())
+        
         # Stop the event loop thread
         self._async_thread.stop()
         self._async_thread.join()
-        
-        # Shutdown thread pool
-        self._executor.shutdown(wait=True)
 
 task_manager = Image2ExcelTaskManager()
\ No newline at end of file
@@ -0,0 +1,127 @@
+"""
+In-memory token, cost and time accounting.
+
+Every iteration's model usage (prompt, cached and completion tokens), the
+wall time of its model call and of executing its output are added to
+running totals per task, per user and per image category (size class and
+format), so it is visible which kinds of images drive spend and latency.
+Counters are plain sums in process memory; they reset on restart.
+"""
+
+import json
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+from backend.app.core.config import ENV_CONFIG
+
+# USD per 1M tokens
+DEFAULT_PRICES: Dict[str, Dict[str, float]] = {
+    "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+    "gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+}
+
+
+@dataclass
+class UsageTotals:
+    iterations: int = 0
+    cache_hits: int = 0  # answered from the response cache or a shared conversion
+    prompt_tokens: int = 0
+    cached_tokens: int = 0
+    completion_tokens: int = 0
+    cost: float = 0.0
+    api_seconds: float = 0.0
+    exec_seconds: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        totals = asdict(self)
+        totals["cost"] = round(self.cost, 6)
+        totals["api_seconds"] = round(self.api_seconds, 3)
+        totals["exec_seconds"] = round(self.exec_seconds, 3)
+        return totals
+
+
+def cost_of(usage: Optional[Dict[str, int]], prices: Optional[Dict[str, float]]) -> float:
+    """USD cost of one call's usage, 0.0 when the model has no known price"""
+    if not usage or not prices:
+        return 0.0
+    cached = usage.get("cached_tokens", 0)
+    uncached = usage.get("uncached_tokens", usage.get("prompt_tokens", 0) - cached)
+    return (
+        uncached * prices.get("input", 0.0)
+        + cached * prices.get("cached_input", prices.get("input", 0.0))
+        + usage.get("completion_tokens", 0) * prices.get("output", 0.0)
+    ) / 1_000_000
+
+
+class UsageLedger:
+    """
+    Running usage totals keyed by task, user and image category.
+    """
+
+    def __init__(self, prices: Dict[str, Dict[str, float]]) -> None:
+        self.prices = prices
+        self._tasks: Dict[str, UsageTotals] = {}
+        self._users: Dict[str, UsageTotals] = {}
+        self._categories: Dict[str, UsageTotals] = {}
+
+    def record(
+        self,
+        username: str,
+        task_id: str,
+        category: Optional[str],
+        model: Optional[str],
+        usage: Optional[Dict[str, int]],
+        api_seconds: Optional[float] = None,
+        exec_seconds: Optional[float] = None,
+        cached: bool = False,
+    ) -> None:
+        """Add one iteration to the task, user and category totals"""
+        cost = cost_of(usage, self.prices.get(model or ""))
+        buckets = [
+            self._tasks.setdefault(task_id, UsageTotals()),
+            self._users.setdefault(username, UsageTotals()),
+            self._categories.setdefault(category or "unknown", UsageTotals()),
+        ]
+        for totals in buckets:
+            totals.iterations += 1
+            totals.cache_hits += int(cached)
+            if usage:
+                totals.prompt_tokens += usage.get("prompt_tokens", 0)
+                totals.cached_tokens += usage.get("cached_tokens", 0)
+                totals.completion_tokens += usage.get("completion_tokens", 0)
+            totals.cost += cost
+            totals.api_seconds += api_seconds or 0.0
+            totals.exec_seconds += exec_seconds or 0.0
+
+    def task(self, task_id: str) -> Dict[str, Any]:
+        return self._tasks.get(task_id, UsageTotals()).as_dict()
+
+    def user(self, username: str) -> Dict[str, Any]:
+        return self._users.get(username, UsageTotals()).as_dict()
+
+    def forget_task(self, task_id: str) -> None:
+        """Drop a deleted task's totals; user and category totals keep its usage"""
+        self._tasks.pop(task_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": {name: totals.as_dict() for name, totals in self._users.items()},
+            "categories": {name: totals.as_dict() for name, totals in self._categories.items()},
+        }
+
+
+def load_prices() -> Dict[str, Dict[str, float]]:
+    """DEFAULT_PRICES overridden by MODEL_PRICES, a JSON object of per-model prices"""
+    raw = ENV_CONFIG.MODEL_PRICES
+    if not raw:
+        return dict(DEFAULT_PRICES)
+    try:
+        prices = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("MODEL_PRICES must be a JSON object")
+    if not isinstance(prices, dict):
+        raise ValueError("MODEL_PRICES must be a JSON object")
+    return {**DEFAULT_PRICES, **prices}
+
+
+usage_ledger = UsageLedger(load_prices())
@@ -0,0 +1,149 @@
+"""
+Client for OpenAI-compatible batch jobs.
+
+Requests are written as one JSONL file ({"custom_id", "method", "url",
+"body"} per line), uploaded through the Files API and run as a batch job.
+The job is polled until it ends, then the output and error files are read
+back and mapped to their custom_id. Batch jobs trade latency (minutes to
+hours) for throughput and a lower price, which suits bulk backfills.
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, Optional, Tuple
+
+from openai import AsyncOpenAI
+from openai.types.chat import ChatCompletion
+
+from backend.app.core.config import ENV_CONFIG
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+# Terminal batch states; everything else means "still running"
+BATCH_DONE_STATES = ("completed", "failed", "expired", "cancelled")
+
+# custom_id -> (completion, error message); exactly one of the two is set
+BatchResults = Dict[str, Tuple[Optional[ChatCompletion], Optional[str]]]
+
+
+class BatchJobError(Exception):
+    """Raised when a batch job as a whole fails or expires"""
+
+
+def build_batch_jsonl(requests: Dict[str, Dict[str, Any]]) -> bytes:
+    """Serialize {custom_id: chat completion body} as a batch input file"""
+    lines = [
+        json.dumps(
+            {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body},
+            ensure_ascii=False,
+        )
+        for custom_id, body in requests.items()
+    ]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def parse_batch_output(text: str, results: Optional[BatchResults] = None) -> BatchResults:
+    """
+    Parse a batch output or error file into `results`.
+    """
+    results = {} if results is None else results
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        custom_id = record.get("custom_id")
+        response = record.get("response") or {}
+        error = record.get("error")
+        if error:
+            message = error.get("message") if isinstance(error, dict) else str(error)
+            results[custom_id] = (None, f"批处理请求失败: {message}")
+        elif response.get("status_code") != 200:
+            body = response.get("body") or {}
+            message = (body.get("error") or {}).get("message") or body
+            results[custom_id] = (
+                None, f"批处理请求失败 (HTTP {response.get('status_code')}): {message}"
+            )
+        else:
+            results[custom_id] = (ChatCompletion.model_validate(response["body"]), None)
+    return results
+
+
+class BatchClient:
+    """
+    Submits batch jobs to one OpenAI-compatible endpoint and collects results.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: Optional[str],
+        poll_interval: float = 30.0,
+        completion_window: str = "24h",
+    ) -> None:
+        self.base_url = base_url
+        self.api_key = api_key
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+        self._client: Optional[AsyncOpenAI] = None
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(api_key=self.api_key or "EMPTY", base_url=self.base_url)
+        return self._client
+
+    async def submit(self, requests: Dict[str, Dict[str, Any]]) -> str:
+        """
+        Upload the requests and start a batch job.
+
+        Returns:
+            The batch id
+        """
+        input_file = await self.client.files.create(
+            file=("batch_input.jsonl", build_batch_jsonl(requests), "application/jsonl"),
+            purpose="batch",
+        )
+        batch = await self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=BATCH_ENDPOINT,
+            completion_window=self.completion_window,
+        )
+        return batch.id
+
+    async def wait(self, batch_id: str) -> BatchResults:
+        """
+        Poll a batch job until it ends and return its per-request results.
+
+        Raises:
+            BatchJobError: If the job failed, expired or was cancelled
+                without producing any output
+        """
+        while True:
+            batch = await self.client.batches.retrieve(batch_id)
+            if batch.status in BATCH_DONE_STATES:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        results: BatchResults = {}
+        # Expired and cancelled jobs still return whatever did complete
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self.client.files.content(file_id)
+                parse_batch_output(content.text, results)
+        if batch.status != "completed" and not results:
+            errors = getattr(batch, "errors", None)
+            raise BatchJobError(f"批处理任务 {batch_id} 状态为 {batch.status}: {errors}")
+        return results
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+        self._client = None
+
+
+batch_client = BatchClient(
+    base_url=ENV_CONFIG.BATCH_BASE_URL,
+    api_key=ENV_CONFIG.OPENAI_API_KEY,
+    poll_interval=ENV_CONFIG.BATCH_POLL_INTERVAL,
+    completion_window=ENV_CONFIG.BATCH_COMPLETION_WINDOW,
+)
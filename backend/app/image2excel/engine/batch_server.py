@@ -0,0 +1,193 @@
+"""
+Local stand-in for the OpenAI Files and Batches API.
+
+Implements just enough of /v1/files and /v1/batches for BatchClient:
+uploaded JSONL batches are run in the background by sending every line to
+the interactive endpoints (endpoint_pool), a few at a time, and the results
+are exposed as output / error files. Point BATCH_BASE_URL at it to exercise
+batch mode end to end without a provider batch queue:
+
+    python -m backend.app.image2excel.engine.batch_server --port 8002
+    BATCH_BASE_URL=http://127.0.0.1:8002/v1
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+import openai
+import uvicorn
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .endpoints import endpoint_pool
+
+# Lines of one batch processed concurrently
+CONCURRENCY = 8
+
+Fulfil = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class CreateBatchRequest(BaseModel):
+    input_file_id: str
+    endpoint: str
+    completion_window: str = "24h"
+    metadata: Dict[str, str] | None = None
+
+
+async def fulfil_with_endpoints(body: Dict[str, Any]) -> Dict[str, Any]:
+    """Run one batch line as a regular chat completion"""
+    async with endpoint_pool.attempt() as endpoint:
+        completion = await endpoint.client.chat.completions.create(**body)
+    return completion.model_dump()
+
+
+def create_app(fulfil: Fulfil = fulfil_with_endpoints) -> FastAPI:
+    """
+    Build the stand-in server. `fulfil` turns a chat completion body into
+    a completion dict; it can be swapped for canned responses in tests.
+    """
+    app = FastAPI(title="image2excel batch stand-in")
+    files: Dict[str, Dict[str, Any]] = {}
+    batches: Dict[str, Dict[str, Any]] = {}
+    jobs: Dict[str, asyncio.Task] = {}
+
+    def store_file(name: str, purpose: str, content: bytes) -> Dict[str, Any]:
+        file_id = f"file-{uuid.uuid4().hex}"
+        files[file_id] = {
+            "meta": {
+                "id": file_id,
+                "object": "file",
+                "bytes": len(content),
+                "created_at": int(time.time()),
+                "filename": name,
+                "purpose": purpose,
+                "status": "processed",
+            },
+            "content": content,
+        }
+        return files[file_id]["meta"]
+
+    async def run_line(line: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        record: Dict[str, Any] = {
+            "id": f"batch_req_{uuid.uuid4().hex}",
+            "custom_id": line.get("custom_id"),
+            "response": None,
+            "error": None,
+        }
+        async with semaphore:
+            try:
+                body = await fulfil(line["body"])
+                record["response"] = {"status_code": 200, "request_id": record["id"], "body": body}
+            except openai.APIStatusError as e:
+                record["response"] = {
+                    "status_code": e.status_code,
+                    "request_id": record["id"],
+                    "body": {"error": {"message": e.message}},
+                }
+            except Exception as e:
+                record["error"] = {"code": "server_error", "message": str(e)}
+        return record
+
+    async def run_batch(batch: Dict[str, Any]) -> None:
+        batch["status"] = "in_progress"
+        batch["in_progress_at"] = int(time.time())
+        try:
+            await process_batch(batch)
+        except Exception as e:
+            # Otherwise the batch would sit in_progress and BatchClient poll forever
+            batch["status"] = "failed"
+            batch["failed_at"] = int(time.time())
+            batch["errors"] = {
+                "object": "list",
+                "data": [{"code": "server_error", "message": str(e), "param": None, "line": None}],
+            }
+
+    async def process_batch(batch: Dict[str, Any]) -> None:
+        content = files[batch["input_file_id"]]["content"].decode("utf-8")
+        lines = [json.loads(line) for line in content.splitlines() if line.strip()]
+        batch["request_counts"]["total"] = len(lines)
+
+        semaphore = asyncio.Semaphore(CONCURRENCY)
+        records: List[Dict[str, Any]] = await asyncio.gather(
+            *(run_line(line, semaphore) for line in lines)
+        )
+        succeeded = [r for r in records if r["response"] and r["response"]["status_code"] == 200]
+        failed = [r for r in records if r not in succeeded]
+        batch["request_counts"].update(completed=len(succeeded), failed=len(failed))
+
+        def dump(rows: List[Dict[str, Any]]) -> bytes:
+            return "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+
+        if succeeded:
+            batch["output_file_id"] = store_file(
+                f"{batch['id']}_output.jsonl", "batch_output", dump(succeeded)
+            )["id"]
+        if failed:
+            batch["error_file_id"] = store_file(
+                f"{batch['id']}_errors.jsonl", "batch_output", dump(failed)
+            )["id"]
+        batch["status"] = "completed"
+        batch["completed_at"] = int(time.time())
+
+    @app.post("/v1/files")
+    async def create_file(file: UploadFile = File(...), purpose: str = Form(...)):
+        return store_file(file.filename or "upload.jsonl", purpose, await file.read())
+
+    @app.get("/v1/files/{file_id}/content")
+    async def file_content(file_id: str):
+        if file_id not in files:
+            raise HTTPException(status_code=404, detail="File not found")
+        return Response(files[file_id]["content"], media_type="application/jsonl")
+
+    @app.post("/v1/batches")
+    async def create_batch(request: CreateBatchRequest):
+        if request.input_file_id not in files:
+            raise HTTPException(status_code=404, detail="Input file not found")
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        batches[batch_id] = {
+            "id": batch_id,
+            "object": "batch",
+            "endpoint": request.endpoint,
+            "input_file_id": request.input_file_id,
+            "completion_window": request.completion_window,
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "errors": None,
+            "metadata": request.metadata,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        jobs[batch_id] = asyncio.create_task(run_batch(batches[batch_id]))
+        return batches[batch_id]
+
+    @app.get("/v1/batches/{batch_id}")
+    async def retrieve_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        return batches[batch_id]
+
+    @app.post("/v1/batches/{batch_id}/cancel")
+    async def cancel_batch(batch_id: str):
+        if batch_id not in batches:
+            raise HTTPException(status_code=404, detail="Batch not found")
+        job = jobs.get(batch_id)
+        if job and not job.done():
+            job.cancel()
+            batches[batch_id]["status"] = "cancelled"
+        return batches[batch_id]
+
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    args = parser.parse_args()
+    uvicorn.run(create_app(), host=args.host, port=args.port)
@@ -0,0 +1,205 @@
+"""
+Content-addressed cache for model responses.
+
+Entries are keyed on the image content hash, the system prompt version,
+the model, the iteration prompt and the image preprocessing settings (which
+change what the model is shown), so a repeat conversion of the same
+screenshot can skip the model round trip entirely. A small in-memory LRU
+tier serves hot entries; an on-disk tier survives restarts and is
+trimmed oldest-first once it grows past its byte budget.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from backend.app.core.config import ENV_CONFIG
+
+DEFAULT_CACHE_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files", "cache")
+)
+
+
+def prompt_fingerprint(user_prompt: Any) -> str:
+    """
+    Serialize a prompt for hashing. Inline image data is replaced by its
+    detail level, since the image itself is already covered by image_hash.
+    """
+    if isinstance(user_prompt, str):
+        return user_prompt
+    parts = []
+    for part in user_prompt:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            parts.append({"type": "image_url", "detail": part["image_url"].get("detail")})
+        else:
+            parts.append(part)
+    return json.dumps(parts, sort_keys=True, ensure_ascii=False)
+
+
+# Settings that change the image sent for a given upload
+PREPROCESS_SETTINGS = (
+    "ENGINE_IMAGE_PREPROCESS",
+    "ENGINE_IMAGE_MAX_EDGE",
+    "ENGINE_IMAGE_FORMAT",
+    "ENGINE_IMAGE_QUALITY",
+    "ENGINE_TABLE_CROP",
+    "ENGINE_TABLE_CROP_MIN_CONFIDENCE",
+    "ENGINE_TILE_HEIGHT",
+    "ENGINE_TILE_OVERLAP",
+    "ENGINE_TILE_MAX_BANDS",
+)
+
+
+def preprocess_fingerprint() -> str:
+    """Serialize the preprocessing settings in effect for hashing"""
+    return json.dumps(
+        {name: getattr(ENV_CONFIG, name) for name in PREPROCESS_SETTINGS}, sort_keys=True
+    )
+
+
+def make_cache_key(
+    image_hash: str, prompt_version: str, model: str, user_prompt: Any
+) -> str:
+    """Build the cache key for one model call"""
+    user_prompt = prompt_fingerprint(user_prompt)
+    digest = hashlib.sha256()
+    for part in (image_hash, prompt_version, model, user_prompt, preprocess_fingerprint()):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier (memory LRU + disk) cache of model responses.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        max_memory_entries: int = 256,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._disk_bytes: Optional[int] = None
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _remember(self, key: str, value: Dict[str, Any]) -> None:
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a response, promoting disk hits into the memory tier"""
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            return value
+
+        value = await asyncio.to_thread(self._read_disk, key)
+        if value is not None:
+            self._remember(key, value)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store a response in both tiers"""
+        self._remember(key, value)
+        await asyncio.to_thread(self._write_disk, key, value)
+
+    async def invalidate(self, key: str) -> None:
+        """Drop a response, e.g. because its code failed to execute"""
+        self._memory.pop(key, None)
+        await asyncio.to_thread(self._remove_disk, key)
+
+    def _read_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            # Refresh the timestamp used for oldest-first eviction
+            os.utime(path)
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key: str, value: Dict[str, Any]) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        # Unique per writer, so concurrent writes of one key never share a temp file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, prefix=f".{key}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        if self._disk_bytes is None:
+            self._disk_bytes = self._scan_disk_bytes()
+        else:
+            self._disk_bytes += len(data)
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict_disk()
+
+    def _remove_disk(self, key: str) -> None:
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        if self._disk_bytes is not None:
+            self._disk_bytes -= size
+
+    def _list_entries(self) -> list:
+        entries = []
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            pass
+        return entries
+
+    def _scan_disk_bytes(self) -> int:
+        return sum(size for _, size, _ in self._list_entries())
+
+    def _evict_disk(self) -> None:
+        """Delete least recently used files until under ~90% of the budget"""
+        entries = sorted(self._list_entries())
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_disk_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                continue
+        self._disk_bytes = total
+
+
+response_cache = ResponseCache(
+    cache_dir=ENV_CONFIG.RESPONSE_CACHE_DIR or DEFAULT_CACHE_DIR,
+    max_memory_entries=ENV_CONFIG.RESPONSE_CACHE_MEMORY_ENTRIES,
+    max_disk_bytes=ENV_CONFIG.RESPONSE_CACHE_MAX_BYTES,
+)
@@ -0,0 +1,100 @@
+"""
+Model cascade: try cheaper, faster models first and escalate on failure.
+
+Iteration 1 of a task uses the first tier, each failed iteration moves one
+tier up, and the last tier is used for any remaining iterations. Outcomes
+are tracked per tier over a rolling window; a cheap tier whose success rate
+drops below the threshold is skipped (apart from periodic probes that let
+it recover), so images go straight to a tier that can handle them.
+"""
+
+from collections import deque
+from typing import Any, Deque, Dict, List
+
+from backend.app.core.config import ENV_CONFIG
+
+
+class TierStats:
+    """Rolling success statistics of one cascade tier"""
+
+    def __init__(self, window: int) -> None:
+        self.outcomes: Deque[bool] = deque(maxlen=window)
+        self.attempts = 0
+        self.successes = 0
+
+    def record(self, success: bool) -> None:
+        self.outcomes.append(success)
+        self.attempts += 1
+        self.successes += int(success)
+
+    @property
+    def success_rate(self) -> float:
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+
+
+class ModelCascade:
+    """
+    Ordered list of models with adaptive skipping of unreliable cheap tiers.
+    """
+
+    def __init__(
+        self,
+        models: List[str],
+        min_samples: int = 20,
+        min_success_rate: float = 0.3,
+        probe_interval: int = 10,
+        window: int = 100,
+    ) -> None:
+        if not models:
+            raise ValueError("Model cascade needs at least one model")
+        self.models = models
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.probe_interval = probe_interval
+        self._stats: Dict[str, TierStats] = {m: TierStats(window) for m in models}
+        self._plans = 0
+
+    def _demoted(self, model: str) -> bool:
+        stats = self._stats[model]
+        return (
+            len(stats.outcomes) >= self.min_samples
+            and stats.success_rate < self.min_success_rate
+        )
+
+    def plan(self) -> List[str]:
+        """
+        Tier order for a new task. The last (strongest) tier is always kept.
+        """
+        self._plans += 1
+        if self.probe_interval and self._plans % self.probe_interval == 0:
+            return list(self.models)
+        cheap = [m for m in self.models[:-1] if not self._demoted(m)]
+        return cheap + [self.models[-1]]
+
+    @staticmethod
+    def model_for_attempt(plan: List[str], attempt: int) -> str:
+        """Model for the given zero-based attempt of a plan"""
+        return plan[min(attempt, len(plan) - 1)]
+
+    def record(self, model: str, success: bool) -> None:
+        """Record whether a model's output produced an accepted DataFrame"""
+        if model not in self._stats:
+            self._stats[model] = TierStats(self._stats[self.models[0]].outcomes.maxlen)
+        self._stats[model].record(success)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-tier counters and rolling success rate"""
+        return {
+            model: {
+                "attempts": stats.attempts,
+                "successes": stats.successes,
+                "success_rate": round(stats.success_rate, 3),
+                "skipped": self._demoted(model) if model in self.models[:-1] else False,
+            }
+            for model, stats in self._stats.items()
+        }
+
+
+model_cascade = ModelCascade(ENV_CONFIG.OPENAI_MODEL_CASCADE)
@@ -0,0 +1,248 @@
+"""
+Record / replay layer for model API traffic.
+
+CassetteTransport wraps the httpx transport under the OpenAI clients. In
+record mode every exchange is passed through and saved to disk, keyed by a
+fingerprint of the request (method, URL and canonicalized body; never the
+credentials). In replay mode the saved responses are served instead of
+calling the network, in recorded order for repeated identical requests,
+either at full speed or with the recorded timing (time to first byte and
+the spacing of streamed chunks). The whole task pipeline can then be run
+and profiled offline, reproducibly.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from backend.app.core.config import ENV_CONFIG
+
+DEFAULT_CASSETTE_DIR = os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "files", "cassettes")
+)
+
+# Not worth keeping, or would make replays misleading
+_SKIPPED_HEADERS = {"set-cookie", "date", "content-length", "transfer-encoding", "connection"}
+
+# (seconds since the response started, raw bytes)
+Chunks = List[Tuple[float, bytes]]
+
+
+class CassetteMissError(Exception):
+    """
+    Raised in replay mode for a request that was never recorded. It is not
+    a transport error, since retrying or trying another endpoint cannot
+    help and the endpoint itself is fine.
+    """
+
+    def __init__(self, message: str, request: httpx.Request) -> None:
+        super().__init__(message)
+        self.request = request
+
+
+def cassette_miss(error: BaseException) -> Optional[CassetteMissError]:
+    """The CassetteMissError behind an error; the SDK wraps what the transport raises"""
+    seen = set()
+    current: Optional[BaseException] = error
+    while current is not None and id(current) not in seen:
+        if isinstance(current, CassetteMissError):
+            return current
+        seen.add(id(current))
+        current = current.__cause__ or current.__context__
+    return None
+
+
+def request_fingerprint(request: httpx.Request) -> str:
+    """Stable key of a request: method, URL and canonical body"""
+    body = request.content
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("application/json"):
+        body = json.dumps(json.loads(body), sort_keys=True, ensure_ascii=False).encode("utf-8")
+    elif "boundary=" in content_type:
+        # Multipart boundaries are random per request
+        boundary = content_type.split("boundary=", 1)[1].encode("utf-8")
+        body = body.replace(boundary, b"")
+    digest = hashlib.sha256()
+    digest.update(request.method.encode("utf-8"))
+    digest.update(str(request.url.copy_with(query=request.url.query or None)).encode("utf-8"))
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes response bytes through, remembering them with their timing"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, on_close: Callable[[Chunks, bool], Any]) -> None:
+        self._stream = stream
+        self._on_close = on_close
+        self._started = time.monotonic()
+        self._chunks: Chunks = []
+        self._complete = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            self._chunks.append((time.monotonic() - self._started, chunk))
+            yield chunk
+        self._complete = True
+
+    async def aclose(self) -> None:
+        await self._stream.aclose()
+        # A stream the client stopped reading early is saved as far as it got;
+        # the same client stops at the same point on replay
+        await self._on_close(self._chunks, self._complete)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    def __init__(self, chunks: Chunks, replay_latency: bool) -> None:
+        self._chunks = chunks
+        self._replay_latency = replay_latency
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = time.monotonic()
+        for offset, chunk in self._chunks:
+            if self._replay_latency:
+                delay = offset - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield chunk
+
+
+class CassetteTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport that records to, or replays from, a cassette directory.
+    """
+
+    def __init__(
+        self,
+        inner: httpx.AsyncBaseTransport,
+        directory: str,
+        mode: str,
+        replay_latency: bool = False,
+    ) -> None:
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.inner = inner
+        self.directory = directory
+        self.mode = mode
+        self.replay_latency = replay_latency
+        # fingerprint -> recorded interactions; record mode starts each file afresh
+        self._recorded: Dict[str, List[Dict[str, Any]]] = {}
+        self._loaded: Dict[str, List[Dict[str, Any]]] = {}
+        self._replayed: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, f"{fingerprint}.json")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await request.aread()
+        fingerprint = request_fingerprint(request)
+        if self.mode == "replay":
+            return await self._replay(fingerprint, request)
+
+        started = time.monotonic()
+        response = await self.inner.handle_async_request(request)
+        first_byte = time.monotonic() - started
+
+        async def save(chunks: Chunks, complete: bool) -> None:
+            await self._save(fingerprint, request, response, first_byte, chunks, complete)
+
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response.stream, save),
+            extensions=response.extensions,
+        )
+
+    async def _save(
+        self,
+        fingerprint: str,
+        request: httpx.Request,
+        response: httpx.Response,
+        first_byte: float,
+        chunks: Chunks,
+        complete: bool,
+    ) -> None:
+        interaction = {
+            "request": {"method": request.method, "url": str(request.url)},
+            "response": {
+                "status_code": response.status_code,
+                "headers": [
+                    [name, value]
+                    for name, value in response.headers.multi_items()
+                    if name.lower() not in _SKIPPED_HEADERS
+                ],
+                "first_byte": first_byte,
+                "chunks": [[offset, base64.b64encode(chunk).decode()] for offset, chunk in chunks],
+                "complete": complete,
+            },
+        }
+        async with self._lock:
+            interactions = self._recorded.setdefault(fingerprint, [])
+            interactions.append(interaction)
+            await asyncio.to_thread(self._write, fingerprint, list(interactions))
+
+    def _write(self, fingerprint: str, interactions: List[Dict[str, Any]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._path(fingerprint) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(interactions, f)
+        os.replace(tmp_path, self._path(fingerprint))
+
+    def _read(self, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            with open(self._path(fingerprint), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    async def _replay(self, fingerprint: str, request: httpx.Request) -> httpx.Response:
+        async with self._lock:
+            if fingerprint not in self._loaded:
+                interactions = await asyncio.to_thread(self._read, fingerprint)
+                if not interactions:
+                    raise CassetteMissError(
+                        f"No recorded response for {request.method} {request.url}", request=request
+                    )
+                self._loaded[fingerprint] = interactions
+            interactions = self._loaded[fingerprint]
+            # Repeated requests get the recordings in order, then the last one again
+            index = min(self._replayed.get(fingerprint, 0), len(interactions) - 1)
+            self._replayed[fingerprint] = index + 1
+
+        recorded = interactions[index]["response"]
+        if self.replay_latency:
+            await asyncio.sleep(recorded["first_byte"])
+        chunks = [(offset, base64.b64decode(data)) for offset, data in recorded["chunks"]]
+        return httpx.Response(
+            status_code=recorded["status_code"],
+            headers=recorded["headers"],
+            stream=_ReplayStream(chunks, self.replay_latency),
+            request=request,
+        )
+
+    async def aclose(self) -> None:
+        await self.inner.aclose()
+
+
+def make_transport(limits: Optional[httpx.Limits] = None) -> Optional[httpx.AsyncBaseTransport]:
+    """
+    Transport for the OpenAI HTTP clients: a CassetteTransport when
+    ENGINE_CASSETTE_MODE is record or replay, otherwise None (httpx default).
+    """
+    mode = ENV_CONFIG.ENGINE_CASSETTE_MODE
+    if mode == "off":
+        return None
+    inner = httpx.AsyncHTTPTransport(limits=limits) if limits else httpx.AsyncHTTPTransport()
+    return CassetteTransport(
+        inner,
+        directory=ENV_CONFIG.ENGINE_CASSETTE_DIR or DEFAULT_CASSETTE_DIR,
+        mode=mode,
+        replay_latency=ENV_CONFIG.ENGINE_CASSETTE_REPLAY_LATENCY,
+    )
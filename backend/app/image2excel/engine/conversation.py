@@ -0,0 +1,76 @@
+"""
+Conversation state for correction iterations.
+
+Each correction is sent as a proper multi-turn exchange: the model's
+earlier output as assistant messages, each followed by the correction it
+received. Together with the image message this lets the model fix its own
+code instead of regenerating from scratch. The history is kept within a
+token budget by dropping the oldest turns; the latest turn is always kept.
+"""
+
+from typing import Any, Dict, List, Tuple
+
+from .messages import UserPrompt
+from .prompt import OUTPUT_MODE_JSON
+from .ratelimit import estimate_tokens
+
+
+def trim_error(error: str, max_chars: int) -> str:
+    """
+    Shorten an error message for a prompt. The first line (the summary)
+    and the end of the traceback, where the actual error is, are kept.
+    """
+    if len(error) <= max_chars:
+        return error
+    head, _, rest = error.partition("\n")
+    head = head[: max_chars // 2]
+    tail = rest[-(max_chars - len(head)) :]
+    # Start the tail on a line boundary
+    newline = tail.find("\n")
+    if 0 <= newline < len(tail) - 1:
+        tail = tail[newline + 1 :]
+    return f"{head}\n...\n{tail}"
+
+
+class Conversation:
+    """
+    Earlier assistant outputs and the corrections that followed them.
+    """
+
+    def __init__(self, token_budget: int, output_mode: str) -> None:
+        self.token_budget = token_budget
+        self.output_mode = output_mode
+        self.turns: List[Tuple[str, UserPrompt]] = []
+
+    def add_turn(self, output: str, correction: UserPrompt) -> None:
+        """Record one model output and the correction sent in reply"""
+        self.turns.append((output, correction))
+
+    def _assistant_content(self, output: str) -> str:
+        if self.output_mode == OUTPUT_MODE_JSON:
+            return output
+        # Same shape the model produced, so it reads as its own answer
+        return f"```python\n{output}\n```"
+
+    def _turn_messages(self, turn: Tuple[str, UserPrompt]) -> List[Dict[str, Any]]:
+        output, correction = turn
+        return [
+            {"role": "assistant", "content": self._assistant_content(output)},
+            {"role": "user", "content": correction},
+        ]
+
+    def messages(self) -> List[Dict[str, Any]]:
+        """
+        History messages within the token budget, oldest first; the newest
+        correction is the last message.
+        """
+        kept: List[List[Dict[str, Any]]] = []
+        used = 0
+        for turn in reversed(self.turns):
+            turn_messages = self._turn_messages(turn)
+            tokens = estimate_tokens(turn_messages)
+            if kept and used + tokens > self.token_budget:
+                break
+            kept.append(turn_messages)
+            used += tokens
+        return [message for turn_messages in reversed(kept) for message in turn_messages]
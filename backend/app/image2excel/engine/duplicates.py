@@ -0,0 +1,211 @@
+"""
+Near-duplicate detection for uploaded images.
+
+Users re-upload the same table with a slightly different crop or
+compression, which changes the SHA-256 the response cache is keyed by.
+Perceptual hashes do not change much: a 64-bit dHash (brightness gradients
+of a 9x8 thumbnail) and a 64-bit pHash (signs of the low DCT frequencies of
+a 32x32 thumbnail) are computed at upload time. Converted images are kept
+per user in a BK-tree over the pHash, so the closest earlier conversion
+within a Hamming distance is found without comparing against every entry.
+The dHash is noisier under recompression and resizing, so it only has to
+agree within twice that distance.
+
+Tables with the same layout but different values can hash within a few
+bits of each other, so by default a match is only reported; reusing its
+DataFrame instead of calling the model is opt-in.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from backend.app.core.config import ENV_CONFIG
+
+HASH_SIZE = 8
+DCT_SIZE = 32
+
+
+@dataclass(frozen=True)
+class ImageHashes:
+    phash: int
+    dhash: int
+
+
+def _to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash of a (HASH_SIZE, HASH_SIZE + 1) grayscale thumbnail"""
+    return _to_int(gray[:, 1:] > gray[:, :-1])
+
+
+def _dct_matrix(size: int) -> np.ndarray:
+    k = np.arange(size)[:, None]
+    n = np.arange(size)[None, :]
+    return np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(gray: np.ndarray) -> int:
+    """Perceptual hash of a (DCT_SIZE, DCT_SIZE) grayscale thumbnail"""
+    low = (_DCT @ gray.astype(np.float64) @ _DCT.T)[:HASH_SIZE, :HASH_SIZE]
+    return _to_int(low > np.median(low))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance. Each
+    child hangs off its parent by its distance to it, so a search for keys
+    within `radius` of a query only descends into children whose edge
+    distance is within `radius` of the query's distance to the parent.
+    """
+
+    def __init__(self) -> None:
+        # node: [key, values, {distance: child}]
+        self._root: Optional[List[Any]] = None
+        self.size = 0
+
+    def add(self, key: int, value: Any) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, radius: int) -> List[Tuple[int, Any]]:
+        """(distance, value) of every entry within radius of key"""
+        found: List[Tuple[int, Any]] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= radius:
+                found.extend((distance, value) for value in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+@dataclass
+class DuplicateMatch:
+    task_id: str
+    distance: int  # pHash bits differing
+    dataframe: pd.DataFrame
+
+
+class DuplicateIndex:
+    """
+    Perceptual hashes of uploads (by SHA-256) and, per user, the tables of
+    the images converted so far, least recently used evicted first.
+    """
+
+    def __init__(self, max_distance: int, max_entries: int) -> None:
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self._uploads: "OrderedDict[str, ImageHashes]" = OrderedDict()
+        # (username, task_id) -> (hashes, dataframe)
+        self._results: "OrderedDict[Tuple[str, str], Tuple[ImageHashes, pd.DataFrame]]" = (
+            OrderedDict()
+        )
+        # Evicted entries stay in the trees until a rebuild and are skipped
+        self._trees: Dict[str, BKTree] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def remember_upload(self, sha256: str, hashes: ImageHashes) -> None:
+        self._uploads[sha256] = hashes
+        self._uploads.move_to_end(sha256)
+        while len(self._uploads) > self.max_entries:
+            self._uploads.popitem(last=False)
+
+    def hashes_for(self, sha256: str) -> Optional[ImageHashes]:
+        """Hashes computed when the file was uploaded, if still remembered"""
+        return self._uploads.get(sha256)
+
+    def record_result(
+        self, username: str, task_id: str, hashes: ImageHashes, dataframe: pd.DataFrame
+    ) -> None:
+        """Remember the table a task extracted from an image with these hashes"""
+        key = (username, task_id)
+        if key not in self._results:
+            self._trees.setdefault(username, BKTree()).add(hashes.phash, task_id)
+        self._results[key] = (hashes, dataframe)
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_entries:
+            (evicted, _), _ = self._results.popitem(last=False)
+            self._compact(evicted)
+
+    def forget_task(self, username: str, task_id: str) -> None:
+        if self._results.pop((username, task_id), None) is not None:
+            self._compact(username)
+
+    def find(self, username: str, hashes: ImageHashes) -> Optional[DuplicateMatch]:
+        """The user's closest converted image within max_distance, if any"""
+        tree = self._trees.get(username)
+        best: Optional[DuplicateMatch] = None
+        if tree is not None:
+            for distance, task_id in tree.search(hashes.phash, self.max_distance):
+                result = self._results.get((username, task_id))
+                if result is None:
+                    continue
+                known, dataframe = result
+                if hamming(hashes.dhash, known.dhash) > 2 * self.max_distance:
+                    continue
+                if best is None or distance < best.distance:
+                    best = DuplicateMatch(task_id, distance, dataframe)
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._results.move_to_end((username, best.task_id))
+        return best
+
+    def _compact(self, username: str) -> None:
+        """Rebuild a user's tree once most of its entries were evicted"""
+        tree = self._trees[username]
+        live = [
+            (task_id, hashes)
+            for (user, task_id), (hashes, _) in self._results.items()
+            if user == username
+        ]
+        if tree.size <= 2 * len(live) + 16:
+            return
+        rebuilt = BKTree()
+        for task_id, hashes in live:
+            rebuilt.add(hashes.phash, task_id)
+        self._trees[username] = rebuilt
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "uploads": len(self._uploads),
+            "results": len(self._results),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+duplicate_index = DuplicateIndex(
+    ENV_CONFIG.ENGINE_NEAR_DUPLICATE_DISTANCE, ENV_CONFIG.ENGINE_NEAR_DUPLICATE_MAX_ENTRIES
+)
@@ -0,0 +1,318 @@
+"""
+Pool of OpenAI-compatible endpoints with health-weighted load balancing.
+
+Endpoints come from OPENAI_ENDPOINTS (falling back to OPENAI_BASE_URL /
+OPENAI_API_KEY). Each request picks an endpoint at random, weighted by its
+configured weight and a health score built from recent success and
+latency. Every endpoint has a circuit breaker: after repeated failures it
+is skipped outright until a cool-down passes, then a single trial request
+decides whether it rejoins the pool. Base URLs can point at local stub
+servers (e.g. http://127.0.0.1:8001/v1) for testing, and ENGINE_CASSETTE_MODE
+records or replays all endpoint traffic (see cassette.py).
+"""
+
+import asyncio
+import json
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from backend.app.core.config import ENV_CONFIG
+from .cassette import cassette_miss, make_transport
+
+
+class NoHealthyEndpointError(Exception):
+    """Raised when every endpoint's circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open circuit breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        # Number of the half-open trial in flight, if any
+        self._trial: Optional[int] = None
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now (claims the half-open trial slot)"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self._trial = None
+        if self._trial is not None:
+            return False
+        self._trials += 1
+        self._trial = self._trials
+        return True
+
+    def available(self) -> bool:
+        """Like allow(), without claiming anything"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            return time.monotonic() - self._opened_at >= self.reset_timeout
+        return self._trial is None
+
+    @property
+    def trial(self) -> Optional[int]:
+        """
+        The half-open trial in flight. Read right after a successful allow(),
+        it tells whether that request is the trial.
+        """
+        return self._trial
+
+    def release_trial(self, trial: Optional[int]) -> None:
+        """Give back a half-open trial slot that ended without a verdict"""
+        if trial is not None and trial == self._trial:
+            self._trial = None
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self._failures = 0
+        self._trial = None
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial = None
+        if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+
+class Endpoint:
+    """
+    One OpenAI-compatible endpoint and its health bookkeeping.
+    """
+
+    # Smoothing factor of the success and latency moving averages
+    ALPHA = 0.2
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: Optional[str],
+        weight: float,
+        http_client: httpx.AsyncClient,
+        breaker: CircuitBreaker,
+    ) -> None:
+        self.name = name
+        self.base_url = base_url
+        self.weight = weight
+        self.breaker = breaker
+        self.success_score = 1.0
+        self.latency_ewma: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+        self.client = AsyncOpenAI(
+            api_key=api_key or "EMPTY",
+            base_url=base_url,
+            http_client=http_client,
+            # Retries are handled by with_retries so they respect the shared limiter
+            max_retries=0,
+        )
+
+    @property
+    def health(self) -> float:
+        """Score in (0, 1]: recent success rate, discounted for slowness"""
+        latency_penalty = 1.0 + (self.latency_ewma or 0.0) / 30.0
+        return max(0.01, self.success_score) / latency_penalty
+
+    def record_success(self, latency: float) -> None:
+        self.requests += 1
+        self.success_score += self.ALPHA * (1.0 - self.success_score)
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma += self.ALPHA * (latency - self.latency_ewma)
+        self.breaker.record_success()
+
+    def record_failure(self) -> None:
+        self.requests += 1
+        self.failures += 1
+        self.success_score -= self.ALPHA * self.success_score
+        self.breaker.record_failure()
+
+    def record_reachable(self) -> None:
+        """The endpoint answered, though with an error that is not its fault"""
+        self.requests += 1
+        self.breaker.record_success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "weight": self.weight,
+            "health": round(self.health, 3),
+            "latency_ewma": self.latency_ewma,
+            "circuit": self.breaker.state,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+def is_endpoint_failure(error: Exception) -> bool:
+    """Errors that say something about the endpoint's health (not 4xx / quota)"""
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+class EndpointPool:
+    """
+    Weighted, health-aware selection over the configured endpoints.
+    """
+
+    def __init__(self, configs: List[Dict[str, Any]]) -> None:
+        self._configs = configs
+        self._endpoints: Optional[List[Endpoint]] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        if self._endpoints is None:
+            # Shared so every endpoint draws from one keep-alive connection pool
+            limits = httpx.Limits(
+                max_connections=ENV_CONFIG.OPENAI_MAX_CONNECTIONS,
+                max_keepalive_connections=ENV_CONFIG.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=ENV_CONFIG.OPENAI_KEEPALIVE_EXPIRY,
+            )
+            timeout = httpx.Timeout(ENV_CONFIG.OPENAI_TIMEOUT, connect=10.0)
+            transport = make_transport(limits)
+            if transport is not None:
+                # httpx ignores `limits` once a transport is given; the cassette's inner transport has them
+                self._http_client = DefaultAsyncHttpxClient(transport=transport, timeout=timeout)
+            else:
+                self._http_client = DefaultAsyncHttpxClient(limits=limits, timeout=timeout)
+            self._endpoints = [
+                Endpoint(
+                    name=config.get("name") or f"endpoint_{i}",
+                    base_url=config["base_url"],
+                    api_key=config.get("api_key"),
+                    weight=float(config.get("weight", 1.0)),
+                    http_client=self._http_client,
+                    breaker=CircuitBreaker(
+                        failure_threshold=ENV_CONFIG.ENDPOINT_FAILURE_THRESHOLD,
+                        reset_timeout=ENV_CONFIG.ENDPOINT_RESET_TIMEOUT,
+                    ),
+                )
+                for i, config in enumerate(self._configs)
+            ]
+        return self._endpoints
+
+    def pick(self, exclude: Optional[Endpoint] = None) -> Endpoint:
+        """
+        Choose an endpoint for one request, claiming its half-open trial
+        slot if it has one; attempt() makes sure the claim gets a verdict.
+        `exclude` is avoided when any alternative is available.
+
+        Raises:
+            NoHealthyEndpointError: If every circuit is open
+        """
+        candidates = [e for e in self.endpoints if e.breaker.available()]
+        if exclude is not None and len(candidates) > 1:
+            candidates = [e for e in candidates if e is not exclude]
+        while candidates:
+            weights = [e.weight * e.health for e in candidates]
+            endpoint = random.choices(candidates, weights=weights)[0]
+            if endpoint.breaker.allow():
+                return endpoint
+            candidates.remove(endpoint)
+        raise NoHealthyEndpointError("所有模型端点均不可用 (熔断中)")
+
+    @asynccontextmanager
+    async def attempt(self, exclude: Optional[Endpoint] = None) -> AsyncIterator[Endpoint]:
+        """
+        Pick an endpoint for one request and feed the outcome back into its
+        health score and circuit breaker. A cancelled request says nothing
+        about the endpoint; it only gives back the half-open trial if it
+        held it.
+        """
+        endpoint = self.pick(exclude=exclude)
+        trial = endpoint.breaker.trial
+        started = time.monotonic()
+        try:
+            yield endpoint
+        except asyncio.CancelledError:
+            endpoint.breaker.release_trial(trial)
+            raise
+        except Exception as e:
+            miss = cassette_miss(e)
+            if miss is not None:
+                # Nothing reached the endpoint; surface the miss itself instead
+                # of the SDK's connection error, which would be retried
+                endpoint.breaker.release_trial(trial)
+                raise miss from None
+            if is_endpoint_failure(e):
+                endpoint.record_failure()
+            else:
+                endpoint.record_reachable()
+            raise
+        endpoint.record_success(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {e.name: e.stats() for e in self.endpoints}
+
+    async def aclose(self) -> None:
+        """Release pooled connections; clients are rebuilt on next use"""
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._endpoints = None
+
+
+def load_endpoint_configs() -> List[Dict[str, Any]]:
+    """
+    Read OPENAI_ENDPOINTS, a JSON list of
+    {"name", "base_url", "api_key" | "api_key_env", "weight"} objects.
+    """
+    raw = ENV_CONFIG.OPENAI_ENDPOINTS
+    if not raw:
+        return [
+            {
+                "name": "default",
+                "base_url": ENV_CONFIG.OPENAI_BASE_URL,
+                "api_key": ENV_CONFIG.OPENAI_API_KEY,
+                "weight": 1.0,
+            }
+        ]
+    try:
+        configs = json.loads(raw)
+    except json.JSONDecodeError:
+        raise ValueError("OPENAI_ENDPOINTS must be a JSON list")
+    if not isinstance(configs, list) or not configs:
+        raise ValueError("OPENAI_ENDPOINTS must be a non-empty JSON list")
+    for config in configs:
+        if "base_url" not in config:
+            raise ValueError("Every OPENAI_ENDPOINTS entry needs a base_url")
+        if not config.get("api_key"):
+            config["api_key"] = (
+                os.getenv(config["api_key_env"])
+                if config.get("api_key_env")
+                else ENV_CONFIG.OPENAI_API_KEY
+            )
+    return configs
+
+
+endpoint_pool = EndpointPool(load_endpoint_configs())
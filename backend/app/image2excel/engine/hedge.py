@@ -0,0 +1,203 @@
+"""
+Hedged requests against tail latency.
+
+A rolling latency histogram is kept per model, of the time from sending a
+request to its response (or, when streaming, to the first token). Waits on
+the rate limiter and retry backoff are left out, as a duplicate would only
+queue behind them. When a request has not responded by the configured
+percentile of recent latencies, a duplicate is fired (optionally to
+another model); whichever succeeds first is used and the other one is
+cancelled. The threshold follows the histogram, so it tunes itself as
+provider latency drifts.
+"""
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from backend.app.core.config import ENV_CONFIG
+
+T = TypeVar("T")
+
+
+class LatencyHistogram:
+    """Rolling window of request latencies in seconds"""
+
+    def __init__(self, window: int = 500) -> None:
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        """Nearest-rank percentile (pct in 0-100), None without samples"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        rank = max(1, math.ceil(pct / 100 * len(ordered)))
+        return ordered[rank - 1]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": len(self._samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class HedgeClock:
+    """
+    Times the HTTP call of one hedged attempt. The attempt calls `start()`
+    once the rate limiter has admitted it, `respond()` when the response (or
+    a stream's first token) arrives and `stop()` when the call fails and it
+    backs off before a retry, so only time spent waiting on the provider is
+    measured.
+    """
+
+    def __init__(self) -> None:
+        self.started: Optional[float] = None
+        self.latency: Optional[float] = None
+        self._changed = asyncio.Event()
+
+    def start(self) -> None:
+        self.started = time.monotonic()
+        self._changed.set()
+
+    def respond(self) -> None:
+        if self.started is not None and self.latency is None:
+            self.latency = self.elapsed()
+            self._changed.set()
+
+    def stop(self) -> None:
+        self.started = None
+        self._changed.set()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    async def changed(self) -> None:
+        await self._changed.wait()
+        self._changed.clear()
+
+
+class HedgePolicy:
+    """
+    Tracks per-model latency and decides when to send a hedge.
+    """
+
+    def __init__(self, percentile: float, min_samples: int, min_delay: float) -> None:
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self.hedges_sent = 0
+        self.hedges_won = 0
+
+    def histogram(self, model: str) -> LatencyHistogram:
+        if model not in self._histograms:
+            self._histograms[model] = LatencyHistogram()
+        return self._histograms[model]
+
+    def hedge_after(self, model: str) -> Optional[float]:
+        """Seconds to wait before hedging, None until enough samples exist"""
+        histogram = self.histogram(model)
+        if len(histogram) < self.min_samples:
+            return None
+        return max(self.min_delay, histogram.percentile(self.percentile))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "hedges_sent": self.hedges_sent,
+            "hedges_won": self.hedges_won,
+            "models": {
+                model: {**histogram.summary(), "hedge_after": self.hedge_after(model)}
+                for model, histogram in self._histograms.items()
+            },
+        }
+
+    async def run(
+        self,
+        model: str,
+        primary: Callable[[HedgeClock], Awaitable[T]],
+        backup: Callable[[HedgeClock], Awaitable[T]],
+        backup_model: Optional[str] = None,
+    ) -> T:
+        """
+        Run `primary`, launching `backup` if its HTTP call has gone longer
+        than the hedge threshold without a response. Returns the first
+        successful result; if both fail, the primary's error is raised.
+        Whatever is still running when this returns or is cancelled gets
+        cancelled.
+        """
+        backup_model = backup_model or model
+        primary_clock = HedgeClock()
+        primary_task = asyncio.ensure_future(primary(primary_clock))
+        clocks: Dict[asyncio.Future, Tuple[str, HedgeClock]] = {
+            primary_task: (model, primary_clock)
+        }
+        pending = {primary_task}
+        try:
+            delay = self.hedge_after(model)
+            if delay is not None and await self._overdue(primary_task, primary_clock, delay):
+                self.hedges_sent += 1
+                backup_clock = HedgeClock()
+                backup_task = asyncio.ensure_future(backup(backup_clock))
+                clocks[backup_task] = (backup_model, backup_clock)
+                pending.add(backup_task)
+
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for finished in done:
+                    if finished.exception() is not None:
+                        continue
+                    if finished is not primary_task:
+                        self.hedges_won += 1
+                    return finished.result()
+            # Both failed
+            return primary_task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            for task, (task_model, clock) in clocks.items():
+                if clock.latency is not None:
+                    self.histogram(task_model).record(clock.latency)
+                elif task is primary_task and clock.started is not None:
+                    # A slow primary still tells us how long the tail really is
+                    self.histogram(task_model).record(clock.elapsed())
+
+    @staticmethod
+    async def _overdue(task: asyncio.Future, clock: "HedgeClock", delay: float) -> bool:
+        """
+        Wait until `task` finishes or responds, or until its HTTP call has
+        been in flight for `delay` seconds (True). Time spent waiting on the
+        rate limiter or backing off between retries does not count.
+        """
+        while not task.done() and clock.latency is None:
+            timeout = None
+            if clock.started is not None:
+                timeout = delay - clock.elapsed()
+                if timeout <= 0:
+                    return True
+            changed = asyncio.ensure_future(clock.changed())
+            try:
+                await asyncio.wait(
+                    {task, changed}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                changed.cancel()
+        return False
+
+
+hedge_policy = HedgePolicy(
+    percentile=ENV_CONFIG.ENGINE_HEDGE_PERCENTILE,
+    min_samples=ENV_CONFIG.ENGINE_HEDGE_MIN_SAMPLES,
+    min_delay=ENV_CONFIG.ENGINE_HEDGE_MIN_DELAY,
+)
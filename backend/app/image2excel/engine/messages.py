@@ -0,0 +1,70 @@
+"""
+Chat message layout tuned for provider-side prompt caching.
+
+Providers reuse the longest prefix of a request that they have recently
+seen, so every request is assembled from the most to the least stable part:
+
+    1. the versioned system prompt   (same for every task of an output mode)
+    2. the output examples           (same for every task of an output mode)
+    3. the image message             (same for every iteration of a task)
+    4. earlier turns of the task     (grows by one turn per iteration)
+    5. volatile text, e.g. corrections (changes every iteration)
+
+Nothing that varies between calls may appear before the image, otherwise
+the cached prefix ends right there.
+"""
+
+from typing import Any, Dict, List, Optional, Union
+
+# Plain text, or a list of chat content parts (text and image_url)
+UserPrompt = Union[str, List[Dict[str, Any]]]
+
+
+def build_messages(
+    system_prompt: str,
+    examples: Optional[str],
+    image_prompt: Optional[UserPrompt],
+    user_prompt: Optional[UserPrompt] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Lay out one request's messages, stable prefix first.
+
+    Args:
+        system_prompt: Versioned system prompt
+        examples: Output examples, sent as a second developer message
+        image_prompt: The image message of the task (instruction and image)
+        user_prompt: Volatile text of this iteration, always last
+        history: Earlier assistant / user turns, placed after the image
+    """
+    if not (image_prompt or history or user_prompt):
+        raise ValueError("A request needs an image prompt, history or a user prompt")
+    messages: List[Dict[str, Any]] = [{"role": "developer", "content": system_prompt}]
+    if examples:
+        messages.append({"role": "developer", "content": examples})
+    if image_prompt:
+        messages.append({"role": "user", "content": image_prompt})
+    if history:
+        messages.extend(history)
+    if user_prompt:
+        messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def request_prompt(
+    image_prompt: Optional[UserPrompt],
+    user_prompt: Optional[UserPrompt],
+    history: Optional[List[Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Everything a request sends besides the system prompt and examples, as
+    one list of content parts; used for cache keys and token estimates.
+    """
+    parts: List[Dict[str, Any]] = []
+    prompts = [image_prompt] + [m["content"] for m in history or []] + [user_prompt]
+    for prompt in prompts:
+        if isinstance(prompt, str):
+            parts.append({"type": "text", "text": prompt})
+        elif prompt:
+            parts.extend(prompt)
+    return parts
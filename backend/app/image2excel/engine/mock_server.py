@@ -0,0 +1,376 @@
+"""
+Local OpenAI-compatible stub of the chat completions API, for load tests.
+
+Answers /v1/chat/completions (streaming and not, code and JSON output
+modes, packed images, n > 1, truncation continuations) with canned table
+code built from fixture tables, picked by a hash of the request's image so
+the same image always yields the same table. Latency and faults are
+injected on purpose: a sampled time to first token, a token rate for the
+body, and configurable shares of 500s, 429s (with Retry-After and
+x-ratelimit-* headers), truncated outputs and broken code. Point
+OPENAI_BASE_URL (or an OPENAI_ENDPOINTS entry) at it to stress the task
+manager, retries and timeouts with no network:
+
+    python -m backend.app.image2excel.engine.mock_server --port 8001 \\
+        --latency lognormal:0.5,0.8 --error-rate 0.05 --rate-limit-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1
+
+GET /stats reports what was served; POST /stats/reset clears it.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from .packing import SECTION_PATTERN
+from .prompt import CONTINUATION_PROMPT_PREFIX, get_json_table_prompt
+
+# Rough characters per token of table code, for usage and max token limits
+CHARS_PER_TOKEN = 3
+# Prompt tokens billed per image part
+IMAGE_TOKENS = 765
+# Characters per streamed chunk
+STREAM_CHUNK_CHARS = 16
+
+Table = Dict[str, Any]  # {"columns": [{"name", "dtype"}], "rows": [[...]]}
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Build a latency sampler from "fixed:S", "uniform:LO,HI",
+    "exponential:MEAN" or "lognormal:MU,SIGMA" (seconds).
+    """
+    kind, _, args = spec.partition(":")
+    params = [float(p) for p in args.split(",") if p]
+    if kind == "fixed" and len(params) == 1:
+        return lambda rng: params[0]
+    if kind == "uniform" and len(params) == 2:
+        return lambda rng: rng.uniform(params[0], params[1])
+    if kind == "exponential" and len(params) == 1:
+        return lambda rng: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    if kind == "lognormal" and len(params) == 2:
+        return lambda rng: rng.lognormvariate(params[0], params[1])
+    raise ValueError(f"Invalid latency spec: {spec}")
+
+
+def synthetic_table(rows: int, columns: int, seed: int) -> Table:
+    """A deterministic table with a mix of column types"""
+    rng = random.Random(seed)
+    kinds = ["string", "integer", "number", "date", "boolean"]
+    spec = [{"name": f"列{i + 1}", "dtype": kinds[i % len(kinds)]} for i in range(columns)]
+    data = []
+    for r in range(rows):
+        row: List[Any] = []
+        for column in spec:
+            dtype = column["dtype"]
+            if rng.random() < 0.03:
+                row.append(None)
+            elif dtype == "string":
+                row.append(f"项目{r + 1}-{rng.choice('ABCDEFGH')}")
+            elif dtype == "integer":
+                row.append(rng.randint(0, 10000))
+            elif dtype == "number":
+                row.append(round(rng.uniform(0, 10000), 2))
+            elif dtype == "date":
+                row.append(f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}")
+            else:
+                row.append(rng.random() < 0.5)
+        data.append(row)
+    return {"columns": spec, "rows": data}
+
+
+def table_code(table: Table) -> str:
+    """Render a fixture table as the code block the real model would answer with"""
+    lines = ["```python", "import pandas as pd", "", "data = {"]
+    for i, column in enumerate(table["columns"]):
+        values = ", ".join(repr(row[i]) for row in table["rows"])
+        lines.append(f"    {column['name']!r}: [{values}],")
+    lines += ["}", "", "df = pd.DataFrame(data)", "```"]
+    return "\n".join(lines)
+
+
+def table_json(table: Table) -> str:
+    return json.dumps(table, ensure_ascii=False)
+
+
+def _text_of(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    return "\n".join(p.get("text", "") for p in content or [] if isinstance(p, dict))
+
+
+def _images_of(messages: List[Dict[str, Any]]) -> List[str]:
+    return [
+        part["image_url"]["url"]
+        for message in messages
+        if isinstance(message.get("content"), list)
+        for part in message["content"]
+        if isinstance(part, dict) and part.get("type") == "image_url"
+    ]
+
+
+def _estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    text = sum(len(_text_of(m.get("content"))) for m in messages)
+    return text // CHARS_PER_TOKEN + IMAGE_TOKENS * len(_images_of(messages))
+
+
+@dataclass
+class MockSettings:
+    latency: Callable[[random.Random], float] = field(default_factory=lambda: parse_latency("fixed:0"))
+    tokens_per_second: float = 0.0  # 0 sends the body at once
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    truncate_rate: float = 0.0
+    broken_rate: float = 0.0
+    seed: Optional[int] = None
+
+
+class MockModel:
+    """
+    Decides what one chat completion request gets back.
+    """
+
+    def __init__(self, fixtures: List[Table], settings: MockSettings) -> None:
+        if not fixtures:
+            raise ValueError("At least one fixture table is required")
+        self.fixtures = fixtures
+        self.settings = settings
+        self.rng = random.Random(settings.seed)
+        self.stats: Counter = Counter()
+
+    def fixture_for(self, image_url: str) -> Table:
+        digest = hashlib.sha256(image_url.encode("utf-8")).digest()
+        return self.fixtures[int.from_bytes(digest[:4], "big") % len(self.fixtures)]
+
+    def full_text(self, body: Dict[str, Any]) -> str:
+        """The complete answer to a request, before truncation or faults"""
+        messages = body.get("messages", [])
+        images = _images_of(messages) or [""]
+        # Continuations drop response_format, the system prompt still tells
+        json_mode = (body.get("response_format") or {}).get("type") in ("json_object", "json_schema") or any(
+            _text_of(m.get("content")) == get_json_table_prompt() for m in messages
+        )
+        if json_mode:
+            return table_json(self.fixture_for(images[0]))
+        packed = any(
+            SECTION_PATTERN.search(_text_of(m.get("content"))) for m in messages if m.get("role") == "user"
+        )
+        if len(images) > 1 and packed:
+            return "\n\n".join(
+                f"### 图片 {i}\n{table_code(self.fixture_for(url))}"
+                for i, url in enumerate(images, start=1)
+            )
+        return table_code(self.fixture_for(images[0]))
+
+    def answer(self, body: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Returns:
+            (text, finish_reason) for one choice
+        """
+        messages = body.get("messages", [])
+        text = self.full_text(body)
+        last = messages[-1] if messages else {}
+        if (
+            len(messages) >= 2
+            and last.get("role") == "user"
+            and _text_of(last.get("content")).startswith(CONTINUATION_PROMPT_PREFIX)
+            and messages[-2].get("role") == "assistant"
+        ):
+            # Resume right where the partial output ended
+            partial = _text_of(messages[-2].get("content"))
+            text = text[len(partial):] if text.startswith(partial) else text
+            self.stats["continuations"] += 1
+        elif self.rng.random() < self.settings.broken_rate:
+            text = text.replace("df = pd.DataFrame(data)", "df = pd.DataFrame(dat)")
+            self.stats["broken"] += 1
+
+        limit = body.get("max_completion_tokens") or body.get("max_tokens")
+        if limit and len(text) > limit * CHARS_PER_TOKEN:
+            self.stats["truncated"] += 1
+            return text[: limit * CHARS_PER_TOKEN], "length"
+        if len(text) > 40 and self.rng.random() < self.settings.truncate_rate:
+            self.stats["truncated"] += 1
+            return text[: self.rng.randint(len(text) // 4, len(text) * 3 // 4)], "length"
+        return text, "stop"
+
+    def fault(self) -> Optional[JSONResponse]:
+        """An injected error response, or None to answer normally"""
+        roll = self.rng.random()
+        if roll < self.settings.rate_limit_rate:
+            self.stats["rate_limited"] += 1
+            retry_after = self.settings.retry_after
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}},
+                status_code=429,
+                headers={
+                    "retry-after": f"{retry_after:g}",
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{retry_after:g}s",
+                },
+            )
+        if roll < self.settings.rate_limit_rate + self.settings.error_rate:
+            self.stats["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Internal server error (mock)", "type": "server_error", "code": None}},
+                status_code=500,
+            )
+        return None
+
+    def body_delay(self, text: str) -> float:
+        if self.settings.tokens_per_second <= 0:
+            return 0.0
+        return len(text) / CHARS_PER_TOKEN / self.settings.tokens_per_second
+
+
+def create_app(fixtures: List[Table], settings: MockSettings) -> FastAPI:
+    """Build the stub server around a fixture set and fault settings"""
+    app = FastAPI(title="image2excel mock model")
+    model = MockModel(fixtures, settings)
+    in_flight = 0
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        nonlocal in_flight
+        body = await request.json()
+        model.stats["requests"] += 1
+        in_flight += 1
+        model.stats["max_in_flight"] = max(model.stats["max_in_flight"], in_flight)
+        try:
+            await asyncio.sleep(settings.latency(model.rng))
+            fault = model.fault()
+            if fault is not None:
+                return fault
+
+            messages = body.get("messages", [])
+            answers = [model.answer(body) for _ in range(max(1, int(body.get("n") or 1)))]
+            usage = {
+                "prompt_tokens": _estimate_prompt_tokens(messages),
+                "completion_tokens": sum(math.ceil(len(t) / CHARS_PER_TOKEN) for t, _ in answers),
+            }
+            usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+            completion_id = f"chatcmpl-mock-{uuid.uuid4().hex[:12]}"
+            name = body.get("model", "mock")
+            model.stats["completed"] += 1
+
+            if body.get("stream"):
+                include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+                return StreamingResponse(
+                    _stream(model, completion_id, name, answers, usage if include_usage else None),
+                    media_type="text/event-stream",
+                )
+
+            await asyncio.sleep(model.body_delay("".join(t for t, _ in answers)))
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": name,
+                "choices": [
+                    {
+                        "index": i,
+                        "message": {"role": "assistant", "content": text},
+                        "finish_reason": finish_reason,
+                    }
+                    for i, (text, finish_reason) in enumerate(answers)
+                ],
+                "usage": usage,
+            }
+        finally:
+            in_flight -= 1
+
+    @app.get("/v1/models")
+    async def list_models():
+        return {"object": "list", "data": [{"id": "mock", "object": "model", "owned_by": "mock"}]}
+
+    @app.get("/stats")
+    async def stats():
+        return {**dict(model.stats), "in_flight": in_flight}
+
+    @app.post("/stats/reset")
+    async def reset_stats():
+        model.stats.clear()
+        return {"success": True}
+
+    return app
+
+
+async def _stream(
+    model: MockModel,
+    completion_id: str,
+    name: str,
+    answers: List[Tuple[str, str]],
+    usage: Optional[Dict[str, int]],
+) -> AsyncIterator[bytes]:
+    def event(choices: List[Dict[str, Any]], **extra: Any) -> bytes:
+        chunk = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": name,
+            "choices": choices,
+            **extra,
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+    for index, (text, finish_reason) in enumerate(answers):
+        for start in range(0, len(text), STREAM_CHUNK_CHARS):
+            piece = text[start : start + STREAM_CHUNK_CHARS]
+            await asyncio.sleep(model.body_delay(piece))
+            yield event([{"index": index, "delta": {"content": piece}, "finish_reason": None}])
+        yield event([{"index": index, "delta": {}, "finish_reason": finish_reason}])
+    if usage is not None:
+        yield event([], usage=usage)
+    yield b"data: [DONE]\n\n"
+
+
+def load_fixtures(path: Optional[str], sizes: str) -> List[Table]:
+    """Tables from a JSON file (a list of {columns, rows}), or synthetic ones of the given ROWSxCOLS sizes"""
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    tables = []
+    for i, size in enumerate(s for s in sizes.split(",") if s):
+        rows, _, columns = size.partition("x")
+        tables.append(synthetic_table(int(rows), int(columns), seed=i))
+    return tables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--fixtures", help="JSON file with a list of {columns, rows} tables")
+    parser.add_argument("--table-sizes", default="5x3,20x4,60x6,200x8", help="synthetic fixtures, ROWSxCOLS")
+    parser.add_argument("--latency", default="fixed:0", help="time to first token: fixed:S, uniform:LO,HI, exponential:MEAN, lognormal:MU,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="output speed, 0 for instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--truncate-rate", type=float, default=0.0, help="share of outputs cut off with finish_reason=length")
+    parser.add_argument("--broken-rate", type=float, default=0.0, help="share of outputs whose code fails to run")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    settings = MockSettings(
+        latency=parse_latency(args.latency),
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+        truncate_rate=args.truncate_rate,
+        broken_rate=args.broken_rate,
+        seed=args.seed,
+    )
+    uvicorn.run(create_app(load_fixtures(args.fixtures, args.table_sizes), settings), host=args.host, port=args.port)
@@ -0,0 +1,234 @@
+"""
+Micro-batching of small images into shared model calls.
+
+Screenshots of tiny tables cost far more in per-request overhead (system
+prompt, examples, round trip) than in actual output. First-iteration
+requests for small images are therefore held for up to a short wait
+window; up to `max_images` of them from the same user with the same model
+and system prompt are sent as one request, each image preceded by a
+numbered delimiter. The response is split on those delimiters and every
+caller gets its own code back. Images of different users never share a
+call, and a response whose sections are not exactly 1..N in order, each
+with a code block, is discarded and every image retried on its own, so a
+skipped or misnumbered section cannot hand one image's table to another.
+Packing is opt-in (ENGINE_PACK_IMAGES > 1) since it delays requests by up
+to the wait window.
+"""
+
+import asyncio
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.app.core.config import ENV_CONFIG
+from .cache import make_cache_key, response_cache
+from .messages import UserPrompt, request_prompt
+from .parser import FENCE, extract_code
+from .prompt import OUTPUT_MODE_CODE, get_packed_user_prompt
+from .request import DEFAULT_MODEL, prompt_version, send_request
+
+# Heading that starts each image's section of a packed response
+SECTION_PATTERN = re.compile(r"^#+\s*图片\s*(\d+)\s*$", re.MULTILINE)
+
+
+def split_packed_response(text: str, count: int) -> List[str]:
+    """
+    Split a packed completion into per-image code.
+
+    Raises:
+        ValueError: if the sections are not numbered exactly 1..count in
+        order, or one of them has no code block
+    """
+    matches = list(SECTION_PATTERN.finditer(text))
+    numbers = [int(match.group(1)) for match in matches]
+    if numbers != list(range(1, count + 1)):
+        raise ValueError(f"Packed response sections {numbers} do not match {count} images")
+    codes = []
+    for match, following in zip(matches, matches[1:] + [None]):
+        section = text[match.end() : following.start() if following else len(text)]
+        if FENCE not in section:
+            raise ValueError(f"Packed response section {match.group(1)} has no code block")
+        codes.append(extract_code(section))
+    if not all(codes):
+        raise ValueError("Packed response has an empty code block")
+    return codes
+
+
+def _share_usage(usage: Optional[Dict[str, int]], count: int) -> List[Optional[Dict[str, int]]]:
+    """
+    Split a packed call's tokens evenly across its images; the first one
+    also gets the remainders, so the shares add up to the call's usage.
+    """
+    if usage is None:
+        return [None] * count
+    shares = [{field: value // count for field, value in usage.items()} for _ in range(count)]
+    for field, value in usage.items():
+        shares[0][field] += value % count
+    return shares
+
+
+@dataclass
+class _PackedImage:
+    image_prompt: UserPrompt
+    future: asyncio.Future
+
+
+class ImagePacker:
+    """
+    Collects small-image requests and sends them in packs.
+    """
+
+    def __init__(self, max_images: int, max_wait: float) -> None:
+        self.max_images = max_images
+        self.max_wait = max_wait
+        # (username, model, system prompt) -> images waiting to be sent together
+        self._pending: Dict[Tuple[str, str, str], List[_PackedImage]] = {}
+        self._timers: Dict[Tuple[str, str, str], asyncio.Task] = {}
+        self.packs_sent = 0
+        self.packs_rejected = 0
+        self.images_packed = 0
+
+    async def submit(
+        self, image_prompt: UserPrompt, system_prompt: str, model: str, username: str
+    ) -> Dict[str, Any]:
+        """
+        Queue one image and wait for its share of a packed response,
+        shaped like a send_request() result. Only images of the same user
+        share a pack.
+        """
+        group = (username, model, system_prompt)
+        item = _PackedImage(image_prompt, asyncio.get_running_loop().create_future())
+        self._pending.setdefault(group, []).append(item)
+        if len(self._pending[group]) >= self.max_images:
+            # Taken right away, so later submits start a new pack
+            asyncio.ensure_future(self._send(group, self._take(group)))
+        elif group not in self._timers:
+            self._timers[group] = asyncio.ensure_future(self._flush_after(group))
+        return await item.future
+
+    async def _flush_after(self, group: Tuple[str, str, str]) -> None:
+        await asyncio.sleep(self.max_wait)
+        self._timers.pop(group, None)
+        await self._send(group, self._take(group))
+
+    def _take(self, group: Tuple[str, str, str]) -> List[_PackedImage]:
+        """Remove a group's waiting images and its timer"""
+        items = self._pending.pop(group, [])
+        timer = self._timers.pop(group, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        return items
+
+    async def _send(self, group: Tuple[str, str, str], items: List[_PackedImage]) -> None:
+        if not items:
+            return
+        _, model, system_prompt = group
+
+        if len(items) == 1:
+            await self._send_alone(items[0], system_prompt, model)
+            return
+
+        try:
+            images = [
+                part
+                for item in items
+                for part in item.image_prompt
+                if isinstance(part, dict) and part.get("type") == "image_url"
+            ]
+            response = await send_request(
+                system_prompt=system_prompt,
+                image_prompt=get_packed_user_prompt(images),
+                stream=False,
+                model=model,
+            )
+        except Exception as e:
+            for item in items:
+                if not item.future.done():
+                    item.future.set_exception(e)
+            return
+
+        try:
+            codes = split_packed_response(response.get("text", ""), len(items))
+        except ValueError:
+            # Sections cannot be trusted to belong to the right image
+            self.packs_rejected += 1
+            await asyncio.gather(*(self._send_alone(item, system_prompt, model) for item in items))
+            return
+
+        self.packs_sent += 1
+        self.images_packed += len(items)
+        shares = _share_usage(response.get("usage"), len(items))
+        for item, code, usage in zip(items, codes, shares):
+            if not item.future.done():
+                item.future.set_result(
+                    {
+                        "completion_id": response.get("completion_id"),
+                        "generated_code": code,
+                        "model": response.get("model", model),
+                        "usage": usage,
+                        "packed": len(items),
+                    }
+                )
+
+    async def _send_alone(self, item: _PackedImage, system_prompt: str, model: str) -> None:
+        try:
+            result = await send_request(
+                system_prompt=system_prompt, image_prompt=item.image_prompt, model=model
+            )
+        except Exception as e:
+            if not item.future.done():
+                item.future.set_exception(e)
+            return
+        if not item.future.done():
+            item.future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "packs_sent": self.packs_sent,
+            "packs_rejected": self.packs_rejected,
+            "images_packed": self.images_packed,
+            "waiting": sum(len(items) for items in self._pending.values()),
+        }
+
+
+async def send_packed_request(
+    image_prompt: UserPrompt,
+    system_prompt: str,
+    username: str,
+    image_hash: Optional[str] = None,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    First-iteration request for a small image, sent as part of a pack.
+    Uses the same response cache entry as the equivalent send_request().
+    """
+    model = model or DEFAULT_MODEL
+    cache_key = None
+    if image_hash and ENV_CONFIG.RESPONSE_CACHE_ENABLED:
+        cache_key = make_cache_key(
+            image_hash,
+            prompt_version(OUTPUT_MODE_CODE),
+            model,
+            request_prompt(image_prompt, None),
+        )
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cache_key": cache_key, "cached": True, "usage": None}
+
+    response = await image_packer.submit(image_prompt, system_prompt, model, username)
+    if cache_key and response.get("generated_code"):
+        await response_cache.set(
+            cache_key,
+            {
+                "completion_id": response.get("completion_id"),
+                "generated_code": response["generated_code"],
+            },
+        )
+        response = {**response, "cache_key": cache_key}
+    return response
+
+
+image_packer = ImagePacker(
+    max_images=ENV_CONFIG.ENGINE_PACK_IMAGES,
+    max_wait=ENV_CONFIG.ENGINE_PACK_MAX_WAIT,
+)
@@ -0,0 +1,184 @@
+"""
+Helpers for pulling generated code out of model completions.
+Supports both whole completions and token-by-token streams.
+"""
+
+import re
+from typing import Optional
+
+FENCE = "```"
+
+_FENCED_BLOCK = re.compile(r"```[\w+-]*[ \t]*\n(.*?)(?:```|\Z)", re.DOTALL)
+
+
+def extract_code(content: Optional[str]) -> str:
+    """
+    Return the first fenced code block of a completion, or the whole
+    completion stripped if the model did not use a fence.
+    """
+    if not content:
+        return ""
+    match = _FENCED_BLOCK.search(content)
+    if match:
+        return match.group(1).strip()
+    return content.strip()
+
+
+class CodeStreamParser:
+    """
+    Incremental parser for a streamed completion.
+
+    Feed it content deltas as they arrive; it tracks the code inside the
+    first fenced block, reports when the closing fence has been seen, and
+    keeps a rough count of table rows emitted so far (the largest number
+    of completed elements in any list literal of the generated code).
+
+    With fenced=False the whole completion is treated as the body (e.g. a
+    JSON payload) and only row counting applies.
+    """
+
+    def __init__(self, fenced: bool = True) -> None:
+        self.fenced = fenced
+        self._buffer = ""
+        self._code_start: Optional[int] = None if fenced else 0
+        self._code_end: Optional[int] = None
+
+        # Literal scanner state, only advanced over the code body
+        self._scan_pos = 0
+        self._quote: Optional[str] = None
+        self._escaped = False
+        self._in_comment = False
+        self._brackets: list = []  # open bracket chars
+        self._item_counts: list = []  # element count per open bracket
+        self._pending_item: list = []  # whether current element is non-empty
+        self.rows_seen = 0
+
+    @property
+    def closed(self) -> bool:
+        """True once the closing fence of the code block has been received"""
+        return self._code_end is not None
+
+    @property
+    def chars_seen(self) -> int:
+        return len(self._buffer)
+
+    @property
+    def code(self) -> str:
+        """Code received so far (complete once `closed` is True)"""
+        if self._code_start is None:
+            return ""
+        end = self._code_end if self._code_end is not None else len(self._buffer)
+        return self._buffer[self._code_start : end].strip()
+
+    def text(self) -> str:
+        """Raw completion text received so far"""
+        return self._buffer
+
+    def feed(self, delta: Optional[str]) -> bool:
+        """
+        Consume a content delta.
+
+        Returns:
+            True if the closing fence has now been seen and the stream can stop
+        """
+        if not delta or self.closed:
+            return self.closed
+        self._buffer += delta
+
+        if self._code_start is None:
+            fence = self._buffer.find(FENCE)
+            if fence == -1:
+                return False
+            newline = self._buffer.find("\n", fence)
+            if newline == -1:
+                # Language tag still arriving
+                return False
+            self._code_start = newline + 1
+            self._scan_pos = self._code_start
+
+        if not self.fenced:
+            self._scan(len(self._buffer))
+            return False
+
+        # Hold back a couple of chars so a fence split across deltas is found
+        closing = self._buffer.find(FENCE, max(self._code_start, self._scan_pos - 2))
+        scan_end = closing if closing != -1 else max(self._scan_pos, len(self._buffer) - 2)
+        self._scan(scan_end)
+        if closing != -1:
+            self._code_end = closing
+        return self.closed
+
+    def _scan(self, end: int) -> None:
+        buf = self._buffer
+        for i in range(self._scan_pos, end):
+            ch = buf[i]
+            if self._in_comment:
+                if ch == "\n":
+                    self._in_comment = False
+                continue
+            if self._quote is not None:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == self._quote:
+                    self._quote = None
+                continue
+
+            if ch in ("'", '"'):
+                self._quote = ch
+                self._mark_item()
+            elif ch == "#":
+                self._in_comment = True
+            elif ch in "[{(":
+                self._mark_item()
+                self._brackets.append(ch)
+                self._item_counts.append(0)
+                self._pending_item.append(False)
+            elif ch in "]})":
+                if self._brackets:
+                    opener = self._brackets.pop()
+                    count = self._item_counts.pop()
+                    if self._pending_item.pop():
+                        count += 1
+                    if opener == "[":
+                        self.rows_seen = max(self.rows_seen, count)
+            elif ch == ",":
+                if self._brackets and self._pending_item[-1]:
+                    self._item_counts[-1] += 1
+                    self._pending_item[-1] = False
+                    if self._brackets[-1] == "[":
+                        self.rows_seen = max(self.rows_seen, self._item_counts[-1])
+            elif not ch.isspace():
+                self._mark_item()
+        self._scan_pos = max(self._scan_pos, end)
+
+    def _mark_item(self) -> None:
+        if self._pending_item:
+            self._pending_item[-1] = True
+
+
+def stitch_continuation(previous: str, piece: str) -> str:
+    """
+    Join a truncated completion and the continuation the model produced
+    for it. Models sometimes re-open the code block or repeat the tail
+    they were cut off at; both are removed.
+    """
+    if previous.count(FENCE) % 2 == 1 and piece.lstrip().startswith(FENCE):
+        # Re-opened fence: drop the fence line
+        piece = piece.lstrip()
+        newline = piece.find("\n")
+        piece = piece[newline + 1 :] if newline != -1 else ""
+
+    # Exact repeat of the last characters
+    for size in range(min(len(previous), len(piece), 2000), 7, -1):
+        if previous.endswith(piece[:size]):
+            return previous + piece[size:]
+
+    # Restart of the line that was cut off
+    line_start = previous.rfind("\n") + 1
+    partial_line = previous[line_start:].strip()
+    if partial_line and piece.lstrip().startswith(partial_line):
+        return previous[:line_start] + piece.lstrip("\n")
+
+    return previous + piece
@@ -1,3 +1,49 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump whenever get_initial_prompt() or its examples change so cached
+# responses produced by an older prompt are no longer served.
+PROMPT_VERSION = "2"
+
+# Same, for get_json_table_prompt(), its examples and TABLE_JSON_SCHEMA
+JSON_PROMPT_VERSION = "2"
+
+OUTPUT_MODE_CODE = "code"
+OUTPUT_MODE_JSON = "json"
+
+TABLE_DTYPES = ["string", "integer", "number", "date", "boolean"]
+
+# Fixed start of every continuation prompt, whatever the row count
+CONTINUATION_PROMPT_PREFIX = "注意：上一次的输出因长度限制被截断"
+
+# Structured-output schema for the JSON table mode
+TABLE_JSON_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "columns": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "dtype": {"type": "string", "enum": TABLE_DTYPES},
+                },
+                "required": ["name", "dtype"],
+                "additionalProperties": False,
+            },
+        },
+        "rows": {
+            "type": "array",
+            "items": {
+                "type": "array",
+                "items": {"type": ["string", "number", "boolean", "null"]},
+            },
+        },
+    },
+    "required": ["columns", "rows"],
+    "additionalProperties": False,
+}
+
+
 def get_error_prompt(error_msg: str) -> str:
     """
     Generate a detailed prompt indicating that the previously generated code failed during execution,
@@ -20,28 +66,64 @@ def get_feedback_prompt(feedback: str) -> str:
     )
 
 
+def get_continuation_prompt(rows_done: int) -> str:
+    """
+    Ask the model to resume an output that was cut off by the token limit.
+    """
+    return (
+        f"{CONTINUATION_PROMPT_PREFIX}，已输出约 {rows_done} 行数据。\n"
+        f"请从第 {rows_done + 1} 行附近、紧接着截断处继续输出剩余内容。"
+        "不要重复已输出的内容，不要重新开始代码块，也不要添加任何解释。"
+    )
+
+
 def get_initial_prompt() -> str:
     """
     Return the initial prompt for the image-to-Excel task.
+    Kept compact and free of per-task content: it opens every request, so
+    it is part of the prefix the provider can cache. The output example
+    lives in get_prompt_examples().
     """
     return """
-你是一个专业的表格数据提取助手，专注于从图片中精准识别表格并生成对应的可直接运行的Pandas Dataframe代码表示。请遵循以下规则：
+你是表格数据提取助手：从图片中精准识别表格，生成可直接运行的Pandas DataFrame代码。
+
+# 规则
+1. 仅处理表格区域，表头与数据行对应正确；无明确列名时使用`Column_1, Column_2...`。
+2. 推断数据类型（数字、字符串、日期），日期统一为`YYYY-MM-DD`；各列长度不一致时用`NaN`补齐。
+3. 代码完整、无省略，数据中禁止截断（如`[...]`）或注释，结果存储在变量`df`中。
+4. 若无法提取表格，返回`无法识别有效表格`。
+5. 只输出一个```python代码块，不要解释，不要处理表格外的文字，不要编造数据。
+"""
 
-# 任务
-1. **识别与提取**：
-   - 严格区分图片中的表格区域和无关内容，**仅处理表格数据**。
-   - 确保表头（列名）与数据行的对应关系正确。
-   - 若表格无明确列名，自动生成`Column_1, Column_2...`作为占位符。
 
-2. **数据验证**：
-   - 推断数据类型（数字、字符串、日期），如日期格式统一转换为`YYYY-MM-DD`。
-   - 检查每列数据长度，若不一致，用`NaN`填充缺失值以对齐最长列。
+def get_json_table_prompt() -> str:
+    """
+    Return the system prompt for the JSON table output mode.
+    """
+    return """
+你是表格数据提取助手：从图片中精准识别表格，并按给定的JSON结构输出。
+
+# 规则
+1. 仅处理表格区域，表头与数据行对应正确；无明确列名时使用`Column_1, Column_2...`。
+2. `columns`从左到右列出每列的`name`和`dtype`（`string`、`integer`、`number`、`date`、`boolean`），日期统一为`YYYY-MM-DD`。
+3. `rows`从上到下列出每一行，长度与`columns`一致，缺失值使用`null`。
+4. 不要省略或截断任何行，不要处理表格外的文字，不要编造数据。
+"""
 
-3. **代码生成**：
-   - 生成**无省略、可复制粘贴直接运行**的Pandas代码。
-   - 数据字典中禁止出现截断（如`[...]`）或注释。
-   - 若无法提取表格，返回`无法识别有效表格`并停止生成代码。
 
+def get_prompt_examples(output_mode: str = OUTPUT_MODE_CODE) -> str:
+    """
+    Return the output example that follows the system prompt.
+    Like the system prompt it is identical for every request of an output
+    mode, so it stays inside the cacheable prefix.
+    """
+    if output_mode == OUTPUT_MODE_JSON:
+        return """
+# 输出示例
+{"columns": [{"name": "日期", "dtype": "date"}, {"name": "销售额", "dtype": "number"}, {"name": "产品", "dtype": "string"}],
+ "rows": [["2023-01-01", 1200, "A"], ["2023-01-02", 1500.5, "B"], [null, 800, "C"]]}
+"""
+    return """
 # 输出示例
 ```python
 import pandas as pd
@@ -53,26 +135,96 @@ data = {
 }
 
 df = pd.DataFrame(data)
-print(df)
 ```
+"""
 
-# 禁止事项
-不要解释代码或添加额外文本。
-
-不要处理表格外的文字。
 
-不要假设数据内容（如填充随机值）。
+def get_initial_user_text(output_mode: str = OUTPUT_MODE_CODE) -> str:
+    """
+    Return the instruction text of the first user message.
+    """
+    if output_mode == OUTPUT_MODE_JSON:
+        return """
+请分析图片中的表格，并按照给定的JSON结构输出表格数据。要求：
+1. 准确识别表格结构和内容
+2. 为每一列选择适当的数据类型
+3. 进行必要的数据清理和格式化
 """
-
-def get_initial_user_prompt(image_b64:str)->str:
-    return f"""
+    return """
 请分析图片中的表格，并生成Python代码来创建对应的pandas DataFrame。要求：
 1. 准确识别表格结构和内容
 2. 使用适当的数据类型
 3. 进行必要的数据清理和格式化
 4. 最终结果存储在名为'df'的变量中
-图片内容:
-<image>
-{image_b64}
-</image>
 """
+
+
+def get_packed_user_text(count: int) -> str:
+    """
+    Return the instruction text of a request that packs several images.
+    """
+    return f"""
+以下共有 {count} 张图片，每张图片包含一个独立的表格。请分别为每张图片生成Python代码来创建对应的pandas DataFrame。要求：
+1. 按图片顺序输出，每张图片先单独输出一行`### 图片 N`（N为图片编号），紧接着输出该图片的```python代码块
+2. 每个代码块独立可运行，最终结果存储在名为'df'的变量中
+3. 不同图片的数据不要混合
+"""
+
+
+def get_packed_user_prompt(images: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Build one user message from several image parts, each preceded by a
+    numbered delimiter the response has to repeat.
+    """
+    content: List[Dict[str, Any]] = [{"type": "text", "text": get_packed_user_text(len(images))}]
+    for i, image in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"### 图片 {i}"})
+        content.append(image)
+    return content
+
+
+def get_band_user_text(index: int, count: int) -> str:
+    """
+    Return the note added to the instruction text for one band of a tall
+    table that was split into `count` bands; `index` counts from 1.
+    """
+    if index == 1:
+        return f"""
+注意：图片是一张长表格截图的第 1 段（共 {count} 段），只需识别这一段中的表头和各行，底部的行会在下一段中重复出现，照常输出即可。
+"""
+    return f"""
+注意：图片是一张长表格截图的第 {index} 段（共 {count} 段），这一段没有表头。请将图中每一行都作为数据行输出，不要把第一行当作表头，列名依次使用 列1、列2、列3……
+"""
+
+
+def get_initial_user_prompt(
+    image_b64: Optional[str] = None,
+    mime_type: str = "image/png",
+    detail: str = "auto",
+    output_mode: str = OUTPUT_MODE_CODE,
+    band: Optional[Tuple[int, int]] = None,
+    image_url: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Build the first user message as vision content parts: the instruction
+    text followed by the image itself, so the image is billed as image
+    tokens instead of hundreds of thousands of base64 text tokens. The image
+    is either base64 data of `mime_type` or a ready `image_url`. `band` is
+    (index, count) when the image is one band of a tall table.
+    """
+    text = get_initial_user_text(output_mode)
+    if band is not None:
+        text += get_band_user_text(*band)
+    return [
+        {
+            "type": "text",
+            "text": text,
+        },
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": image_url or f"data:{mime_type};base64,{image_b64}",
+                "detail": detail,
+            },
+        },
+    ]
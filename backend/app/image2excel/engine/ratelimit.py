@@ -0,0 +1,257 @@
+"""
+Process-wide rate limiting and retry handling for outbound model calls.
+
+Every task shares one RateLimiter holding a requests-per-minute and a
+tokens-per-minute bucket. Budgets are corrected from the provider's
+x-ratelimit-* response headers, and a 429 pauses all callers until the
+advertised reset, so concurrent tasks queue up at the quota instead of
+failing together.
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import math
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, Mapping, Optional, Tuple, TypeVar
+
+import openai
+from PIL import Image
+
+from backend.app.core.config import ENV_CONFIG
+
+T = TypeVar("T")
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+# Billed size of an image part: a base cost plus, above low detail, one
+# charge per 512px tile. 765 is a typical 2x2-tile screenshot, assumed when
+# the image size cannot be read.
+_IMAGE_BASE_TOKENS = 85
+_IMAGE_TILE_TOKENS = 170
+_IMAGE_DEFAULT_TOKENS = 765
+# Base64 characters decoded to find an image's size; enough for PNG and
+# most JPEG headers
+_IMAGE_HEADER_CHARS = 64 * 1024
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a reset header such as "1s", "6m0s" or "20ms" into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _data_url_size(url: Optional[str]) -> Optional[Tuple[int, int]]:
+    """Pixel size of a base64 data URL's image, read from its header only"""
+    if not url or not url.startswith("data:") or "," not in url:
+        return None
+    data = url[url.index(",") + 1 :][:_IMAGE_HEADER_CHARS]
+    try:
+        head = base64.b64decode(data[: len(data) // 4 * 4])
+        return Image.open(io.BytesIO(head)).size
+    except (binascii.Error, OSError, ValueError, Image.DecompressionBombError):
+        return None
+
+
+def image_tokens(image_url: Dict[str, Any]) -> int:
+    """
+    Billed size of one image_url part. Above low detail the image is fitted
+    into 2048x2048, its short side is scaled down to 768 and every 512px
+    tile of the result is charged.
+    """
+    if image_url.get("detail") == "low":
+        return _IMAGE_BASE_TOKENS
+    size = _data_url_size(image_url.get("url"))
+    if size is None or min(size) <= 0:
+        return _IMAGE_DEFAULT_TOKENS
+    width, height = size
+    scale = min(1.0, 2048 / max(width, height))
+    scale *= min(1.0, 768 / (min(width, height) * scale))
+    tiles = math.ceil(width * scale / 512) * math.ceil(height * scale / 512)
+    return _IMAGE_BASE_TOKENS + _IMAGE_TILE_TOKENS * tiles
+
+
+def estimate_tokens(payload: Any) -> int:
+    """
+    Rough token estimate for budget accounting (about 4 chars per token of
+    text; image parts by their billed size, not their base64 length).
+    """
+    if isinstance(payload, str):
+        return max(1, len(payload) // 4)
+    if isinstance(payload, dict) and payload.get("type") == "image_url":
+        return image_tokens(payload["image_url"])
+    if isinstance(payload, dict):
+        return sum(estimate_tokens(v) for v in payload.values())
+    if isinstance(payload, (list, tuple)):
+        return sum(estimate_tokens(v) for v in payload)
+    return 1
+
+
+class TokenBucket:
+    """
+    Continuously refilling token bucket.
+    """
+
+    def __init__(self, capacity: float, per_seconds: float = 60.0) -> None:
+        self.capacity = float(capacity)
+        self.rate = self.capacity / per_seconds
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 if available now)"""
+        self._refill()
+        # A single request larger than the bucket only waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self._level >= amount:
+            return 0.0
+        return (amount - self._level) / self.rate
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self._level -= min(amount, self.capacity)
+
+    def sync(self, remaining: float, reset_seconds: Optional[float]) -> None:
+        """Align the bucket with the provider's view of the remaining budget"""
+        self._refill()
+        self._level = min(self._level, float(remaining))
+        if reset_seconds is not None:
+            # The provider's reset is when the full budget is back
+            self._level = min(self._level, self.capacity - reset_seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Requests-per-minute plus tokens-per-minute limiter shared by all tasks.
+    """
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int) -> None:
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int) -> None:
+        """Wait until one request of roughly `tokens` tokens fits the budget"""
+        async with self._lock:
+            while True:
+                delay = max(
+                    self._paused_until - time.monotonic(),
+                    self.requests.wait_time(1),
+                    self.tokens.wait_time(tokens),
+                )
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every caller for `seconds`"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Apply x-ratelimit-* headers from a provider response"""
+        if not headers:
+            return
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        if remaining_requests is not None:
+            try:
+                self.requests.sync(
+                    float(remaining_requests),
+                    parse_reset_duration(headers.get("x-ratelimit-reset-requests")),
+                )
+            except ValueError:
+                pass
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if remaining_tokens is not None:
+            try:
+                self.tokens.sync(
+                    float(remaining_tokens),
+                    parse_reset_duration(headers.get("x-ratelimit-reset-tokens")),
+                )
+            except ValueError:
+                pass
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    return parse_reset_duration(headers.get("retry-after"))
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether an API error is transient (429, 5xx, timeouts, dropped connections)"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        # APITimeoutError is a subclass of APIConnectionError
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500
+    return False
+
+
+async def with_retries(
+    call: Callable[[], Awaitable[T]],
+    limiter: Optional["RateLimiter"] = None,
+    max_retries: Optional[int] = None,
+    base_delay: Optional[float] = None,
+    max_delay: Optional[float] = None,
+) -> T:
+    """
+    Run `call`, retrying transient API errors with full-jitter exponential
+    backoff. A server-provided Retry-After takes precedence over the
+    computed delay and, for 429s, pauses the shared limiter as well.
+    """
+    max_retries = ENV_CONFIG.OPENAI_MAX_RETRIES if max_retries is None else max_retries
+    base_delay = ENV_CONFIG.OPENAI_BACKOFF_BASE if base_delay is None else base_delay
+    max_delay = ENV_CONFIG.OPENAI_BACKOFF_MAX if max_delay is None else max_delay
+
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2**attempt)))
+            retry_after = _retry_after(e)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, max_delay))
+            if limiter is not None and isinstance(e, openai.RateLimitError):
+                limiter.update_from_headers(getattr(e.response, "headers", None))
+                limiter.pause(delay)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+rate_limiter = RateLimiter(
+    requests_per_minute=ENV_CONFIG.OPENAI_RPM,
+    tokens_per_minute=ENV_CONFIG.OPENAI_TPM,
+)
@@ -1,30 +1,402 @@
-from typing import Dict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from backend.app.core.config import ENV_CONFIG
-from .prompt import get_initial_prompt, get_feedback_prompt, get_error_prompt
-from openai import OpenAI
+from .prompt import (
+    JSON_PROMPT_VERSION,
+    OUTPUT_MODE_CODE,
+    OUTPUT_MODE_JSON,
+    PROMPT_VERSION,
+    TABLE_JSON_SCHEMA,
+    get_initial_prompt,
+    get_json_table_prompt,
+    get_feedback_prompt,
+    get_error_prompt,
+    get_prompt_examples,
+    get_continuation_prompt,
+)
+from .parser import CodeStreamParser, extract_code, stitch_continuation
+from .cache import make_cache_key, response_cache
+from .messages import UserPrompt, build_messages, request_prompt
+from .usage import merge_usage, usage_from_completion
+from .ratelimit import estimate_tokens, rate_limiter, with_retries
+from .hedge import HedgeClock, hedge_policy
+from .endpoints import Endpoint, endpoint_pool
 
-BASE_URL = "https://api.openai.com/v1/chat/completions"
+DEFAULT_MODEL = "gpt-4o"
 
-openai_client = OpenAI(
-    api_key=ENV_CONFIG.OPENAI_API_KEY,
-    base_url=BASE_URL,
-)
+# Completion budget assumed for tokens-per-minute accounting when a
+# request sets no max_completion_tokens
+EXPECTED_COMPLETION_TOKENS = 1500
 
+ProgressCallback = Callable[[Dict[str, int]], None]
 
-def send_request(prompt: str) -> Dict[str:str]:
-    try:
-        messages = [
-            {"role": "developer", "content": get_initial_prompt()},
-            {"role": "user", "content": prompt},
-        ]
-        response = openai_client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
+TABLE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "table", "strict": True, "schema": TABLE_JSON_SCHEMA},
+}
+
+# Chunks read past the closing fence while waiting for the usage chunk;
+# a model that keeps talking after the code is cut off regardless
+USAGE_TRAILING_CHUNKS = 8
+
+
+async def close_client() -> None:
+    """
+    Close the shared endpoint clients and release their pooled connections.
+    """
+    await endpoint_pool.aclose()
+
+
+def prompt_version(output_mode: str = OUTPUT_MODE_CODE) -> str:
+    """Version tag of the system prompt used for an output mode"""
+    if output_mode == OUTPUT_MODE_JSON:
+        return f"json-{JSON_PROMPT_VERSION}"
+    return PROMPT_VERSION
+
+
+async def send_request(
+    user_prompt: Optional[UserPrompt] = None,
+    system_prompt: Optional[str] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    stream: Optional[bool] = None,
+    image_hash: Optional[str] = None,
+    output_mode: str = OUTPUT_MODE_CODE,
+    n: int = 1,
+    model: Optional[str] = None,
+    image_prompt: Optional[UserPrompt] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Request table code (or, in JSON mode, a table payload) from the model.
+
+    Messages are laid out by build_messages() so that the system prompt,
+    examples and image form a byte-identical prefix across calls; the
+    returned "usage" shows how many prompt tokens the provider served from
+    its prompt cache.
+
+    Args:
+        user_prompt: Volatile prompt of the current iteration, sent last
+        system_prompt: System prompt, defaults to the initial task prompt
+        on_progress: Called with {"rows": ..., "chars": ...} while streaming
+        stream: Override the OPENAI_STREAM setting for this call
+        image_hash: SHA-256 of the source image; enables the response cache
+        output_mode: "code" for pandas code, "json" for a TABLE_JSON_SCHEMA payload;
+            either way the text is returned under "generated_code"
+        n: Number of candidates to sample in one call (n > 1 disables
+            streaming); all of them are returned under "candidates"
+        model: Model to use, defaults to DEFAULT_MODEL
+        image_prompt: The task's image message, sent before user_prompt
+        history: Earlier turns of the task, sent between image_prompt and user_prompt
+        max_tokens: Completion token limit (see sizing.py); output cut off by
+            it is continued up to ENGINE_MAX_CONTINUATIONS times and stitched
+    """
+    model = model or DEFAULT_MODEL
+    cache_key = None
+    if image_hash and ENV_CONFIG.RESPONSE_CACHE_ENABLED:
+        cache_key = make_cache_key(
+            image_hash,
+            prompt_version(output_mode),
+            model,
+            request_prompt(image_prompt, user_prompt, history),
+        )
+        cached = await response_cache.get(cache_key)
+        if cached is not None:
+            return {**cached, "cache_key": cache_key, "cached": True, "usage": None}
+
+    response = await _request_completion(
+        user_prompt, system_prompt, on_progress, stream, output_mode, n, model,
+        image_prompt, history, max_tokens
+    )
+    # With several candidates the caller decides which one deserves caching
+    if cache_key and n == 1 and response.get("generated_code"):
+        await response_cache.set(
+            cache_key,
+            {
+                "completion_id": response.get("completion_id"),
+                "generated_code": response["generated_code"],
+            },
         )
+        response["cache_key"] = cache_key
+    return response
+
+
+def build_request_options(
+    user_prompt: Optional[UserPrompt],
+    system_prompt: Optional[str],
+    output_mode: str = OUTPUT_MODE_CODE,
+    model: str = DEFAULT_MODEL,
+    image_prompt: Optional[UserPrompt] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Chat completion parameters for one request (also the body of a batch line).
+    """
+    is_json = output_mode == OUTPUT_MODE_JSON
+    default_system_prompt = get_json_table_prompt() if is_json else get_initial_prompt()
+    messages = build_messages(
+        system_prompt or default_system_prompt,
+        get_prompt_examples(output_mode),
+        image_prompt,
+        user_prompt,
+        history,
+    )
+    options: Dict[str, Any] = {"model": model, "messages": messages}
+    if is_json:
+        options["response_format"] = TABLE_RESPONSE_FORMAT
+    if max_tokens:
+        options["max_completion_tokens"] = max_tokens
+    return options
+
+
+def completion_result(response: Any, output_mode: str, model: str) -> Dict[str, Any]:
+    """
+    Extract the generated code (or JSON payload) of every choice of a
+    non-streamed chat completion.
+    """
+    candidates = [
+        (choice.message.content or "").strip() if output_mode == OUTPUT_MODE_JSON
+        else extract_code(choice.message.content)
+        for choice in response.choices
+    ]
+    return {
+        "completion_id": response.id,
+        "generated_code": candidates[0] if candidates else "",
+        "candidates": candidates,
+        "text": (response.choices[0].message.content or "") if response.choices else "",
+        "finish_reason": response.choices[0].finish_reason if response.choices else None,
+        "model": model,
+        "usage": usage_from_completion(response.usage),
+    }
+
+
+async def _request_completion(
+    user_prompt: Optional[UserPrompt],
+    system_prompt: Optional[str],
+    on_progress: Optional[ProgressCallback],
+    stream: Optional[bool],
+    output_mode: str = OUTPUT_MODE_CODE,
+    n: int = 1,
+    model: str = DEFAULT_MODEL,
+    image_prompt: Optional[UserPrompt] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    max_tokens: Optional[int] = None,
+) -> Dict[str, Any]:
+    options = build_request_options(
+        user_prompt, system_prompt, output_mode, model, image_prompt, history, max_tokens
+    )
+    if n > 1:
+        options["n"] = n
+        stream = False
+    if stream is None:
+        stream = ENV_CONFIG.OPENAI_STREAM
+
+    # The hedge duplicate steers away from the endpoint the primary is on
+    primary_route: Dict[str, Optional[Endpoint]] = {}
 
-        generated_code = response["choices"][0]["message"]["content"]
+    def attempt(
+        opts: Dict[str, Any],
+        progress: Optional[ProgressCallback],
+        backup: bool,
+        clock: Optional[HedgeClock],
+    ):
+        route = {"avoid": primary_route.get("endpoint")} if backup else primary_route
+        return with_retries(
+            lambda: _complete(opts, progress, stream, route, clock),
+            limiter=rate_limiter,
+        )
+
+    if stream:
+        result = await _hedged(options, attempt, on_progress)
+    else:
+        response, model = await _hedged(options, attempt, None)
+        result = completion_result(response, output_mode, model)
+
+    if n == 1 and result.get("finish_reason") == "length":
+        result = await _continue_truncated(
+            {**options, "model": result["model"]}, result, output_mode
+        )
+    return result
+
+
+async def _continue_truncated(
+    options: Dict[str, Any], result: Dict[str, Any], output_mode: str
+) -> Dict[str, Any]:
+    """
+    Resume a completion that hit the token limit: the partial output is
+    sent back as the assistant turn with a "continue from row N" request,
+    and the pieces are stitched until the model finishes on its own or
+    ENGINE_MAX_CONTINUATIONS is used up.
+    """
+    is_json = output_mode == OUTPUT_MODE_JSON
+    text = result.get("text", "")
+    usage = result.get("usage")
+    finish_reason = result.get("finish_reason")
+    continuations = 0
+
+    while finish_reason == "length" and continuations < ENV_CONFIG.ENGINE_MAX_CONTINUATIONS:
+        parser = CodeStreamParser(fenced=not is_json)
+        parser.feed(text)
+        continuation = {
+            **options,
+            "messages": options["messages"] + [
+                {"role": "assistant", "content": text},
+                {"role": "user", "content": get_continuation_prompt(parser.rows_seen)},
+            ],
+        }
+        # Structured output would force a fresh JSON object; the remainder is plain text
+        continuation.pop("response_format", None)
+        response, _ = await with_retries(
+            lambda: _complete(continuation, None, False, {}),
+            limiter=rate_limiter,
+        )
+        continuations += 1
+        choice = response.choices[0]
+        text = stitch_continuation(text, choice.message.content or "")
+        usage = merge_usage(usage, usage_from_completion(response.usage))
+        finish_reason = choice.finish_reason
+
+    generated_code = text.strip() if is_json else extract_code(text)
+    return {
+        **result,
+        "generated_code": generated_code,
+        "candidates": [generated_code],
+        "text": text,
+        "finish_reason": finish_reason,
+        "usage": usage,
+        "continuations": continuations,
+    }
+
+
+async def _hedged(
+    options: Dict[str, Any],
+    attempt: Callable[
+        [Dict[str, Any], Optional[ProgressCallback], bool, Optional[HedgeClock]], Awaitable[Any]
+    ],
+    on_progress: Optional[ProgressCallback],
+) -> Any:
+    """
+    Run one completion attempt, hedged against tail latency when enabled.
+    The duplicate may target OPENAI_HEDGE_MODEL and prefers another
+    endpoint; it reports no progress so the task status keeps following
+    the primary stream.
+    """
+    if not ENV_CONFIG.ENGINE_HEDGE_ENABLED:
+        return await attempt(options, on_progress, False, None)
+
+    backup_options = dict(options)
+    if ENV_CONFIG.OPENAI_HEDGE_MODEL:
+        backup_options["model"] = ENV_CONFIG.OPENAI_HEDGE_MODEL
+    return await hedge_policy.run(
+        options["model"],
+        lambda clock: attempt(options, on_progress, False, clock),
+        lambda clock: attempt(backup_options, None, True, clock),
+        backup_model=backup_options["model"],
+    )
+
+
+async def _complete(
+    options: Dict[str, Any],
+    on_progress: Optional[ProgressCallback],
+    stream: bool,
+    route: Dict[str, Optional[Endpoint]],
+    clock: Optional[HedgeClock] = None,
+) -> Any:
+    """
+    One attempt against one endpoint picked from the pool, once the shared
+    rate limiter admits it. The outcome feeds the endpoint's health score
+    and circuit breaker; `clock` times only the HTTP call.
+    """
+    await rate_limiter.acquire(
+        estimate_tokens(options.get("messages"))
+        + (options.get("max_completion_tokens") or EXPECTED_COMPLETION_TOKENS)
+    )
+    async with endpoint_pool.attempt(exclude=route.get("avoid")) as endpoint:
+        route["endpoint"] = endpoint
+        if clock:
+            clock.start()
+        try:
+            if stream:
+                result = await _stream_completion(endpoint, options, on_progress, clock)
+            else:
+                result = await _create_completion(endpoint, **options), options["model"]
+                if clock:
+                    clock.respond()
+        except Exception:
+            if clock:
+                clock.stop()
+            raise
+    return result
+
+
+async def _create_completion(endpoint: Endpoint, **kwargs) -> Any:
+    """
+    Issue one chat completion and feed the provider's rate-limit headers
+    back into the shared rate limiter.
+    """
+    raw = await endpoint.client.chat.completions.with_raw_response.create(**kwargs)
+    rate_limiter.update_from_headers(raw.headers)
+    return raw.parse()
+
+
+async def _stream_completion(
+    endpoint: Endpoint,
+    options: Dict[str, Any],
+    on_progress: Optional[ProgressCallback],
+    clock: Optional[HedgeClock] = None,
+) -> Dict[str, Any]:
+    """
+    Consume a streamed completion, stopping shortly after the code block
+    closes. Closing the stream early drops the connection so the provider
+    stops generating whatever explanation would have followed the code; a
+    few trailing chunks are still read so the final usage chunk is usually
+    caught.
+    """
+    # Structured JSON output has no fence; it simply ends with the stream
+    parser = CodeStreamParser(fenced="response_format" not in options)
+    completion_id = None
+    finish_reason = None
+    usage = None
+    rows_reported = -1
+    trailing = 0
+
+    stream = await _create_completion(
+        endpoint, **options, stream=True, stream_options={"include_usage": True}
+    )
+    try:
+        async for chunk in stream:
+            completion_id = completion_id or chunk.id
+            if chunk.usage is not None:
+                # The usage chunk comes last and carries no choices
+                usage = chunk.usage
+                break
+            if not chunk.choices:
+                continue
+            if parser.closed:
+                # Code is complete; only wait briefly for the usage chunk
+                trailing += 1
+                if trailing > USAGE_TRAILING_CHUNKS:
+                    break
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            content = choice.delta.content if choice.delta else None
+            if clock and content:
+                # Hedging looks at time to first token, not the whole stream
+                clock.respond()
+            parser.feed(content)
+            if on_progress and parser.rows_seen != rows_reported:
+                rows_reported = parser.rows_seen
+                on_progress({"rows": parser.rows_seen, "chars": parser.chars_seen})
+    finally:
+        await stream.close()
 
-        return {"completion_id": response.id, "generated_code": generated_code}
-    except Exception as e:
-        # TODO: For production usage, implement proper logging and error handling.
-        raise e
+    generated_code = parser.code if parser.closed else extract_code(parser.text())
+    return {
+        "completion_id": completion_id,
+        "generated_code": generated_code,
+        "text": parser.text(),
+        "finish_reason": "stop" if parser.closed else finish_reason,
+        "model": options["model"],
+        "usage": usage_from_completion(usage),
+    }
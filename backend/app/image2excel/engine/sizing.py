@@ -0,0 +1,61 @@
+"""
+Completion size estimates derived from the source image.
+
+A table screenshot's text volume grows with its area: rows stack up at a
+fairly constant line height and columns at a typical cell width. The
+estimate sets max_completion_tokens high enough for the whole table (with
+headroom) without letting a confused model ramble on indefinitely; outputs
+that still hit the limit are continued (see request.py).
+"""
+
+import math
+
+from .prompt import OUTPUT_MODE_CODE, OUTPUT_MODE_JSON
+
+# Typical rendered row height and column width of a table screenshot
+ROW_HEIGHT_PX = 24
+COLUMN_WIDTH_PX = 100
+
+# Tokens per cell including quotes and separators
+TOKENS_PER_CELL = {OUTPUT_MODE_CODE: 6, OUTPUT_MODE_JSON: 5}
+
+# Imports, column names, DataFrame construction
+OVERHEAD_TOKENS = 300
+
+SAFETY_FACTOR = 1.5
+MIN_OUTPUT_TOKENS = 1024
+
+
+def estimate_output_tokens(width: int, height: int, output_mode: str = OUTPUT_MODE_CODE) -> int:
+    """Rough number of completion tokens needed to transcribe a table image"""
+    rows = max(1, math.ceil(height / ROW_HEIGHT_PX))
+    columns = max(1, math.ceil(width / COLUMN_WIDTH_PX))
+    return OVERHEAD_TOKENS + rows * columns * TOKENS_PER_CELL.get(output_mode, 6)
+
+
+def max_tokens_for_image(width: int, height: int, output_mode: str, cap: int) -> int:
+    """Completion limit for an image: the estimate plus headroom, within [MIN_OUTPUT_TOKENS, cap]"""
+    budget = int(estimate_output_tokens(width, height, output_mode) * SAFETY_FACTOR)
+    return max(MIN_OUTPUT_TOKENS, min(cap, budget))
+
+
+# Thresholds for grouping images in usage reports
+SMALL_IMAGE_PIXELS = 400_000
+LARGE_IMAGE_PIXELS = 2_000_000
+TALL_ASPECT_RATIO = 3.0
+
+
+def image_category(width: int, height: int) -> str:
+    """Coarse image class (small / medium / large, tall / wide) for usage rollups"""
+    pixels = width * height
+    if pixels <= SMALL_IMAGE_PIXELS:
+        size = "small"
+    elif pixels <= LARGE_IMAGE_PIXELS:
+        size = "medium"
+    else:
+        size = "large"
+    if width and height / width >= TALL_ASPECT_RATIO:
+        return f"{size}-tall"
+    if height and width / height >= TALL_ASPECT_RATIO:
+        return f"{size}-wide"
+    return size
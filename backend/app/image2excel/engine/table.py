@@ -0,0 +1,101 @@
+"""
+Conversion of structured JSON table payloads into DataFrames.
+Used by the JSON output mode, where the model returns columns, dtypes and
+rows directly instead of Python code that has to be exec'd.
+"""
+
+import json
+from typing import Any, Dict, List, Union
+
+import pandas as pd
+
+
+def parse_table_payload(text: str) -> Dict[str, Any]:
+    """
+    Parse and validate a JSON table payload.
+
+    Raises:
+        ValueError: If the payload is not valid JSON or misses required keys
+    """
+    try:
+        payload = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"表格JSON解析失败: {e}")
+    if not isinstance(payload, dict):
+        raise ValueError("表格JSON必须是对象")
+    columns = payload.get("columns")
+    rows = payload.get("rows")
+    if not isinstance(columns, list) or not columns:
+        raise ValueError("表格JSON缺少'columns'")
+    if not all(isinstance(column, dict) for column in columns):
+        raise ValueError("表格JSON的'columns'必须是对象列表")
+    if not isinstance(rows, list):
+        raise ValueError("表格JSON缺少'rows'")
+    return payload
+
+
+def _to_numeric(series: pd.Series) -> pd.Series:
+    # Tolerate thousands separators in numbers the model returned as text
+    cleaned = series.map(lambda v: v.replace(",", "").strip() if isinstance(v, str) else v)
+    return pd.to_numeric(cleaned, errors="coerce")
+
+
+def _convert_column(series: pd.Series, dtype: str) -> pd.Series:
+    if dtype == "integer":
+        numeric = _to_numeric(series)
+        # Only use the nullable integer dtype when no value would be truncated
+        if (numeric.dropna() % 1 == 0).all():
+            return numeric.astype("Int64")
+        return numeric
+    if dtype == "number":
+        return _to_numeric(series)
+    if dtype == "date":
+        return pd.to_datetime(series, errors="coerce")
+    if dtype == "boolean":
+        return series.map(
+            lambda v: v if isinstance(v, bool) or v is None
+            else str(v).strip().lower() in ("true", "1", "yes", "是")
+        ).astype("boolean")
+    return series.astype("string")
+
+
+def dataframe_from_payload(payload: Union[str, Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Build a DataFrame from a table payload.
+
+    Rows are padded or cut to the column count, the frame is constructed in
+    one shot from the row arrays, and each column is then converted to its
+    declared dtype with vectorized pandas conversions.
+    """
+    if isinstance(payload, str):
+        payload = parse_table_payload(payload)
+
+    columns: List[Dict[str, Any]] = payload["columns"]
+    names = _unique_names(
+        [str(col.get("name") or f"Column_{i + 1}") for i, col in enumerate(columns)]
+    )
+    width = len(names)
+
+    rows = [
+        (list(row) + [None] * (width - len(row)))[:width]
+        if isinstance(row, list) else [row] + [None] * (width - 1)
+        for row in payload["rows"]
+    ]
+    df = pd.DataFrame(rows, columns=names, dtype=object)
+
+    for name, col in zip(names, columns):
+        df[name] = _convert_column(df[name], col.get("dtype", "string"))
+    return df
+
+
+def _unique_names(names: List[str]) -> List[str]:
+    seen: Dict[str, int] = {}
+    unique = []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}_{seen[name]}"
+        else:
+            seen[name] = 0
+        unique.append(name)
+    return unique
@@ -0,0 +1,53 @@
+"""
+Merging the tables extracted from the bands of a tall image.
+
+Every band after the first is extracted without a header, so its columns
+are renamed by position to the first band's. Neighbouring bands overlap by
+a few rows; those rows come back from both, so the longest run of rows
+ending one band that repeats at the start of the next is dropped from the
+next, compared by a hash of each row's values as text (a number may come
+back as 1234 in one band and "1234" or, in a column with blanks, 1234.0 in
+the other). Columns a band has beyond the header are kept but not compared.
+"""
+
+from typing import Any, List
+
+import numpy as np
+import pandas as pd
+
+
+def _cell_text(value: Any) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    text = df.apply(lambda column: column.map(_cell_text))
+    return pd.util.hash_pandas_object(text, index=False).to_numpy()
+
+
+def _overlap(previous: np.ndarray, following: np.ndarray) -> int:
+    """Length of the longest suffix of previous that is a prefix of following"""
+    for length in range(min(len(previous), len(following)), 0, -1):
+        if np.array_equal(previous[-length:], following[:length]):
+            return length
+    return 0
+
+
+def merge_band_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Concatenate the DataFrames of consecutive bands into one table with the
+    first band's header and without the rows repeated across overlaps.
+    """
+    header = list(frames[0].columns)
+    parts = [frames[0]]
+    previous = _row_hashes(frames[0])
+    for frame in frames[1:]:
+        width = min(len(header), len(frame.columns))
+        frame = frame.set_axis(header[:width] + list(frame.columns[width:]), axis=1)
+        hashes = _row_hashes(frame.iloc[:, : len(header)])
+        skip = _overlap(previous, hashes)
+        parts.append(frame.iloc[skip:])
+        previous = hashes
+    return pd.concat(parts, ignore_index=True)
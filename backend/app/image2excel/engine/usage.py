@@ -0,0 +1,37 @@
+"""
+Token usage reported by the provider for each completion.
+
+Prompt tokens are split into the part served from the provider's prompt
+cache and the part that had to be processed from scratch, which shows how
+well the stable message prefix (see messages.py) is being reused.
+"""
+
+from typing import Any, Dict, Optional
+
+USAGE_FIELDS = ("prompt_tokens", "cached_tokens", "uncached_tokens", "completion_tokens")
+
+
+def usage_from_completion(usage: Any) -> Optional[Dict[str, int]]:
+    """Summarize an SDK usage object, None when the provider sent none"""
+    if usage is None:
+        return None
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens,
+        "completion_tokens": getattr(usage, "completion_tokens", None) or 0,
+    }
+
+
+def merge_usage(
+    total: Optional[Dict[str, int]], usage: Optional[Dict[str, int]]
+) -> Optional[Dict[str, int]]:
+    """Add two usage summaries; either may be None"""
+    if usage is None:
+        return total
+    if total is None:
+        return dict(usage)
+    return {field: total.get(field, 0) + usage.get(field, 0) for field in USAGE_FIELDS}
@@ -0,0 +1,127 @@
+"""
+Load test driver for the task manager.
+
+Creates many tasks at once from generated images (each one distinct, so
+neither the response cache nor single-flight collapses them), runs them all
+concurrently and reports how they finished. Meant to be pointed at the mock
+model server (engine/mock_server.py) to see how scheduling, retries and
+timeouts behave under a slow or flaky model. OPENAI_RPM / OPENAI_TPM still
+apply; raise them to take the client-side limiter out of the picture:
+
+    python -m backend.app.image2excel.engine.mock_server --latency lognormal:0.5,0.8 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 python -m backend.app.image2excel.loadtest --tasks 500
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from collections import Counter
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+from .TaskManager import task_manager
+
+TERMINAL_STATUSES = {"COMPLETED", "FAILED", "CANCELLED"}
+
+
+def generate_images(directory: str, count: int, seed: int = 0) -> List[str]:
+    """Small table-like PNGs of varying size, each with unique pixels"""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        rows, columns = rng.randint(3, 40), rng.randint(2, 8)
+        image = Image.new("RGB", (columns * 100, rows * 24), "white")
+        draw = ImageDraw.Draw(image)
+        for r in range(rows):
+            for c in range(columns):
+                draw.rectangle([c * 100, r * 24, c * 100 + 99, r * 24 + 23], outline="black")
+                draw.text((c * 100 + 4, r * 24 + 6), str(rng.randint(0, 99999)), fill="black")
+        path = os.path.join(directory, f"loadtest_{i}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "p50": round(pick(0.50), 2),
+        "p90": round(pick(0.90), 2),
+        "p99": round(pick(0.99), 2),
+        "max": round(ordered[-1], 2),
+        "mean": round(statistics.mean(ordered), 2),
+    }
+
+
+def run(count: int, username: str, timeout: float, poll_interval: float, seed: int) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="image2excel_loadtest_") as directory:
+        paths = generate_images(directory, count, seed)
+
+        started = time.monotonic()
+        task_ids = [
+            task_manager.create_task(username, path, os.path.basename(path))
+            for path in paths
+        ]
+        for task_id in task_ids:
+            task_manager.start_task(username, task_id)
+
+        finished: Dict[str, float] = {}
+        statuses: Dict[str, Dict] = {}
+        while len(finished) < len(task_ids) and time.monotonic() - started < timeout:
+            time.sleep(poll_interval)
+            for task_id in task_ids:
+                if task_id in finished:
+                    continue
+                status = task_manager.get_task_status(username, task_id)
+                if status and status["status"] in TERMINAL_STATUSES:
+                    finished[task_id] = time.monotonic() - started
+                    statuses[task_id] = status
+        elapsed = time.monotonic() - started
+
+        for task_id in task_ids:
+            if task_id not in finished:
+                statuses[task_id] = task_manager.get_task_status(username, task_id) or {}
+                task_manager.cancel_task(username, task_id)
+
+    outcome = Counter(status.get("status", "UNKNOWN") for status in statuses.values())
+    errors = Counter(
+        (status.get("error") or status.get("message") or "").split("\n", 1)[0][:80]
+        for status in statuses.values()
+        if status.get("status") == "FAILED"
+    )
+    return {
+        "tasks": count,
+        "elapsed": round(elapsed, 2),
+        "throughput_per_second": round(len(finished) / elapsed, 2) if elapsed else None,
+        "statuses": dict(outcome),
+        "timed_out": count - len(finished),
+        "completion_seconds": _percentiles(list(finished.values())),
+        "iterations": _percentiles(
+            [status["metadata"]["total_iterations"] for status in statuses.values() if "metadata" in status]
+        ),
+        "top_errors": dict(errors.most_common(5)),
+        "engine": task_manager.get_engine_stats(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--username", default="loadtest")
+    parser.add_argument("--timeout", type=float, default=600.0, help="give up on tasks still running after this many seconds")
+    parser.add_argument("--poll-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    try:
+        report = run(args.tasks, args.username, args.timeout, args.poll_interval, args.seed)
+        print(json.dumps(report, ensure_ascii=False, indent=2, default=str))
+    finally:
+        task_manager.shutdown()
@@ -4,6 +4,8 @@ from fastapi import HTTPException, status
 import os
 from app.services.AuthService import AuthService
 from app.core.config import ENV_CONFIG
+from app.image2excel.ImageUtils import ImageUtils
+from backend.app.image2excel.engine.duplicates import duplicate_index
 
 router = APIRouter(prefix="/files", tags=["Files upload/download"])
 
@@ -22,6 +24,19 @@ async def upload_file(file: UploadFile = File(...), username: str = Depends(Auth
     try:
         with open(file_path, "wb") as f:
             f.write(await file.read())
+        if ENV_CONFIG.ENGINE_NEAR_DUPLICATE != "off":
+            # Perceptual hashes for spotting re-uploads of an already converted table
+            try:
+                duplicate_index.remember_upload(
+                    await ImageUtils.sha256(file_path),
+                    await ImageUtils.perceptual_hashes(
+                        file_path,
+                        ENV_CONFIG.ENGINE_TABLE_CROP_MIN_CONFIDENCE if ENV_CONFIG.ENGINE_TABLE_CROP else None,
+                    ),
+                )
+            except ValueError:
+                # Not an image Pillow can read; the task reports that when it runs
+                pass
         return {"message": f"User `{username}`, File '{file_name}' uploaded successfully"}
     except Exception as e:
         raise HTTPException(
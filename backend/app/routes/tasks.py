@@ -12,6 +12,10 @@ from app.dtos.TaskDTO import (
     DeleteTaskResponseDTO,
     GetTaskStatusRequestDTO,
     GetTaskStatusResponseDTO,
+    GetTaskUsageResponseDTO,
+    GetUserUsageResponseDTO,
+    SubmitBatchRequestDTO,
+    SubmitBatchResponseDTO,
 )
 from app.services.TaskService import TaskService
 
@@ -54,6 +58,62 @@ async def get_task_status(
     )
 
 
+@router.get("/usage", response_model=GetUserUsageResponseDTO)
+async def get_user_usage(
+    username: str = Depends(AuthService.verify_access_token),
+) -> GetUserUsageResponseDTO:
+    # token usage, cost and timings summed over the user's tasks
+    usage = TaskService.get_user_usage(username)
+    return GetUserUsageResponseDTO(
+        total=usage["total"],
+        tasks=usage["tasks"],
+        message="Usage retrieved successfully",
+    )
+
+
+@router.get("/usage/{task_id}", response_model=GetTaskUsageResponseDTO)
+async def get_task_usage(
+    task_id: str,
+    username: str = Depends(AuthService.verify_access_token),
+) -> Optional[GetTaskUsageResponseDTO]:
+    usage = TaskService.get_task_usage(username, task_id)
+    if usage is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Task not found",
+        )
+    return GetTaskUsageResponseDTO(
+        task_id=task_id, usage=usage, message="Task usage retrieved successfully"
+    )
+
+
+@router.post("/batch", response_model=SubmitBatchResponseDTO)
+async def submit_batch(
+    form_data: SubmitBatchRequestDTO,
+    username: str = Depends(AuthService.verify_access_token),
+) -> Optional[SubmitBatchResponseDTO]:
+    # queues existing tasks for offline conversion through batch jobs
+    # only tasks that have not been started are queued
+    result = TaskService.submit_batch(username, form_data.task_ids)
+    task_ids, rejected = result["queued"], result["rejected"]
+    if not task_ids and not rejected:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No tasks found",
+        )
+    if not task_ids:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Tasks already queued, running or finished: {', '.join(rejected)}",
+        )
+    return SubmitBatchResponseDTO(
+        message=f"{len(task_ids)} tasks queued for batch conversion",
+        task_ids=task_ids,
+        rejected_task_ids=rejected,
+        success=True,
+    )
+
+
 @router.post("/delete", response_model=DeleteTaskResponseDTO)
 async def delete_task(
     task_id: str,
@@ -51,6 +51,39 @@ class TaskService:
         """
         return task_manager.get_task_status(username, task_id)
 
+    @staticmethod
+    def get_task_usage(username: str, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the token usage, cost and timings accumulated by a user's task.
+
+        :param username: User identifier.
+        :param task_id: Task identifier.
+        :return: Usage totals if the task exists, else None.
+        """
+        return task_manager.get_task_usage(username, task_id)
+
+    @staticmethod
+    def get_user_usage(username: str) -> Dict[str, Any]:
+        """
+        Get the token usage, cost and timings accumulated by a user.
+
+        :param username: User identifier.
+        :return: The user's totals and those of each current task.
+        """
+        return task_manager.get_user_usage(username)
+
+    @staticmethod
+    def submit_batch(username: str, task_ids: List[str]) -> Dict[str, List[str]]:
+        """
+        Queue the user's tasks for offline conversion through batch jobs.
+
+        :param username: User identifier.
+        :param task_ids: Tasks to convert.
+        :return: The "queued" task ids and the "rejected" ones that were
+            already queued, running or finished.
+        """
+        return task_manager.submit_batch(username, task_ids)
+
     @staticmethod
     def cancel_task(username: str, task_id: str) -> bool:
         """
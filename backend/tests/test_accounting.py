@@ -0,0 +1,82 @@
+from types import SimpleNamespace as NS
+
+import pytest
+
+from backend.app.image2excel.engine.accounting import DEFAULT_PRICES, UsageLedger, cost_of, load_prices
+from backend.app.image2excel.engine.usage import usage_from_completion
+
+PRICES = {"m": {"input": 2.0, "cached_input": 0.5, "output": 10.0}}
+
+
+def test_cached_tokens_are_billed_at_the_cached_price():
+    usage = {"prompt_tokens": 1_000_000, "cached_tokens": 400_000, "completion_tokens": 100_000}
+    assert cost_of(usage, PRICES["m"]) == pytest.approx(0.6 * 2.0 + 0.4 * 0.5 + 0.1 * 10.0)
+
+
+def test_cost_of_a_provider_usage_summary():
+    usage = usage_from_completion(
+        NS(prompt_tokens=3000, completion_tokens=500, prompt_tokens_details=NS(cached_tokens=2048))
+    )
+    assert cost_of(usage, PRICES["m"]) == pytest.approx((952 * 2.0 + 2048 * 0.5 + 500 * 10.0) / 1_000_000)
+
+
+def test_uncached_tokens_take_precedence():
+    usage = {"prompt_tokens": 900_000, "uncached_tokens": 100_000, "cached_tokens": 0}
+    assert cost_of(usage, PRICES["m"]) == pytest.approx(0.2)
+
+
+def test_cached_price_defaults_to_the_input_price():
+    usage = {"prompt_tokens": 1_000_000, "cached_tokens": 1_000_000}
+    assert cost_of(usage, {"input": 3.0}) == pytest.approx(3.0)
+
+
+def test_no_usage_or_price_costs_nothing():
+    assert cost_of(None, PRICES["m"]) == 0.0
+    assert cost_of({"prompt_tokens": 10}, None) == 0.0
+
+
+def test_rollups_by_task_user_and_category():
+    ledger = UsageLedger(PRICES)
+    usage = {"prompt_tokens": 1000, "cached_tokens": 200, "completion_tokens": 50}
+    ledger.record("alice", "t1", "small/png", "m", usage, api_seconds=1.5, exec_seconds=0.25)
+    ledger.record("alice", "t1", "small/png", "m", None, cached=True)
+    ledger.record("alice", "t2", None, "m", usage, api_seconds=2.0)
+    ledger.record("bob", "t3", "small/png", "unpriced", usage)
+
+    one = cost_of(usage, PRICES["m"])
+    t1 = ledger.task("t1")
+    assert (t1["iterations"], t1["cache_hits"]) == (2, 1)
+    assert (t1["prompt_tokens"], t1["cached_tokens"], t1["completion_tokens"]) == (1000, 200, 50)
+    assert t1["cost"] == round(one, 6)
+    assert (t1["api_seconds"], t1["exec_seconds"]) == (1.5, 0.25)
+
+    alice = ledger.user("alice")
+    assert alice["iterations"] == 3 and alice["prompt_tokens"] == 2000
+    assert alice["cost"] == round(2 * one, 6)
+    assert ledger.user("bob")["cost"] == 0.0
+
+    stats = ledger.stats()
+    assert set(stats["users"]) == {"alice", "bob"}
+    assert stats["categories"]["small/png"]["iterations"] == 3
+    assert stats["categories"]["unknown"]["api_seconds"] == 2.0
+
+
+def test_forgotten_task_keeps_user_and_category_totals():
+    ledger = UsageLedger(PRICES)
+    ledger.record("alice", "t1", "small/png", "m", {"prompt_tokens": 10})
+    ledger.forget_task("t1")
+    assert ledger.task("t1")["iterations"] == 0
+    assert ledger.user("alice")["prompt_tokens"] == 10
+    assert ledger.stats()["categories"]["small/png"]["iterations"] == 1
+
+
+def test_model_prices_override_the_defaults(monkeypatch):
+    monkeypatch.setenv("MODEL_PRICES", '{"gpt-4o": {"input": 1.0, "output": 2.0}, "m": {"input": 3.0}}')
+    prices = load_prices()
+    assert prices["gpt-4o"] == {"input": 1.0, "output": 2.0}
+    assert prices["gpt-4o-mini"] == DEFAULT_PRICES["gpt-4o-mini"]
+    assert prices["m"] == {"input": 3.0}
+
+    monkeypatch.setenv("MODEL_PRICES", "[1]")
+    with pytest.raises(ValueError):
+        load_prices()
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel.Task import Image2ExcelTask, TaskStatus
+from backend.app.image2excel.TaskManager import TaskRecord, task_manager
+
+
+class _Runner:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, tasks):
+        self.submitted.extend(tasks)
+
+
+@pytest.fixture
+def tasks(monkeypatch):
+    async def make():
+        return {
+            status: Image2ExcelTask("batch-user", "missing.png", lambda user, message: None, task_id=status.value)
+            for status in (TaskStatus.CREATED, TaskStatus.RUNNING, TaskStatus.COMPLETED, TaskStatus.QUEUED)
+        }
+
+    made = asyncio.run(make())
+    for status, task in made.items():
+        task._status = status
+    runner = _Runner()
+    monkeypatch.setattr(task_manager, "_batch_runner", runner)
+    monkeypatch.setitem(
+        task_manager._tasks,
+        "batch-user",
+        {task.task_id: TaskRecord(task.task_id, "x.png", task) for task in made.values()},
+    )
+    return made, runner
+
+
+def test_only_idle_tasks_are_queued(tasks):
+    made, runner = tasks
+    result = task_manager.submit_batch("batch-user", ["CREATED", "RUNNING", "COMPLETED", "QUEUED", "nope"])
+    assert result == {"queued": ["CREATED"], "rejected": ["RUNNING", "COMPLETED", "QUEUED"]}
+    assert runner.submitted == [made[TaskStatus.CREATED]]
+    assert made[TaskStatus.CREATED].status == TaskStatus.QUEUED
+    # Nothing about the busy or finished tasks changed
+    assert made[TaskStatus.RUNNING].status == TaskStatus.RUNNING
+    assert made[TaskStatus.COMPLETED].status == TaskStatus.COMPLETED
+    assert made[TaskStatus.COMPLETED].metadata.current_iteration == 0
+
+
+def test_a_task_is_queued_once(tasks):
+    made, runner = tasks
+    task_manager.submit_batch("batch-user", ["CREATED"])
+    # initialize() puts a queued task back to CREATED
+    made[TaskStatus.CREATED]._status = TaskStatus.CREATED
+    assert task_manager.submit_batch("batch-user", ["CREATED"]) == {
+        "queued": [],
+        "rejected": ["CREATED"],
+    }
+    assert runner.submitted == [made[TaskStatus.CREATED]]
@@ -0,0 +1,38 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from backend.app.image2excel.engine.batch_server import create_app
+
+
+async def _echo(body):
+    return {"echo": body}
+
+
+def _run(content: bytes) -> dict:
+    client = TestClient(create_app(_echo))
+    file = client.post(
+        "/v1/files", files={"file": ("in.jsonl", content)}, data={"purpose": "batch"}
+    ).json()
+    batch = client.post(
+        "/v1/batches", json={"input_file_id": file["id"], "endpoint": "/v1/chat/completions"}
+    ).json()
+    for _ in range(50):
+        batch = client.get(f"/v1/batches/{batch['id']}").json()
+        if batch["status"] not in ("validating", "in_progress"):
+            break
+        time.sleep(0.01)
+    return batch
+
+
+def test_batch_completes():
+    batch = _run(b'{"custom_id": "a", "body": {}}\n{"custom_id": "b", "body": {}}\n')
+    assert batch["status"] == "completed"
+    assert batch["request_counts"] == {"total": 2, "completed": 2, "failed": 0}
+
+
+def test_unreadable_batch_fails_instead_of_hanging():
+    batch = _run(b'{"custom_id": "a", "body": {}}\nnot json\n')
+    assert batch["status"] == "failed"
+    assert batch["failed_at"]
+    assert batch["errors"]["data"][0]["code"] == "server_error"
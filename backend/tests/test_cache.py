@@ -0,0 +1,42 @@
+import asyncio
+import os
+
+from backend.app.core.config import ENV_CONFIG
+from backend.app.image2excel.engine.cache import ResponseCache, make_cache_key
+
+PROMPT = [
+    {"type": "text", "text": "convert"},
+    {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA", "detail": "high"}},
+]
+
+
+def test_key_ignores_inline_image_data():
+    other = [PROMPT[0], {"type": "image_url", "image_url": {"url": "data:,BBBB", "detail": "high"}}]
+    assert make_cache_key("sha", "v1", "m", PROMPT) == make_cache_key("sha", "v1", "m", other)
+
+
+def test_key_covers_every_input():
+    key = make_cache_key("sha", "v1", "m", PROMPT)
+    assert key != make_cache_key("sha2", "v1", "m", PROMPT)
+    assert key != make_cache_key("sha", "v2", "m", PROMPT)
+    assert key != make_cache_key("sha", "v1", "m2", PROMPT)
+    assert key != make_cache_key("sha", "v1", "m", "fix the header")
+    low = [PROMPT[0], {"type": "image_url", "image_url": {"url": "", "detail": "low"}}]
+    assert key != make_cache_key("sha", "v1", "m", low)
+
+
+def test_key_changes_with_preprocessing(monkeypatch):
+    key = make_cache_key("sha", "v1", "m", PROMPT)
+    monkeypatch.setenv("ENGINE_IMAGE_MAX_EDGE", str(ENV_CONFIG.ENGINE_IMAGE_MAX_EDGE + 1))
+    assert make_cache_key("sha", "v1", "m", PROMPT) != key
+
+
+def test_disk_round_trip_leaves_no_temp_files(tmp_path):
+    async def main():
+        cache = ResponseCache(cache_dir=str(tmp_path))
+        await asyncio.gather(*(cache.set("k", {"n": n}) for n in range(8)))
+        fresh = ResponseCache(cache_dir=str(tmp_path))
+        return await fresh.get("k")
+
+    assert asyncio.run(main())["n"] in range(8)
+    assert os.listdir(tmp_path) == ["k.json"]
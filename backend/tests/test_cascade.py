@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel import TaskExecutor as executor_module
+from backend.app.image2excel.TaskExecutor import TaskExecutor, TaskState
+from backend.app.image2excel.engine.cascade import ModelCascade
+
+GOOD = "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2]})"
+BAD = "df = 1 / 0"
+
+
+def _cascade(**kwargs) -> ModelCascade:
+    options = dict(min_samples=4, min_success_rate=0.5, probe_interval=0, window=4)
+    options.update(kwargs)
+    return ModelCascade(["mini", "small", "large"], **options)
+
+
+def test_failing_tier_is_demoted_after_enough_samples():
+    cascade = _cascade()
+    for _ in range(3):
+        cascade.record("mini", False)
+    assert cascade.plan() == ["mini", "small", "large"]
+    cascade.record("mini", False)
+    assert cascade.plan() == ["small", "large"]
+    assert cascade.stats()["mini"]["skipped"]
+
+
+def test_successes_in_the_window_promote_it_again():
+    cascade = _cascade()
+    for success in [False, False, False, False, True]:
+        cascade.record("mini", success)
+    assert cascade.plan() == ["small", "large"]
+    # The window now holds two failures and two successes
+    cascade.record("mini", True)
+    assert cascade.plan() == ["mini", "small", "large"]
+
+
+def test_strongest_tier_is_never_skipped():
+    cascade = _cascade()
+    for model in ["mini", "small", "large"]:
+        for _ in range(4):
+            cascade.record(model, False)
+    assert cascade.plan() == ["large"]
+    assert not cascade.stats()["large"]["skipped"]
+
+
+def test_probe_plans_include_demoted_tiers():
+    cascade = _cascade(probe_interval=3)
+    for _ in range(4):
+        cascade.record("mini", False)
+    plans = [cascade.plan() for _ in range(3)]
+    assert plans[:2] == [["small", "large"]] * 2
+    assert plans[2] == ["mini", "small", "large"]
+
+
+def test_attempts_escalate_and_stay_on_the_last_tier():
+    plan = ["mini", "large"]
+    assert [ModelCascade.model_for_attempt(plan, i) for i in range(4)] == ["mini", "large", "large", "large"]
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    cascade = ModelCascade(["mini", "large"], min_samples=2, min_success_rate=0.5, probe_interval=0)
+    monkeypatch.setattr(executor_module, "model_cascade", cascade)
+    return cascade
+
+
+def _run(monkeypatch, outputs, cached=False):
+    """Run the first iteration of a task, then corrections until the outputs run out"""
+    models = []
+
+    async def fake_send_request(**kwargs):
+        models.append(kwargs["model"])
+        return {"generated_code": outputs[len(models) - 1], "usage": None, "cached": cached}
+
+    monkeypatch.setattr(executor_module, "send_request", fake_send_request)
+
+    async def main():
+        executor = TaskExecutor("t1", "alice", lambda username, message: None)
+        states = []
+        for iteration in range(1, len(outputs) + 1):
+            executor.current_iteration = iteration
+            prompt = None if iteration == 1 else "修正"
+            states.append((await executor.run_iteration("system", prompt)).state)
+        return states
+
+    return asyncio.run(main()), models
+
+
+def test_executor_outcomes_feed_the_cascade(monkeypatch, cascade):
+    states, models = _run(monkeypatch, [BAD, GOOD])
+    assert states == [TaskState.CODE_EXECUTION_ERROR, TaskState.CODE_EXECUTION_SUCCESS]
+    assert models == ["mini", "large"]
+    assert cascade.stats()["mini"]["successes"] == 0
+    assert cascade.stats()["large"]["successes"] == 1
+
+    # A second failing task pushes the cheap tier over min_samples
+    _run(monkeypatch, [BAD, GOOD])
+    _, models = _run(monkeypatch, [GOOD])
+    assert models == ["large"]
+
+
+def test_cached_results_are_not_counted(monkeypatch, cascade):
+    _run(monkeypatch, [BAD], cached=True)
+    assert cascade.stats()["mini"]["attempts"] == 0
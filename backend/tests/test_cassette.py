@@ -0,0 +1,37 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from backend.app.image2excel.engine.cassette import CassetteMissError, CassetteTransport
+from backend.app.image2excel.engine.endpoints import CircuitBreaker, EndpointPool
+from backend.app.image2excel.engine.ratelimit import with_retries
+
+
+def test_unrecorded_request_fails_once_without_tripping_the_breaker(tmp_path):
+    async def main():
+        pool = EndpointPool([{"name": "a", "base_url": "http://127.0.0.1:9/v1", "api_key": "k"}])
+        endpoint = pool.endpoints[0]
+        endpoint.breaker = CircuitBreaker(failure_threshold=1)
+        transport = CassetteTransport(httpx.AsyncHTTPTransport(), str(tmp_path), "replay")
+        endpoint.client = AsyncOpenAI(
+            api_key="k",
+            base_url=endpoint.base_url,
+            http_client=httpx.AsyncClient(transport=transport),
+            max_retries=0,
+        )
+        calls = []
+
+        async def call():
+            calls.append(1)
+            async with pool.attempt() as picked:
+                return await picked.client.chat.completions.create(
+                    model="m", messages=[{"role": "user", "content": "hi"}]
+                )
+
+        with pytest.raises(CassetteMissError, match="No recorded response"):
+            await with_retries(call, max_retries=3, base_delay=0, max_delay=0)
+        return len(calls), endpoint.breaker.state, endpoint.failures
+
+    assert asyncio.run(main()) == (1, CircuitBreaker.CLOSED, 0)
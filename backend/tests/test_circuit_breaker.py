@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+import openai
+import pytest
+
+from backend.app.image2excel.engine.endpoints import CircuitBreaker, EndpointPool
+
+
+def _opened(reset_timeout: float = 0.0) -> CircuitBreaker:
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.available()
+    assert not breaker.allow()
+
+
+def test_half_open_admits_a_single_trial():
+    breaker = _opened()
+    assert breaker.available()
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.trial is not None
+    assert not breaker.available()
+    assert not breaker.allow()
+
+
+def test_trial_verdict_closes_or_reopens():
+    breaker = _opened()
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.trial is None
+
+    breaker = _opened()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_only_the_trial_holder_releases_it():
+    breaker = _opened()
+    breaker.allow()
+    trial = breaker.trial
+    # A request that was not the trial (picked while closed) gives nothing back
+    breaker.release_trial(None)
+    assert not breaker.allow()
+    breaker.release_trial(trial)
+    assert breaker.allow()
+    # A stale trial number does not free the new trial
+    breaker.release_trial(trial)
+    assert not breaker.allow()
+
+
+def _pool() -> EndpointPool:
+    pool = EndpointPool([{"name": "a", "base_url": "http://127.0.0.1:9/v1", "api_key": "k"}])
+    endpoint = pool.endpoints[0]
+    endpoint.breaker = _opened()
+    return pool
+
+
+def test_attempt_gives_the_trial_a_verdict():
+    async def main():
+        pool = _pool()
+        breaker = pool.endpoints[0].breaker
+        with pytest.raises(openai.APIConnectionError):
+            async with pool.attempt():
+                raise openai.APIConnectionError(request=httpx.Request("POST", "http://x"))
+        reopened = breaker.state
+
+        # reset_timeout is 0, so the next request is the new trial
+        async with pool.attempt():
+            pass
+        return reopened, breaker.state
+
+    assert asyncio.run(main()) == (CircuitBreaker.OPEN, CircuitBreaker.CLOSED)
+
+
+def test_cancelled_attempt_releases_its_trial():
+    async def main():
+        pool = _pool()
+
+        async def request():
+            async with pool.attempt():
+                await asyncio.sleep(1)
+
+        task = asyncio.ensure_future(request())
+        await asyncio.sleep(0)
+        held = pool.endpoints[0].breaker.available()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return held, pool.endpoints[0].breaker.available()
+
+    assert asyncio.run(main()) == (False, True)
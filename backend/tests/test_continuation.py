@@ -0,0 +1,105 @@
+import asyncio
+
+import httpx
+import pytest
+from openai import AsyncOpenAI
+
+from backend.app.image2excel.engine import request
+from backend.app.image2excel.engine.endpoints import EndpointPool
+from backend.app.image2excel.engine.mock_server import MockSettings, create_app, synthetic_table, table_code
+from backend.app.image2excel.engine.parser import extract_code, stitch_continuation
+from backend.app.image2excel.engine.prompt import (
+    CONTINUATION_PROMPT_PREFIX,
+    OUTPUT_MODE_CODE,
+    OUTPUT_MODE_JSON,
+    get_continuation_prompt,
+)
+from backend.app.image2excel.engine.sizing import (
+    MIN_OUTPUT_TOKENS,
+    estimate_output_tokens,
+    image_category,
+    max_tokens_for_image,
+)
+
+FULL = "```python\nimport pandas as pd\ndata = {'a': [1, 2, 3, 4]}\ndf = pd.DataFrame(data)\n```"
+
+
+def test_plain_continuation_is_appended():
+    cut = FULL.index("[1, 2") + 5
+    assert stitch_continuation(FULL[:cut], FULL[cut:]) == FULL
+
+
+def test_repeated_overlap_is_dropped():
+    cut = FULL.index("df =")
+    # The model repeats the last twenty characters before going on
+    assert stitch_continuation(FULL[:cut], FULL[cut - 20 :]) == FULL
+
+
+def test_restarted_line_replaces_the_partial_one():
+    cut = FULL.index("3, 4]")
+    restart = FULL[FULL.index("data =") :]
+    assert stitch_continuation(FULL[:cut], "\n" + restart) == FULL
+
+
+def test_reopened_fence_is_removed():
+    cut = FULL.index("df =")
+    assert stitch_continuation(FULL[:cut], "```python\n" + FULL[cut:]) == FULL
+
+
+def test_a_closed_block_keeps_a_new_fence():
+    # Outside an open block a fence is real content
+    assert stitch_continuation("done\n", "```python\nx = 1\n```").endswith("```python\nx = 1\n```")
+
+
+def test_continuation_prompts_share_their_prefix():
+    # The mock server recognises continuations by this prefix
+    assert all(get_continuation_prompt(rows).startswith(CONTINUATION_PROMPT_PREFIX) for rows in (0, 7, 120))
+
+
+def test_sizing_scales_with_the_image_and_stays_in_bounds():
+    small = max_tokens_for_image(200, 100, OUTPUT_MODE_CODE, cap=16000)
+    large = max_tokens_for_image(1600, 2400, OUTPUT_MODE_CODE, cap=16000)
+    assert small == MIN_OUTPUT_TOKENS
+    # 100 rows x 16 columns x 6 tokens + overhead, with 1.5x headroom
+    assert large == int((300 + 100 * 16 * 6) * 1.5)
+    assert max_tokens_for_image(4000, 9000, OUTPUT_MODE_CODE, cap=16000) == 16000
+    assert estimate_output_tokens(1600, 2400, OUTPUT_MODE_JSON) < estimate_output_tokens(1600, 2400)
+
+
+def test_image_category():
+    assert image_category(600, 400) == "small"
+    assert image_category(500, 2000) == "medium-tall"
+    assert image_category(3000, 800) == "large-wide"
+
+
+@pytest.fixture
+def mock_pool(monkeypatch):
+    table = synthetic_table(rows=12, columns=4, seed=3)
+    app = create_app([table], MockSettings())
+    pool = EndpointPool([{"name": "mock", "base_url": "http://mock/v1", "api_key": "k"}])
+    pool.endpoints[0].client = AsyncOpenAI(
+        api_key="k",
+        base_url="http://mock/v1",
+        http_client=httpx.AsyncClient(transport=httpx.ASGITransport(app=app)),
+        max_retries=0,
+    )
+    monkeypatch.setattr(request, "endpoint_pool", pool)
+    monkeypatch.setenv("ENGINE_HEDGE_ENABLED", "false")
+    monkeypatch.setenv("ENGINE_MAX_CONTINUATIONS", "20")
+    return table
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_truncated_output_is_continued_end_to_end(mock_pool, stream):
+    image_prompt = [
+        {"type": "text", "text": "convert"},
+        {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA", "detail": "low"}},
+    ]
+    result = asyncio.run(
+        request._request_completion(
+            None, None, None, stream, image_prompt=image_prompt, max_tokens=60
+        )
+    )
+    assert result["continuations"] > 1
+    assert result["finish_reason"] == "stop"
+    assert result["generated_code"] == extract_code(table_code(mock_pool))
@@ -0,0 +1,76 @@
+from backend.app.image2excel.TaskExecutor import IterationResult, TaskExecutor
+from backend.app.image2excel.engine.conversation import Conversation, trim_error
+from backend.app.image2excel.engine.messages import build_messages
+from backend.app.image2excel.engine.prompt import OUTPUT_MODE_CODE, OUTPUT_MODE_JSON
+from backend.app.image2excel.engine.ratelimit import estimate_tokens
+
+IMAGE = [
+    {"type": "text", "text": "请转换这张图片"},
+    {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA", "detail": "low"}},
+]
+
+
+def _conversation(turns: int, budget: int, mode: str = OUTPUT_MODE_CODE) -> Conversation:
+    conversation = Conversation(budget, mode)
+    for i in range(turns):
+        conversation.add_turn(f"df = {i}" + " " * 200, f"修正 {i}")
+    return conversation
+
+
+def _turn_tokens(conversation: Conversation) -> int:
+    return estimate_tokens(conversation._turn_messages(conversation.turns[0]))
+
+
+def test_oldest_turns_are_dropped_first():
+    conversation = _conversation(5, budget=0)
+    conversation.token_budget = 2 * _turn_tokens(conversation)
+    history = conversation.messages()
+    assert [m["content"] for m in history if m["role"] == "user"] == ["修正 3", "修正 4"]
+    assert history[0]["role"] == "assistant" and history[-1]["content"] == "修正 4"
+
+
+def test_latest_turn_is_kept_over_budget():
+    history = _conversation(3, budget=1).messages()
+    assert [m["content"] for m in history] == ["```python\n" + "df = 2" + " " * 200 + "\n```", "修正 2"]
+
+
+def test_json_output_is_not_fenced():
+    history = _conversation(1, budget=10_000, mode=OUTPUT_MODE_JSON).messages()
+    assert history[0]["content"].startswith("df = 0")
+
+
+def test_system_prompt_and_image_survive_truncation():
+    conversation = _conversation(6, budget=0)
+    conversation.token_budget = 2 * _turn_tokens(conversation)
+    messages = build_messages("system", "examples", IMAGE, history=conversation.messages())
+    assert messages[:3] == [
+        {"role": "developer", "content": "system"},
+        {"role": "developer", "content": "examples"},
+        {"role": "user", "content": IMAGE},
+    ]
+    assert len(messages) == 3 + 4
+
+
+def test_short_errors_are_untouched():
+    assert trim_error("boom", 100) == "boom"
+
+
+def test_long_errors_keep_the_summary_and_the_end():
+    lines = [f'  File "x.py", line {i}, in f' for i in range(200)]
+    error = "代码执行失败: division by zero\nTraceback (most recent call last):\n"
+    error += "\n".join(lines) + "\nZeroDivisionError: division by zero"
+    trimmed = trim_error(error, 400)
+    assert len(trimmed) <= 400 + len("\n...\n")
+    assert trimmed.startswith("代码执行失败: division by zero\n...\n")
+    assert trimmed.endswith("ZeroDivisionError: division by zero")
+    # The tail starts on a whole line
+    assert trimmed.split("\n...\n")[1].startswith("  File")
+
+
+def test_correction_prompt_trims_the_error(monkeypatch):
+    monkeypatch.setenv("ENGINE_ERROR_MAX_CHARS", "300")
+    executor = TaskExecutor("t1", "alice", lambda username, message: None)
+    error = "代码执行失败: boom\n" + "\n".join(f"line {i}" for i in range(500)) + "\nValueError: boom"
+    prompt = executor._generate_correction_prompt(IterationResult(generated_code="df = 1", error_message=error))
+    assert "line 10\n" not in prompt
+    assert "代码执行失败: boom\n...\n" in prompt and "ValueError: boom" in prompt
@@ -0,0 +1,65 @@
+import random
+
+import pandas as pd
+
+from backend.app.image2excel.engine.duplicates import (
+    BKTree,
+    DuplicateIndex,
+    ImageHashes,
+    hamming,
+)
+
+
+def test_bk_tree_search_matches_a_linear_scan():
+    rng = random.Random(7)
+    keys = [rng.getrandbits(64) for _ in range(300)]
+    # Near copies so some searches have hits
+    keys += [key ^ (1 << rng.randrange(64)) for key in keys[:50]]
+    tree = BKTree()
+    for i, key in enumerate(keys):
+        tree.add(key, i)
+    assert tree.size == len(keys)
+
+    for query in keys[:60] + [rng.getrandbits(64) for _ in range(20)]:
+        for radius in (0, 3, 12):
+            expected = sorted(
+                (hamming(query, key), i) for i, key in enumerate(keys) if hamming(query, key) <= radius
+            )
+            assert sorted(tree.search(query, radius)) == expected
+
+
+def test_bk_tree_keeps_duplicate_keys():
+    tree = BKTree()
+    tree.add(0b1010, "a")
+    tree.add(0b1010, "b")
+    assert sorted(tree.search(0b1010, 0)) == [(0, "a"), (0, "b")]
+    assert tree.search(0b0101, 3) == []
+
+
+def _table(value: int) -> pd.DataFrame:
+    return pd.DataFrame({"v": [value]})
+
+
+def test_index_finds_closest_match_per_user():
+    index = DuplicateIndex(max_distance=4, max_entries=10)
+    index.record_result("alice", "t1", ImageHashes(phash=0b1111, dhash=0), _table(1))
+    index.record_result("alice", "t2", ImageHashes(phash=0b0111, dhash=0), _table(2))
+
+    match = index.find("alice", ImageHashes(phash=0b0011, dhash=0))
+    assert (match.task_id, match.distance) == ("t2", 1)
+    assert index.find("bob", ImageHashes(phash=0b0011, dhash=0)) is None
+    # A far dHash vetoes a pHash match
+    assert index.find("alice", ImageHashes(phash=0b0111, dhash=(1 << 9) - 1)) is None
+
+
+def test_evicted_and_forgotten_tasks_are_not_matched():
+    index = DuplicateIndex(max_distance=2, max_entries=2)
+    # Eight bits apart from each other
+    phashes = [0, 0xFF, 0xFF00]
+    for i, phash in enumerate(phashes):
+        index.record_result("alice", f"t{i}", ImageHashes(phash=phash, dhash=0), _table(i))
+    # t0 was evicted
+    assert index.find("alice", ImageHashes(phash=0, dhash=0)) is None
+    index.forget_task("alice", "t1")
+    assert index.find("alice", ImageHashes(phash=0xFF, dhash=0)) is None
+    assert index.find("alice", ImageHashes(phash=0xFF00, dhash=0)).task_id == "t2"
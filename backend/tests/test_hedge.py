@@ -0,0 +1,75 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel.engine.hedge import HedgeClock, HedgePolicy
+
+
+def _policy(delay: float) -> HedgePolicy:
+    policy = HedgePolicy(percentile=95, min_samples=1, min_delay=delay)
+    policy.histogram("m").record(delay)
+    return policy
+
+
+async def _call(clock: HedgeClock, seconds: float, result: str, queued: float = 0) -> str:
+    # `queued` stands in for the rate limiter admitting the request
+    await asyncio.sleep(queued)
+    clock.start()
+    await asyncio.sleep(seconds)
+    clock.respond()
+    return result
+
+
+def test_slow_primary_is_hedged():
+    async def main():
+        policy = _policy(0.02)
+        result = await policy.run(
+            "m",
+            lambda clock: _call(clock, 0.2, "primary"),
+            lambda clock: _call(clock, 0.01, "backup"),
+        )
+        return result, policy.hedges_sent, policy.hedges_won
+
+    assert asyncio.run(main()) == ("backup", 1, 1)
+
+
+def test_limiter_wait_does_not_trigger_a_hedge():
+    async def main():
+        policy = _policy(0.03)
+        result = await policy.run(
+            "m",
+            lambda clock: _call(clock, 0.01, "primary", queued=0.1),
+            lambda clock: _call(clock, 0.01, "backup"),
+        )
+        return result, policy.hedges_sent, policy.histogram("m").percentile(100)
+
+    result, hedges, slowest = asyncio.run(main())
+    assert (result, hedges) == ("primary", 0)
+    # Only the HTTP call is recorded, not the time queued behind the limiter
+    assert slowest < 0.05
+
+
+def test_cancelling_the_caller_cancels_the_primary():
+    async def main():
+        policy = _policy(0.5)
+        started = asyncio.Event()
+        primary_cancelled = asyncio.Event()
+
+        async def primary(clock):
+            clock.start()
+            started.set()
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                primary_cancelled.set()
+                raise
+
+        caller = asyncio.ensure_future(policy.run("m", primary, primary))
+        await started.wait()
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+        return primary_cancelled.is_set()
+
+    assert asyncio.run(main())
@@ -0,0 +1,113 @@
+import asyncio
+import base64
+import io
+import os
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from backend.app.image2excel.ImageUtils import BASE64_CHUNK_BYTES, ImageUtils
+
+
+def test_from_file_matches_b64encode(tmp_path):
+    path = tmp_path / "image.bin"
+    data = os.urandom(2 * BASE64_CHUNK_BYTES + 5)
+    path.write_bytes(data)
+    assert asyncio.run(ImageUtils.from_file(path)) == base64.b64encode(data).decode()
+
+
+def test_data_url(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"\x89PNG....")
+    expected = "data:image/png;base64," + base64.b64encode(b"\x89PNG....").decode()
+    assert asyncio.run(ImageUtils.data_url(path)) == expected
+
+
+def test_from_file_peak_memory(tmp_path):
+    path = tmp_path / "large.bin"
+    path.write_bytes(os.urandom(16 * 1024 * 1024))
+    tracemalloc.start()
+    try:
+        encoded = ImageUtils._from_file_sync(path, "data:image/png;base64,")
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    size = os.path.getsize(path)
+    assert len(encoded) > size
+    # The encoding alone is 4/3 of the file
+    assert peak < 1.5 * size
+
+
+def _prepare(path, **kwargs):
+    return asyncio.run(ImageUtils.prepare(path, **kwargs))
+
+
+def _decode(prepared):
+    return Image.open(io.BytesIO(base64.b64decode(prepared.data)))
+
+
+def _noise(width: int, height: int) -> Image.Image:
+    # Photo-like content, so neither resizing nor re-encoding is a no-op
+    rng = np.random.default_rng(0)
+    return Image.fromarray(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+
+
+def test_alpha_is_flattened_onto_white(tmp_path):
+    image = Image.new("RGBA", (40, 20), (0, 0, 0, 0))
+    image.paste((200, 0, 0, 255), (0, 0, 20, 20))
+    path = tmp_path / "alpha.png"
+    image.save(path)
+    prepared = _prepare(path, image_format="png")
+    assert prepared.steps[0] == "flatten_alpha"
+    decoded = _decode(prepared)
+    assert decoded.mode == "RGB"
+    assert decoded.getpixel((5, 5)) == (200, 0, 0)
+    assert decoded.getpixel((35, 5)) == (255, 255, 255)
+
+
+def test_long_edge_is_limited(tmp_path):
+    path = tmp_path / "wide.png"
+    _noise(1200, 300).save(path)
+    prepared = _prepare(path, max_edge=600, image_format="png")
+    assert "resize" in prepared.steps
+    assert (prepared.width, prepared.height) == (600, 150)
+    assert _decode(prepared).size == (600, 150)
+    assert (prepared.original_width, prepared.original_height) == (1200, 300)
+
+
+def test_large_jpeg_is_draft_decoded(tmp_path):
+    path = tmp_path / "photo.jpg"
+    exif = Image.Exif()
+    exif[0x010F] = "camera"
+    _noise(2000, 1000).save(path, "JPEG", quality=95, exif=exif)
+    prepared = _prepare(path, max_edge=400, image_format="jpeg", quality=60)
+    assert prepared.steps[:2] == ["draft", "resize"]
+    assert prepared.steps[-1] == "encode_jpeg"
+    decoded = _decode(prepared)
+    assert decoded.size == (400, 200)
+    # Metadata is not carried over
+    assert "exif" not in decoded.info
+
+
+def test_report_describes_the_settings_used(tmp_path):
+    path = tmp_path / "photo.jpg"
+    _noise(1000, 500).save(path, "JPEG", quality=95)
+    prepared = _prepare(path, max_edge=500, image_format="jpeg", quality=50)
+    report = prepared.report()
+    assert "data" not in report
+    assert report["mime_type"] == "image/jpeg"
+    assert (report["width"], report["height"]) == (500, 250)
+    assert report["original_bytes"] == os.path.getsize(path)
+    assert report["encoded_bytes"] == len(base64.b64decode(prepared.data))
+    assert report["encoded_bytes"] < report["original_bytes"]
+    assert report["steps"] == prepared.steps and report["crop"] is None
+
+
+def test_compact_image_is_sent_unchanged(tmp_path):
+    path = tmp_path / "small.jpg"
+    _noise(64, 64).save(path, "JPEG", quality=30)
+    prepared = _prepare(path, max_edge=2048)
+    assert prepared.steps == ["original"]
+    assert prepared.mime_type == "image/jpeg"
+    assert base64.b64decode(prepared.data) == path.read_bytes()
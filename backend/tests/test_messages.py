@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+from backend.app.image2excel.TaskExecutor import IterationResult, TaskExecutor
+from backend.app.image2excel.engine.messages import build_messages, request_prompt
+from backend.app.image2excel.engine.prompt import OUTPUT_MODE_CODE, OUTPUT_MODE_JSON
+
+IMAGE = [
+    {"type": "text", "text": "请转换这张图片"},
+    {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA", "detail": "high"}},
+]
+
+
+def _bodies(output_mode: str, corrections):
+    """Request messages of each iteration of one task, as a batch job would send them"""
+    executor = TaskExecutor(
+        "t1", "alice", lambda username, message: None, output_mode=output_mode, image_prompt=IMAGE
+    )
+    bodies = []
+    for iteration, correction in enumerate([None, *corrections], start=1):
+        executor.current_iteration = iteration
+        bodies.append(executor.prepare_batch_request("system", correction)["messages"])
+        executor.iteration_history[iteration] = IterationResult(generated_code=f"df = {iteration}")
+    return bodies
+
+
+@pytest.mark.parametrize("output_mode", [OUTPUT_MODE_CODE, OUTPUT_MODE_JSON])
+def test_each_request_extends_the_previous_one(output_mode):
+    bodies = _bodies(output_mode, ["修正一", "修正二", "修正三"])
+    for earlier, later in zip(bodies, bodies[1:]):
+        assert len(later) == len(earlier) + 2
+        # Byte-identical prefix, so the provider can serve it from its cache
+        assert json.dumps(later[: len(earlier)], ensure_ascii=False) == json.dumps(earlier, ensure_ascii=False)
+
+
+def test_correction_is_always_last():
+    bodies = _bodies(OUTPUT_MODE_CODE, ["修正一", "修正二"])
+    assert [m["role"] for m in bodies[0]] == ["developer", "developer", "user"]
+    assert bodies[0][-1]["content"] == IMAGE
+    for body, correction in zip(bodies[1:], ["修正一", "修正二"]):
+        assert body[-2]["role"] == "assistant"
+        assert body[-1] == {"role": "user", "content": correction}
+        assert sum(m["content"] == correction for m in body) == 1
+
+
+def test_volatile_text_comes_after_the_image_and_history():
+    history = [{"role": "assistant", "content": "df = 1"}, {"role": "user", "content": "修正"}]
+    messages = build_messages("system", None, IMAGE, "补充说明", history)
+    assert [m["content"] for m in messages] == ["system", IMAGE, "df = 1", "修正", "补充说明"]
+
+
+def test_empty_request_is_rejected():
+    with pytest.raises(ValueError):
+        build_messages("system", "examples", None)
+
+
+def test_request_prompt_follows_the_message_order():
+    history = [{"role": "assistant", "content": "df = 1"}]
+    parts = request_prompt(IMAGE, "修正", history)
+    assert parts == IMAGE + [{"type": "text", "text": "df = 1"}, {"type": "text", "text": "修正"}]
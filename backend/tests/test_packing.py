@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel.engine import packing
+from backend.app.image2excel.engine.packing import (
+    ImagePacker,
+    _share_usage,
+    split_packed_response,
+)
+
+
+def _section(number, code):
+    return f"### 图片 {number}\n```python\n{code}\n```\n"
+
+
+def test_split_packed_response_in_order():
+    text = _section(1, "df = 1") + _section(2, "df = 2")
+    assert split_packed_response(text, 2) == ["df = 1", "df = 2"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        _section(1, "df = 1"),  # missing section
+        _section(2, "df = 2") + _section(1, "df = 1"),  # out of order
+        _section(1, "df = 1") + _section(1, "df = 1b"),  # repeated number
+        _section(1, "df = 1") + _section(3, "df = 3"),  # misnumbered
+        _section(1, "df = 1") + "### 图片 2\nno code here\n",
+    ],
+)
+def test_split_packed_response_rejects_mismatched_sections(text):
+    with pytest.raises(ValueError):
+        split_packed_response(text, 2)
+
+
+def test_share_usage_adds_up():
+    usage = {"prompt_tokens": 1001, "completion_tokens": 10, "cached_tokens": 2}
+    shares = _share_usage(usage, 3)
+    for field, value in usage.items():
+        assert sum(share[field] for share in shares) == value
+    assert _share_usage(None, 2) == [None, None]
+
+
+def _image(name):
+    return [{"type": "image_url", "image_url": {"url": f"data:image/png;base64,{name}"}}]
+
+
+def _run_packer(monkeypatch, text, submits):
+    calls = []
+
+    async def fake_send_request(**kwargs):
+        calls.append(kwargs)
+        if kwargs.get("stream") is False:
+            return {"text": text, "usage": {"prompt_tokens": 10}}
+        return {"generated_code": "alone", "usage": None}
+
+    monkeypatch.setattr(packing, "send_request", fake_send_request)
+
+    async def main():
+        packer = ImagePacker(max_images=2, max_wait=0.05)
+        results = await asyncio.gather(
+            *(packer.submit(_image(name), "system", "model", user) for name, user in submits)
+        )
+        return packer, results
+
+    packer, results = asyncio.run(main())
+    return packer, results, calls
+
+
+def test_packer_never_mixes_users(monkeypatch):
+    packer, results, calls = _run_packer(
+        monkeypatch, "", [("a", "alice"), ("b", "bob")]
+    )
+    # Each user's image waited alone and was sent alone
+    assert packer.packs_sent == 0
+    assert [result["generated_code"] for result in results] == ["alone", "alone"]
+    assert all(call.get("stream") is not False for call in calls)
+
+
+def test_packer_splits_matching_response(monkeypatch):
+    text = _section(1, "df = 'a'") + _section(2, "df = 'b'")
+    packer, results, _ = _run_packer(monkeypatch, text, [("a", "alice"), ("b", "alice")])
+    assert packer.packs_sent == 1
+    assert [result["generated_code"] for result in results] == ["df = 'a'", "df = 'b'"]
+    assert sum(result["usage"]["prompt_tokens"] for result in results) == 10
+
+
+def test_packer_retries_every_image_on_mismatch(monkeypatch):
+    text = _section(2, "df = 'b'") + _section(1, "df = 'a'")
+    packer, results, _ = _run_packer(monkeypatch, text, [("a", "alice"), ("b", "alice")])
+    assert packer.packs_rejected == 1
+    assert [result["generated_code"] for result in results] == ["alone", "alone"]
@@ -0,0 +1,141 @@
+import asyncio
+from types import SimpleNamespace as NS
+
+import pytest
+
+from backend.app.image2excel.engine import request
+from backend.app.image2excel.engine.parser import CodeStreamParser, extract_code
+
+CODE = "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2, 3], 'b': ['x', 'y', 'z']})"
+COMPLETION = f"Here is the code:\n```python\n{CODE}\n```\nIt builds the table."
+
+
+def _chunks(text: str, size: int):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, len(COMPLETION)])
+def test_stops_at_closing_fence_however_it_is_split(size):
+    parser = CodeStreamParser()
+    stopped_at = None
+    for i, delta in enumerate(_chunks(COMPLETION, size)):
+        if parser.feed(delta):
+            stopped_at = i
+            break
+    assert parser.closed
+    assert parser.code == CODE
+    # Nothing after the chunk holding the closing fence was needed
+    assert stopped_at == (COMPLETION.rindex("```") + 2) // size
+
+
+def test_language_tag_split_from_its_newline():
+    parser = CodeStreamParser()
+    for delta in ["```py", "thon", "\nx = 1\n", "``", "`"]:
+        parser.feed(delta)
+    assert parser.closed and parser.code == "x = 1"
+
+
+def test_backticks_inside_the_code_do_not_close_early():
+    parser = CodeStreamParser()
+    parser.feed("```python\ns = '``'\n")
+    assert not parser.closed
+    parser.feed("```")
+    assert parser.code == "s = '``'"
+
+
+def test_rows_seen_counts_list_elements():
+    parser = CodeStreamParser()
+    seen = []
+    for delta in _chunks("```python\nrows = [[1, 'a,b'], [2, 'c'], # [9, 9],\n [3, 'd']]\n```", 4):
+        parser.feed(delta)
+        seen.append(parser.rows_seen)
+    # Commas inside strings and comments are not elements
+    assert seen[-1] == 3
+    assert seen == sorted(seen)
+
+
+def test_unfenced_json_counts_rows():
+    parser = CodeStreamParser(fenced=False)
+    for delta in _chunks('{"columns": ["a"], "rows": [[1], [2], [3]]}', 5):
+        parser.feed(delta)
+    assert not parser.closed
+    assert parser.rows_seen == 3
+
+
+def test_extract_code_without_fence():
+    assert extract_code("  df = 1  ") == "df = 1"
+    assert extract_code("```\ndf = 1\n") == "df = 1"
+    assert extract_code(None) == ""
+
+
+class _Stream:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def _delta(content, finish_reason=None):
+    return NS(id="c1", usage=None, choices=[NS(delta=NS(content=content), finish_reason=finish_reason)])
+
+
+USAGE = NS(prompt_tokens=100, completion_tokens=20, prompt_tokens_details=None)
+
+
+def _run_stream(monkeypatch, chunks):
+    stream = _Stream(chunks)
+
+    async def fake_create(endpoint, **kwargs):
+        assert kwargs["stream"] is True
+        return stream
+
+    monkeypatch.setattr(request, "_create_completion", fake_create)
+    progress = []
+    result = asyncio.run(
+        request._stream_completion(None, {"model": "m", "messages": []}, progress.append)
+    )
+    return result, stream, progress
+
+
+def test_stream_waits_for_usage_after_the_fence(monkeypatch):
+    chunks = [_delta(c) for c in _chunks(COMPLETION, 6)]
+    chunks.append(NS(id="c1", usage=USAGE, choices=[]))
+    result, stream, progress = _run_stream(monkeypatch, chunks)
+    assert result["generated_code"] == CODE
+    assert result["finish_reason"] == "stop"
+    assert result["usage"]["completion_tokens"] == 20
+    assert stream.read == len(chunks) and stream.closed
+    assert progress[-1]["rows"] == 3
+
+
+def test_stream_gives_up_on_usage_after_trailing_chunks(monkeypatch):
+    code = COMPLETION[: COMPLETION.rindex("```") + 3]
+    chunks = [_delta(c) for c in _chunks(code, 6)]
+    chunks += [_delta(" more talk") for _ in range(request.USAGE_TRAILING_CHUNKS + 5)]
+    chunks.append(NS(id="c1", usage=USAGE, choices=[]))
+    result, stream, _ = _run_stream(monkeypatch, chunks)
+    assert result["generated_code"] == CODE
+    assert result["usage"] is None
+    # The fenced chunks plus USAGE_TRAILING_CHUNKS + 1 before stopping
+    assert stream.read == len(_chunks(code, 6)) + request.USAGE_TRAILING_CHUNKS + 1
+    assert stream.closed
+
+
+def test_truncated_stream_keeps_finish_reason(monkeypatch):
+    cut = COMPLETION[: COMPLETION.index("'b'")]
+    chunks = [_delta(c) for c in _chunks(cut, 6)]
+    chunks[-1] = _delta(_chunks(cut, 6)[-1], finish_reason="length")
+    result, _, _ = _run_stream(monkeypatch, chunks)
+    assert result["finish_reason"] == "length"
+    assert result["generated_code"].startswith("import pandas as pd")
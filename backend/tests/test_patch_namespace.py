@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel.TaskExecutor import IterationResult, TaskExecutor, TaskState
+
+BASE = "import pandas as pd\ndf = pd.DataFrame({'a': [1, 2, 3]})"
+
+
+@pytest.fixture
+def executor(monkeypatch):
+    monkeypatch.setenv("ENGINE_PATCH_CORRECTIONS", "true")
+    monkeypatch.setenv("ENGINE_PATCH_MIN_ROWS", "1")
+    return TaskExecutor("t1", "alice", lambda username, message: None)
+
+
+def _execute(executor: TaskExecutor, iteration: int, code: str, patch: bool = False):
+    executor.iteration_history[iteration] = IterationResult(generated_code=code, patch=patch)
+    return asyncio.run(executor.execute_code(iteration)).state
+
+
+def test_patch_applies_to_the_retained_df(executor):
+    assert _execute(executor, 1, BASE) == TaskState.CODE_EXECUTION_SUCCESS
+    assert executor._can_patch()
+    assert _execute(executor, 2, "df['b'] = df['a'] * 2", patch=True) == TaskState.CODE_EXECUTION_SUCCESS
+    assert executor.namespace["df"]["b"].tolist() == [2, 4, 6]
+    # The earlier iteration's result is not modified in place
+    assert list(executor.iteration_history[1].dataframe.columns) == ["a"]
+
+
+def test_failed_patch_keeps_the_base(executor):
+    _execute(executor, 1, BASE)
+    code = "df.loc[0, 'a'] = 99\nraise ValueError('half done')"
+    assert _execute(executor, 2, code, patch=True) == TaskState.CODE_EXECUTION_ERROR
+    assert executor.namespace["df"]["a"].tolist() == [1, 2, 3]
+
+
+def test_failing_code_that_built_a_df_is_still_patchable(executor):
+    assert _execute(executor, 1, BASE + "\nraise ValueError('late')") == TaskState.CODE_EXECUTION_ERROR
+    assert executor.namespace["df"]["a"].tolist() == [1, 2, 3]
+    _execute(executor, 2, "raise ValueError('no df')")
+    assert executor.namespace is None
+
+
+def test_patch_without_a_namespace_falls_back_to_regeneration(executor):
+    _execute(executor, 1, BASE)
+    # e.g. the task was restored from a cached result that no longer holds the namespace
+    executor.namespace = None
+    assert _execute(executor, 2, "df['b'] = 1", patch=True) == TaskState.CODE_EXECUTION_ERROR
+    assert "'df' is not defined" in executor.iteration_history[2].error_message
+    assert executor.namespace is None
+    assert not executor._can_patch()
+    prompt = executor._generate_correction_prompt(executor.iteration_history[2])
+    assert prompt.startswith("根据上次执行的结果")
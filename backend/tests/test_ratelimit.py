@@ -0,0 +1,81 @@
+import asyncio
+import base64
+import io
+import time
+
+import pytest
+from PIL import Image
+
+from backend.app.image2excel.engine.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    estimate_tokens,
+    parse_reset_duration,
+)
+
+
+def _image_part(width: int, height: int, detail: str = "high") -> dict:
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), "white").save(buffer, format="PNG")
+    data = base64.b64encode(buffer.getvalue()).decode("ascii")
+    return {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{data}", "detail": detail}}
+
+
+def test_image_parts_are_billed_by_tiles_not_base64_length():
+    # 1000x3000 fits 2048 as 683x2048: 2x4 tiles
+    assert estimate_tokens(_image_part(1000, 3000)) == 85 + 170 * 8
+    assert estimate_tokens(_image_part(1000, 3000, detail="low")) == 85
+    # A small image is a single tile
+    assert estimate_tokens(_image_part(300, 200)) == 85 + 170
+
+
+def test_unreadable_image_falls_back_to_typical_size():
+    part = {"type": "image_url", "image_url": {"url": "https://example.com/a.png"}}
+    assert estimate_tokens(part) == 765
+
+
+def test_messages_sum_text_and_images():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [{"type": "text", "text": "y" * 40}, _image_part(300, 200)]},
+    ]
+    # 100 + 10 text tokens, one tile, plus a token for each role and type field
+    assert estimate_tokens(messages) == 110 + 255 + 1 + 1 + 1
+
+
+def test_parse_reset_duration():
+    assert parse_reset_duration("6m0s") == 360
+    assert parse_reset_duration("20ms") == pytest.approx(0.02)
+    assert parse_reset_duration("1.5") == 1.5
+    assert parse_reset_duration("soon") is None
+
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(60, per_seconds=60)
+    assert bucket.wait_time(60) == 0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1, abs=0.05)
+    # A request larger than the bucket only waits for a full bucket
+    assert bucket.wait_time(600) == pytest.approx(60, abs=0.05)
+
+
+def test_bucket_follows_provider_headers():
+    bucket = TokenBucket(100, per_seconds=10)
+    bucket.sync(remaining=40, reset_seconds=None)
+    assert bucket.wait_time(50) == pytest.approx(1, abs=0.05)
+    # Full budget back in 8s means 80 tokens are missing
+    bucket.sync(remaining=100, reset_seconds=8)
+    assert bucket.wait_time(100) == pytest.approx(8, abs=0.05)
+
+
+def test_limiter_spaces_requests():
+    async def main():
+        limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=1_000_000)
+        limiter.requests.take(600)
+        started = time.monotonic()
+        await limiter.acquire(10)
+        await limiter.acquire(10)
+        return time.monotonic() - started
+
+    # 10 requests per second once the bucket is empty
+    assert 0.15 <= asyncio.run(main()) < 0.5
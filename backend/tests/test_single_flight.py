@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from backend.app.image2excel.SingleFlight import SingleFlight
+
+
+def test_followers_share_the_leaders_result():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "table"
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(3)))
+        return results, calls, flights.in_flight("key")
+
+    results, calls, in_flight = asyncio.run(main())
+    assert len(calls) == 1
+    assert sorted(results) == [("table", False), ("table", True), ("table", True)]
+    assert not in_flight
+
+
+def test_errors_reach_followers():
+    async def main():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        return await asyncio.gather(
+            flights.do("key", work), flights.do("key", work), return_exceptions=True
+        )
+
+    results = asyncio.run(main())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_cancelled_leader_hands_over_to_a_follower():
+    async def main():
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return len(calls)
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, calls
+
+    (result, shared), calls = asyncio.run(main())
+    # The follower ran the work itself as the new leader
+    assert (result, shared) == (2, False)
+    assert len(calls) == 2
+
+
+def test_cancelled_follower_leaves_the_leader_running():
+    async def main():
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.03)
+            return "table"
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        return await leader, follower.cancelled()
+
+    assert asyncio.run(main()) == (("table", False), True)
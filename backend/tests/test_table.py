@@ -0,0 +1,80 @@
+import json
+
+import pandas as pd
+import pytest
+
+from backend.app.image2excel.engine.table import dataframe_from_payload, parse_table_payload
+
+COLUMNS = [
+    {"name": "名称", "dtype": "string"},
+    {"name": "数量", "dtype": "integer"},
+    {"name": "金额", "dtype": "number"},
+    {"name": "日期", "dtype": "date"},
+    {"name": "完成", "dtype": "boolean"},
+]
+
+
+def test_dtypes_are_coerced_with_nulls():
+    df = dataframe_from_payload(
+        {
+            "columns": COLUMNS,
+            "rows": [
+                ["a", "1,200", "3.5", "2024-01-02", "是"],
+                ["b", None, 4, None, False],
+                ["c", 7, "n/a", "not a date", None],
+            ],
+        }
+    )
+    assert list(df.columns) == ["名称", "数量", "金额", "日期", "完成"]
+    assert str(df["名称"].dtype) == "string"
+    assert str(df["数量"].dtype) == "Int64"
+    assert df["数量"].tolist()[0] == 1200 and pd.isna(df["数量"][1])
+    assert df["金额"].tolist()[:2] == [3.5, 4.0] and pd.isna(df["金额"][2])
+    assert pd.api.types.is_datetime64_any_dtype(df["日期"])
+    assert df["日期"][0] == pd.Timestamp("2024-01-02") and df["日期"][1:].isna().all()
+    assert str(df["完成"].dtype) == "boolean"
+    assert df["完成"].tolist()[:2] == [True, False]
+    assert pd.isna(df["完成"][2])
+
+
+def test_fractional_integers_stay_numbers():
+    df = dataframe_from_payload({"columns": [{"name": "n", "dtype": "integer"}], "rows": [[1], ["2.5"]]})
+    assert df["n"].tolist() == [1.0, 2.5]
+
+
+def test_ragged_rows_are_padded_or_cut():
+    df = dataframe_from_payload(
+        {"columns": COLUMNS[:3], "rows": [["a"], ["b", 2, 3.0, "extra"], "c"]}
+    )
+    assert df.shape == (3, 3)
+    assert df["名称"].tolist() == ["a", "b", "c"]
+    assert pd.isna(df["数量"][0]) and df["数量"][1] == 2
+
+
+def test_missing_and_duplicate_names():
+    df = dataframe_from_payload({"columns": [{"name": "x"}, {"name": "x"}, {}], "rows": [[1, 2, 3]]})
+    assert list(df.columns) == ["x", "x_1", "Column_3"]
+
+
+def test_json_text_is_accepted():
+    payload = json.dumps({"columns": COLUMNS[:1], "rows": [["a"]]}, ensure_ascii=False)
+    assert dataframe_from_payload(payload)["名称"].tolist() == ["a"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "not json",
+        "[1, 2]",
+        '{"rows": []}',
+        '{"columns": [], "rows": []}',
+        '{"columns": [{"name": "a"}]}',
+        '{"columns": [{"name": "a"}], "rows": {}}',
+        '{"columns": ["a"], "rows": [[1]]}',
+    ],
+)
+def test_malformed_payload_raises_value_error(text):
+    with pytest.raises(ValueError):
+        parse_table_payload(text)
+    with pytest.raises(ValueError):
+        dataframe_from_payload(text)
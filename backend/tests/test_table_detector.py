@@ -0,0 +1,90 @@
+import asyncio
+
+import numpy as np
+from PIL import Image
+
+from backend.app.image2excel.ImageUtils import ImageUtils
+from backend.app.image2excel.TableDetector import PADDING, detect_table_region
+
+
+def _screenshot(rules: int = 9, extra=()) -> np.ndarray:
+    # An 800x600 window with a table of 1px rules every 30px at x 200..600
+    pixels = np.full((600, 800), 255, dtype=np.uint8)
+    bottom = 150 + 30 * (rules - 1)
+    for top in range(150, bottom + 1, 30):
+        pixels[top, 200:600] = 0
+    pixels[150 : bottom + 1, 200] = 0
+    pixels[150 : bottom + 1, 599] = 0
+    for row, start, end in extra:
+        pixels[row, start:end] = 0
+    return pixels
+
+
+def _text(pixels: np.ndarray, top: int, left: int, right: int) -> None:
+    # A line of glyph-sized blocks, too short to be taken for rules
+    for x in range(left, right, 14):
+        pixels[top : top + 12, x : x + 8] = 0
+
+
+def test_ruled_table_is_found():
+    region = detect_table_region(Image.fromarray(_screenshot()))
+    assert region.box == (200 - PADDING, 149 - PADDING, 600 + PADDING, 390 + PADDING)
+    assert region.lines == 9 and region.confidence == 1.0
+
+
+def test_header_and_footer_text_widen_the_box():
+    pixels = _screenshot()
+    _text(pixels, 125, 220, 580)
+    _text(pixels, 400, 220, 400)
+    left, top, right, bottom = detect_table_region(Image.fromarray(pixels)).box
+    assert top < 125 and bottom > 412
+    assert (left, right) == (200 - PADDING, 600 + PADDING)
+
+
+def test_large_images_are_analysed_downscaled():
+    image = Image.fromarray(_screenshot()).resize((4000, 3000), Image.NEAREST)
+    left, top, right, bottom = detect_table_region(image).box
+    # Back in original pixels, within the analysis resolution
+    assert abs(left - 1000) <= 10 and abs(right - 3000) <= 10
+    assert abs(top - 750) <= 10 and abs(bottom - 1955) <= 10
+
+
+def test_too_few_rules_give_no_region():
+    assert detect_table_region(Image.fromarray(_screenshot(rules=2))) is None
+    assert detect_table_region(Image.new("RGB", (300, 200), "white")) is None
+
+
+def test_unaligned_rules_lower_the_confidence():
+    stray = [(40, 20, 300), (60, 400, 780), (520, 100, 350)]
+    region = detect_table_region(Image.fromarray(_screenshot(rules=3, extra=stray)))
+    assert region.lines == 3
+    assert region.confidence < 0.5
+
+
+def _prepare(tmp_path, pixels: np.ndarray, min_crop_confidence: float = 0.5):
+    path = tmp_path / "screenshot.png"
+    Image.fromarray(pixels).save(path)
+    return asyncio.run(
+        ImageUtils.prepare(path, max_edge=0, crop=True, min_crop_confidence=min_crop_confidence)
+    )
+
+
+def test_confident_region_is_cropped(tmp_path):
+    prepared = _prepare(tmp_path, _screenshot())
+    assert "crop" in prepared.steps
+    assert prepared.crop == (196, 145, 604, 394)
+    assert (prepared.width, prepared.height) == (408, 249)
+
+
+def test_low_confidence_falls_back_to_the_full_image(tmp_path):
+    stray = [(40, 20, 300), (60, 400, 780), (520, 100, 350)]
+    prepared = _prepare(tmp_path, _screenshot(rules=3, extra=stray))
+    assert "crop" not in prepared.steps
+    assert prepared.crop is None
+    assert prepared.crop_confidence < 0.5
+    assert (prepared.width, prepared.height) == (800, 600)
+
+
+def test_crop_threshold_is_configurable(tmp_path):
+    prepared = _prepare(tmp_path, _screenshot(), min_crop_confidence=1.01)
+    assert prepared.crop is None and (prepared.width, prepared.height) == (800, 600)
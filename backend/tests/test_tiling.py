@@ -0,0 +1,48 @@
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from backend.app.image2excel.TableDetector import find_bands
+from backend.app.image2excel.engine.tiling import merge_band_frames
+
+
+def test_overlap_rows_are_dropped_once():
+    first = pd.DataFrame({"id": [1, 2, 3, 4], "name": ["a", "b", "c", "d"]})
+    second = pd.DataFrame([[3, "c"], [4, "d"], [5, "e"]], columns=["0", "1"])
+    merged = merge_band_frames([first, second])
+    assert list(merged.columns) == ["id", "name"]
+    assert merged["id"].tolist() == [1, 2, 3, 4, 5]
+
+
+def test_numbers_match_across_types():
+    # A blank elsewhere in the column turns 3 into 3.0; a string band keeps "3"
+    first = pd.DataFrame({"id": [1.0, 2.0, 3.0, None], "v": ["x", "y", "z", "w"]})
+    second = pd.DataFrame({"id": ["3", "nan", "5"], "v": [" z", "w", "q"]})
+    merged = merge_band_frames([first, second])
+    assert merged["v"].str.strip().tolist() == ["x", "y", "z", "w", "q"]
+
+
+def test_repeated_rows_inside_a_band_are_kept():
+    first = pd.DataFrame({"v": [0, 0, 1]})
+    second = pd.DataFrame({"v": [0, 0, 2]})
+    merged = merge_band_frames([first, second])
+    assert merged["v"].tolist() == [0, 0, 1, 0, 0, 2]
+
+
+def _striped(height: int) -> Image.Image:
+    # Dark text rows of 20px separated by 10px white gaps
+    pixels = np.full((height, 200), 255, dtype=np.uint8)
+    for top in range(0, height, 30):
+        pixels[top : top + 20, 20:180] = 0
+    return Image.fromarray(pixels)
+
+
+def test_bands_are_no_taller_than_the_band_height():
+    bands = find_bands(_striped(1100), band_height=500, overlap=0, max_bands=8)
+    assert len(bands) == 3
+    assert bands[0][0] == 0 and bands[-1][1] == 1100
+    assert all(bottom - top <= 500 + 30 for top, bottom in bands)
+
+
+def test_short_image_is_one_band():
+    assert find_bands(_striped(500), band_height=500, overlap=50, max_bands=8) == [(0, 500)]